@@ -0,0 +1,148 @@
+import base64
+import hashlib
+import json
+import os
+import re
+import time
+from pathlib import Path
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from pathmgr import PathManager
+from pconfig import ProctorConfig
+from ploggerfactory import ProctorLoggerFactory
+
+
+class ApiCache:
+    """Persistent cache of GitLab API GET responses, kept in Proctor's data directory so that, e.g., running
+    projects, clone and grade on the same roster fetches each user and project once.
+
+    Entries are keyed by the request URL, including its query parameters, and a hash of the API token, so that
+    different users never see each other's responses. Each kind of endpoint has its own time to live, set by the
+    [GitLabServer] api_cache_*_ttl_secs keys. A fresh entry is served without contacting the server. A stale
+    entry is revalidated with If-None-Match/If-Modified-Since when the server sent an ETag or Last-Modified
+    header, and served again if the server answers 304 Not Modified."""
+
+    # Endpoint kind -> (URL path pattern, configuration key, default time to live in seconds). The first match
+    # wins. Commits default to 0, i.e., always revalidated, so that grading never uses a stale commit date.
+    _ENDPOINTS = [('commits', re.compile(r'/projects/[^/]+/repository/commits'), 'api_cache_commits_ttl_secs', 0),
+                  ('users', re.compile(r'/users\b'), 'api_cache_users_ttl_secs', 24 * 3600),
+                  ('projects', re.compile(r'/projects\b'), 'api_cache_projects_ttl_secs', 3600)]
+    _DEFAULT_TTL_SECS = 0
+    _MAX_AGE_SECS = 7 * 24 * 3600   # entries untouched for this long are removed
+
+    @staticmethod
+    def is_enabled():
+        """Determines if API responses are cached, based on the [GitLabServer] api_cache key.
+        :returns True unless the cache is disabled."""
+        return ProctorConfig.get_config_bool('GitLabServer', 'api_cache', True)
+
+    def __init__(self, private_token, refresh=False):
+        """Initializes the ApiCache.
+        :param private_token: API token sent with the cached requests. Only its hash is kept.
+        :param refresh: True to ignore cached entries. Responses are still stored, which refreshes the cache."""
+        self._logger = ProctorLoggerFactory.getLogger()
+        self._cache_dir = PathManager.get_proctor_data_dir('api-cache')
+        self._token_hash = hashlib.sha256((private_token or '').encode('utf-8')).hexdigest()
+        self._refresh = refresh
+        self._ttls = {kind: ProctorConfig.get_config_int('GitLabServer', key, default)
+                      for kind, _, key, default in ApiCache._ENDPOINTS}
+        self._prune()
+
+    def lookup(self, request):
+        """Finds the cached entry for a GET request. If the entry is stale, conditional headers are added to the
+        request so that the server can answer 304 Not Modified.
+        :param request: PreparedRequest about to be sent
+        :returns Tuple (entry, is_fresh). Entry is None on a miss or when refreshing."""
+        if self._refresh:
+            return (None, False)
+        try:
+            with open(self._get_entry_file_name(request.url), encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return (None, False)
+        if entry.get('url') != request.url:
+            return (None, False)
+
+        if time.time() - entry['stored_at'] < self._get_ttl(request.url):
+            return (entry, True)
+        headers = CaseInsensitiveDict(entry['headers'])
+        if 'ETag' in headers:
+            request.headers['If-None-Match'] = headers['ETag']
+        if 'Last-Modified' in headers:
+            request.headers['If-Modified-Since'] = headers['Last-Modified']
+        return (entry, False)
+
+    def store(self, request, response):
+        """Stores a successful response, unless it can neither be served fresh nor revalidated.
+        :param request: PreparedRequest that was sent
+        :param response: Response received"""
+        if response.status_code != 200:
+            return
+        if self._get_ttl(request.url) <= 0 and 'ETag' not in response.headers and \
+                'Last-Modified' not in response.headers:
+            return
+        self._write_entry(request.url, {'url': request.url, 'stored_at': time.time(),
+                                        'status': response.status_code, 'reason': response.reason,
+                                        'headers': dict(response.headers),
+                                        'body': base64.b64encode(response.content).decode('ascii')})
+
+    def revalidated(self, request, entry):
+        """Marks a stale entry as fresh again after the server answered 304 Not Modified.
+        :param request: PreparedRequest that was sent
+        :param entry: Entry returned by lookup"""
+        entry['stored_at'] = time.time()
+        self._write_entry(request.url, entry)
+
+    def build_response(self, request, entry):
+        """Builds a response from a cached entry, as if it had been received from the server.
+        :param request: PreparedRequest being answered
+        :param entry: Entry returned by lookup
+        :returns Response"""
+        response = Response()
+        response.status_code = entry['status']
+        response.reason = entry.get('reason')
+        response.headers = CaseInsensitiveDict(entry['headers'])
+        response.encoding = get_encoding_from_headers(response.headers)
+        response._content = base64.b64decode(entry['body'])
+        response._content_consumed = True
+        response.url = request.url
+        response.request = request
+        return response
+
+    def _get_ttl(self, url):
+        """Returns the time to live of responses from the endpoint that serves the given URL.
+        :param url: Request URL
+        :returns Time to live in seconds."""
+        for kind, pattern, _, _ in ApiCache._ENDPOINTS:
+            if pattern.search(url):
+                return self._ttls[kind]
+        return ApiCache._DEFAULT_TTL_SECS
+
+    def _get_entry_file_name(self, url):
+        """Returns the name of the file that holds the entry for the given URL.
+        :param url: Request URL
+        :returns Full path name of the entry file."""
+        key = hashlib.sha256(f'{self._token_hash}\0{url}'.encode('utf-8')).hexdigest()
+        return os.sep.join([self._cache_dir, f'{key}.json'])
+
+    def _write_entry(self, url, entry):
+        """Writes an entry.
+        :param url: Request URL
+        :param entry: Entry to write"""
+        try:
+            with PathManager.replacing_file(self._get_entry_file_name(url)) as tmp_file_name:
+                with open(tmp_file_name, mode='wt', encoding='utf-8') as f:
+                    json.dump(entry, f)
+        except OSError as ex:
+            self._logger.debug(f'Cannot write API cache entry: {ex}')
+
+    def _prune(self):
+        """Removes entries that have not been written for a long time."""
+        cutoff = time.time() - ApiCache._MAX_AGE_SECS
+        for entry_file in Path(self._cache_dir).glob('*.json'):
+            try:
+                if entry_file.stat().st_mtime < cutoff:
+                    entry_file.unlink()
+            except OSError:
+                pass
@@ -0,0 +1,154 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+from javahelpers import JavaHelpers
+from pathmgr import PathManager
+from pconfig import ProctorConfig
+from ploggerfactory import ProctorLoggerFactory
+
+
+class BuildCache:
+    """Content-addressed cache of build results. Entries are keyed by the hash of a project's *.java files
+    (source and tests), the classpath and the javac version. Each entry holds the compiled .class files and the
+    recorded error counts, so that an unchanged submission does not need to be rebuilt when it's regraded.
+
+    The cache lives in Proctor's data directory and is capped by the [Proctor] build_cache_max_mb key. Each
+    entry records its size, and the cache keeps a running total, so that stores don't rescan the cache. When the
+    cap is exceeded, the least recently used entries are evicted."""
+
+    DEFAULT_MAX_SIZE_MB = 512
+    _META_FILE_NAME = 'meta.json'
+    _CLASSES_DIR_NAME = 'classes'
+
+    def __init__(self):
+        """Initializes the BuildCache."""
+        self._logger = ProctorLoggerFactory.getLogger()
+        self._cache_dir = PathManager.get_proctor_data_dir('build-cache')
+        self._max_size_bytes = ProctorConfig.get_config_int('Proctor', 'build_cache_max_mb',
+                                                            BuildCache.DEFAULT_MAX_SIZE_MB) * 1024 * 1024
+        self._lock = threading.Lock()
+        self._total_size = None     # bytes, computed on first store
+
+    @staticmethod
+    def compute_source_hash(project_name, dir_to_grade):
+        """Hashes the relative names and contents of all *.java files under the project's src_dir.
+        :param project_name: Name of the project being graded
+        :param dir_to_grade: Root of the directory tree where project files live
+        :returns Hex digest of the project's source tree."""
+        src_root = Path(os.sep.join([str(dir_to_grade), PathManager.get_project_src_dir_name(project_name)]))
+        digest = hashlib.sha256()
+        for java_file in sorted(src_root.rglob('*.java')):
+            digest.update(java_file.relative_to(src_root).as_posix().encode('utf-8'))
+            digest.update(b'\0')
+            digest.update(hashlib.sha256(java_file.read_bytes()).digest())
+        return digest.hexdigest()
+
+    def compute_key(self, project_name, dir_to_grade):
+        """Computes the cache key for the given project.
+        :param project_name: Name of the project being graded
+        :param dir_to_grade: Root of the directory tree where project files live
+        :returns Cache key as a hex digest."""
+        digest = hashlib.sha256()
+        for part in [BuildCache.compute_source_hash(project_name, dir_to_grade),
+                     PathManager.get_java_classpath(),
+                     PathManager.get_junit_classpath(),
+                     PathManager.get_build_mode(project_name),
+                     JavaHelpers.get_javac_version()]:
+            digest.update(str(part).encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def restore(self, key, project_name, dir_to_grade):
+        """Restores a cached build into the project's src_dir, replacing any .class files already there, e.g.,
+        from an earlier build, so that only the cached build's classes are on the classpath.
+        :param key: Cache key computed by compute_key
+        :param project_name: Name of the project being graded
+        :param dir_to_grade: Root of the directory tree where project files live
+        :returns Tuple (source build errors, test build errors) or None on a cache miss. Test build errors is
+        None if the tests were not built because the source failed to build."""
+        entry_dir = Path(self._cache_dir) / key
+        meta_file = entry_dir / BuildCache._META_FILE_NAME
+        try:
+            with open(meta_file, encoding='utf-8') as f:
+                meta = json.load(f)
+            src_root = Path(os.sep.join([str(dir_to_grade), PathManager.get_project_src_dir_name(project_name)]))
+            classes_dir = entry_dir / BuildCache._CLASSES_DIR_NAME
+            for class_file in src_root.rglob('*.class'):
+                class_file.unlink()
+            for class_file in classes_dir.rglob('*.class'):
+                target = src_root / class_file.relative_to(classes_dir)
+                target.parent.mkdir(parents=True, exist_ok=True)
+                shutil.copy2(str(class_file), str(target))
+            os.utime(str(meta_file))    # Marks the entry as recently used
+        except (OSError, ValueError):
+            return None
+        return (meta['source_errors'], meta['test_errors'])
+
+    def store(self, key, project_name, dir_to_grade, source_errors, test_errors):
+        """Stores the .class files found under the project's src_dir and the build error counts.
+        :param key: Cache key computed by compute_key
+        :param project_name: Name of the project being graded
+        :param dir_to_grade: Root of the directory tree where project files live
+        :param source_errors: Number of source build errors
+        :param test_errors: Number of test build errors, or None if the tests were not built"""
+        src_root = Path(os.sep.join([str(dir_to_grade), PathManager.get_project_src_dir_name(project_name)]))
+        entry_dir = Path(self._cache_dir) / key
+        try:
+            # Built in a scratch directory, then moved into place
+            scratch_dir = Path(tempfile.mkdtemp(prefix=f'.{key}-', dir=self._cache_dir))
+            classes_dir = scratch_dir / BuildCache._CLASSES_DIR_NAME
+            size = 0
+            for class_file in src_root.rglob('*.class'):
+                target = classes_dir / class_file.relative_to(src_root)
+                target.parent.mkdir(parents=True, exist_ok=True)
+                shutil.copy2(str(class_file), str(target))
+                size += target.stat().st_size
+            with open(scratch_dir / BuildCache._META_FILE_NAME, mode='wt', encoding='utf-8') as f:
+                json.dump({'source_errors': source_errors, 'test_errors': test_errors, 'size': size}, f)
+            try:
+                os.rename(str(scratch_dir), str(entry_dir))
+            except OSError:
+                shutil.rmtree(str(scratch_dir), ignore_errors=True)    # Already cached by someone else
+                return
+        except OSError as ex:
+            self._logger.warning(f'Cannot write build cache entry: {ex}')
+            return
+
+        with self._lock:
+            if self._total_size is None:
+                self._total_size = sum(size for _, size, _ in self._list_entries())
+            else:
+                self._total_size += size
+            if self._total_size > self._max_size_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Evicts least recently used entries until the cache fits under its size cap. Called with the lock held."""
+        entries = sorted(self._list_entries())
+        self._total_size = sum(size for _, size, _ in entries)
+        while self._total_size > self._max_size_bytes and entries:
+            _, size, entry_dir = entries.pop(0)
+            self._logger.debug(f'Evicting build cache entry: {entry_dir.name}')
+            shutil.rmtree(str(entry_dir), ignore_errors=True)
+            self._total_size -= size
+
+    def _list_entries(self):
+        """Lists the cache's entries with their sizes, read from their metadata. The size of an entry written by an
+        earlier version of Proctor, which did not record it, is measured instead.
+        :returns List of tuples (last used time, size in bytes, entry directory)."""
+        entries = []
+        for entry_dir in Path(self._cache_dir).iterdir():
+            meta_file = entry_dir / BuildCache._META_FILE_NAME
+            try:
+                with open(meta_file, encoding='utf-8') as f:
+                    size = json.load(f).get('size')
+                if size is None:
+                    size = sum(f.stat().st_size for f in entry_dir.rglob('*') if f.is_file())
+                entries.append((meta_file.stat().st_mtime, size, entry_dir))
+            except (OSError, ValueError):
+                continue
+        return entries
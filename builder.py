@@ -1,8 +1,12 @@
 import glob
 import os
+import re
 import subprocess
+import tempfile
 from logging import Logger
 from pathlib import Path
+from compileserver import CompileServer, CompileServerError
+from jvmprofile import JvmProfile
 from pathmgr import PathManager
 from ploggerfactory import ProctorLoggerFactory
 
@@ -11,6 +15,15 @@ class Builder:
     """Builds the source and unit test files via javac."""
     _logger: Logger
 
+    BUILD_MODE_BATCH = 'batch'          # all files compiled in a single javac invocation
+    BUILD_MODE_PER_FILE = 'per_file'    # one javac invocation per file
+
+    # javac reports errors as 'path/to/File.java:12: error: ...'. Diagnostics are forced to English so that the
+    # pattern matches regardless of the grading machine's locale.
+    _JAVAC_ERROR_PATTERN = r'^(.+\.java):\d+: error:'
+    _JAVAC_ENGLISH_DIAGNOSTICS = '-J-Duser.language=en'
+    _JAVAC_MAX_ERRORS = ['-Xmaxerrs', '100000']     # javac stops reporting after 100 errors by default
+
     def __init__(self):
         """Initializes the Builder."""
         self._logger = ProctorLoggerFactory.getLogger()
@@ -59,13 +72,7 @@ class Builder:
         build_errors = 0
 
         try:
-            for test_file in unit_test_file_names:
-                result = subprocess.run(['javac', '-classpath', full_classpath, test_file],
-                                        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                result_string = "OK" if result.returncode == 0 else "FAILED"
-                file_name = Path(test_file).name
-                self._logger.debug(f'...{file_name} => {result_string}')
-                build_errors = build_errors + result.returncode
+            build_errors = self._compile_files(project_name, unit_test_file_names, ['-classpath', full_classpath])
         except Exception as ex:
             self._logger.error("Exception caught while building unit tests {}".format(str(ex)))
             build_errors += 1
@@ -115,20 +122,132 @@ class Builder:
         build_errors = 0
 
         try:
-            for src_file in java_file_names:
-                result = subprocess.run(['javac', '-classpath', full_classpath,
-                                         '-sourcepath', full_classpath, src_file],
-                                        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                result_string = "OK" if result.returncode == 0 else "FAILED"
-                file_name = Path(src_file).name
-                self._logger.debug(f'...{file_name} => {result_string}')
-                build_errors = build_errors + result.returncode
+            build_errors = self._compile_files(project_name, java_file_names,
+                                               ['-classpath', full_classpath, '-sourcepath', full_classpath])
         except Exception as ex:
             self._logger.error("Exception caught while compiling source: {}".format(str(ex)))
             build_errors += 1
 
         return build_errors
 
+    def _compile_files(self, project_name, file_names, javac_options):
+        """Compiles the given files, either one javac invocation per file or all files in a single batch,
+        depending on the project's configured build mode.
+        :param project_name: Name of the project being built
+        :param file_names: List of *.java files to compile
+        :param javac_options: List of options passed to javac ahead of the file names, e.g., the classpath
+        :returns Number of compiler errors"""
+        if PathManager.get_build_mode(project_name) == Builder.BUILD_MODE_PER_FILE:
+            return self._compile_each_file(file_names, javac_options)
+        return self._compile_batch(file_names, javac_options)
+
+    def _compile_each_file(self, file_names, javac_options):
+        """Compiles each file in its own javac invocation. Each file that fails to compile counts as one error.
+        :param file_names: List of *.java files to compile
+        :param javac_options: List of options passed to javac ahead of the file name
+        :returns Number of compiler errors"""
+        build_errors = 0
+        for java_file in file_names:
+            result = subprocess.run(['javac'] + JvmProfile.get_javac_options() + javac_options + [java_file],
+                                    stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            result_string = "OK" if result.returncode == 0 else "FAILED"
+            file_name = Path(java_file).name
+            self._logger.debug(f'...{file_name} => {result_string}')
+            build_errors = build_errors + result.returncode
+        return build_errors
+
+    def _compile_batch(self, file_names, javac_options):
+        """Compiles all files in a single javac invocation. The file names are passed to javac via an
+        argument file so that long file lists do not overflow the command line.
+
+        javac names only the files its diagnostics point at, whereas the per-file build mode also counts a file
+        that fails because a file it depends on is broken. So when the batch fails, the files are compiled again
+        one by one, and the error count is the per-file build mode's. Builds that succeed, the common case, take
+        a single javac invocation.
+        :param file_names: List of *.java files to compile
+        :param javac_options: List of options passed to javac ahead of the argument file
+        :returns Number of compiler errors"""
+        if not file_names:
+            return 0
+
+        build_errors = None
+        if CompileServer.is_enabled():
+            try:
+                build_errors = self._compile_batch_with_server(file_names, javac_options)
+            except CompileServerError as ex:
+                self._logger.warning(f'{ex}. Falling back to javac.')
+        if build_errors is None:
+            build_errors = self._compile_batch_with_javac(file_names, javac_options)
+
+        if build_errors == 0:
+            return 0
+        self._logger.debug('Batch build failed. Compiling each file to count the errors.')
+        return self._compile_each_file(file_names, javac_options)
+
+    def _compile_batch_with_javac(self, file_names, javac_options):
+        """Compiles all files in a single javac invocation, passing the file names via an argument file.
+        :param file_names: List of *.java files to compile
+        :param javac_options: List of options passed to javac ahead of the argument file
+        :returns Number of files javac reported errors in, or javac's exit code if it blamed no file"""
+
+        argfile_fd, argfile_name = tempfile.mkstemp(prefix='proctor-javac-', suffix='.args')
+        try:
+            with os.fdopen(argfile_fd, mode='wt', encoding='utf-8') as argfile:
+                for java_file in file_names:
+                    argfile.write(f'"{Path(java_file).as_posix()}"\n')
+            result = subprocess.run(['javac', Builder._JAVAC_ENGLISH_DIAGNOSTICS] + Builder._JAVAC_MAX_ERRORS +
+                                    JvmProfile.get_javac_options() + javac_options + [f'@{argfile_name}'],
+                                    stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        finally:
+            os.remove(argfile_name)
+
+        failed_files = self._get_failed_file_names(result.stderr.decode('utf-8', errors='replace'))
+        self._log_file_results(file_names, failed_files)
+
+        build_errors = len(failed_files)
+        if result.returncode != 0 and build_errors == 0:
+            # javac failed without blaming a specific file, e.g., a bad option or missing classpath entry
+            build_errors = result.returncode
+        return build_errors
+
+    def _compile_batch_with_server(self, file_names, javac_options):
+        """Compiles all files in a single request to the long-lived compile server.
+        :param file_names: List of *.java files to compile
+        :param javac_options: List of javac options, e.g., the classpath
+        :returns Number of files with errors, or 1 if the compiler blamed no file
+        :raises CompileServerError if the compile server is unavailable"""
+        ok, diagnostics = CompileServer.get_instance().compile(Builder._JAVAC_MAX_ERRORS + javac_options, file_names)
+
+        failed_files = set()
+        for diagnostic in diagnostics:
+            if diagnostic.kind == 'ERROR':
+                self._logger.debug(f'{diagnostic.source}:{diagnostic.line}: {diagnostic.message}')
+                if diagnostic.source:
+                    failed_files.add(Path(diagnostic.source).resolve())
+        self._log_file_results(file_names, failed_files)
+
+        build_errors = len(failed_files)
+        if not ok and build_errors == 0:
+            build_errors = 1
+        return build_errors
+
+    def _log_file_results(self, file_names, failed_files):
+        """Logs the build result of each file in a batch.
+        :param file_names: List of *.java files that were compiled
+        :param failed_files: Set of resolved Paths of the files that failed to compile"""
+        for java_file in file_names:
+            result_string = "FAILED" if Path(java_file).resolve() in failed_files else "OK"
+            self._logger.debug(f'...{Path(java_file).name} => {result_string}')
+
+    def _get_failed_file_names(self, javac_output):
+        """Parses javac's diagnostics and returns the set of files reported as having errors.
+        :param javac_output: Text written by javac to stderr
+        :returns Set of resolved Paths, one per file that failed to compile"""
+        failed_files = set()
+        for m in re.finditer(Builder._JAVAC_ERROR_PATTERN, javac_output, re.MULTILINE):
+            failed_files.add(Path(m.group(1)).resolve())
+        return failed_files
+
     def _get_java_file_names(self, project_name, dir_to_grade):
         """Fetches the names of the *.java source files to compile.
         :param project_name: Name of the project being built
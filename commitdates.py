@@ -0,0 +1,121 @@
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime as dt
+from localrepo import LocalRepo
+from pconfig import ProctorConfig
+from ploggerfactory import ProctorLoggerFactory
+
+
+class CommitDateProvider:
+    """Provides the latest commit date of each owner's project, which the grader compares to the due date.
+
+    The date comes from one of three sources, set by the [Proctor] commit_date_source key:
+    - local (the default) reads the HEAD commit of the owner's clone, so it is the date of the code being graded
+      and costs no API call.
+    - server asks the GitLab server for the project's latest commit.
+    - verify reads the clone, like local, and also asks the server, logging a warning when the dates differ,
+      e.g., because the owner pushed after the project was cloned."""
+
+    SOURCE_LOCAL = 'local'
+    SOURCE_SERVER = 'server'
+    SOURCE_VERIFY = 'verify'
+
+    _SOURCES = (SOURCE_LOCAL, SOURCE_SERVER, SOURCE_VERIFY)
+    _MAX_READERS = 8        # concurrent git processes when reading all clones
+
+    @staticmethod
+    def get_source():
+        """Returns the configured source of commit dates.
+        :returns One of the SOURCE_* names
+        :raises ValueError if the source is unknown"""
+        source = (ProctorConfig.get_config_value('Proctor', 'commit_date_source') or
+                  CommitDateProvider.SOURCE_LOCAL).strip().lower()
+        if source not in CommitDateProvider._SOURCES:
+            raise ValueError(f"Unknown commit_date_source '{source}'. "
+                             f"Use one of: {', '.join(CommitDateProvider._SOURCES)}.")
+        return source
+
+    @staticmethod
+    def parse_commit_date(commit_date):
+        """Parses a commit date from the server, e.g., '2019-03-03T23:39:40.000-05:00', or from git, e.g.,
+        '2019-03-03T23:39:40-05:00'.
+        :param commit_date: ISO 8601 date string with a UTC offset
+        :returns Timezone-aware datetime
+        :raises ValueError if the date cannot be parsed"""
+        if commit_date.endswith('Z'):
+            commit_date = commit_date[:-1] + '+0000'
+        elif re.search(r'[+-]\d\d:\d\d$', commit_date):
+            commit_date = commit_date[:-3] + commit_date[-2:]   # remove the offset's ':' so that strptime can parse
+        fmt = "%Y-%m-%dT%H:%M:%S.%f%z" if '.' in commit_date else "%Y-%m-%dT%H:%M:%S%z"
+        return dt.strptime(commit_date, fmt)
+
+    def __init__(self, project_dir, project_index, source=SOURCE_LOCAL):
+        """Initializes the CommitDateProvider.
+        :param project_dir: Project's directory under Proctor's working directory, which holds one clone per owner
+        :param project_index: ProjectIndex of the project's server projects, used by the server and verify sources
+        :param source: One of the SOURCE_* names"""
+        self._logger = ProctorLoggerFactory.getLogger()
+        self._project_dir = project_dir
+        self._project_index = project_index
+        self._source = source
+        self._local_dates = {}          # email -> (commit date, author date), or None if the clone has no commits
+        self._lock = threading.Lock()
+
+    def prefetch(self, owner_emails):
+        """Reads the HEAD commit dates of all owners' clones concurrently, so that grading finds them ready. Also
+        fetches the server dates concurrently when they're needed.
+        :param owner_emails: Project owners' emails
+        :returns This CommitDateProvider"""
+        owner_emails = [email for email in owner_emails if email]
+        if self._source != CommitDateProvider.SOURCE_SERVER and owner_emails:
+            with ThreadPoolExecutor(max_workers=min(CommitDateProvider._MAX_READERS, len(owner_emails))) as executor:
+                list(executor.map(self._get_local_dates, owner_emails))
+        if self._source != CommitDateProvider.SOURCE_LOCAL:
+            self._project_index.prefetch_owners(owner_emails)
+        return self
+
+    def get_latest_commit_date(self, owner_email):
+        """Returns the date of the latest commit to the owner's project.
+        :param owner_email: Project owner's email
+        :returns Latest commit date string, or None if the project has no commits."""
+        if self._source == CommitDateProvider.SOURCE_SERVER:
+            return self._project_index.get_latest_commit_date(owner_email)
+
+        local_dates = self._get_local_dates(owner_email)
+        commit_date = local_dates[0] if local_dates else None
+        if self._source == CommitDateProvider.SOURCE_VERIFY:
+            self._verify(owner_email, commit_date)
+        return commit_date
+
+    def _get_local_dates(self, owner_email):
+        """Returns the HEAD commit dates of the owner's clone, reading them on first use.
+        :param owner_email: Project owner's email
+        :returns Tuple (commit date, author date), or None if the clone has no commits."""
+        with self._lock:
+            if owner_email in self._local_dates:
+                return self._local_dates[owner_email]
+        local_dates = LocalRepo(os.sep.join([self._project_dir, owner_email])).get_commit_dates()
+        if local_dates:
+            self._logger.debug(f'{owner_email}: committed {local_dates[0]}, authored {local_dates[1]}')
+        with self._lock:
+            self._local_dates[owner_email] = local_dates
+        return local_dates
+
+    def _verify(self, owner_email, local_commit_date):
+        """Logs a warning if the clone's latest commit date differs from the server's.
+        :param owner_email: Project owner's email
+        :param local_commit_date: Latest commit date of the owner's clone, or None"""
+        server_commit_date = self._project_index.get_latest_commit_date(owner_email)
+        if local_commit_date and server_commit_date:
+            try:
+                if CommitDateProvider.parse_commit_date(local_commit_date) == \
+                        CommitDateProvider.parse_commit_date(server_commit_date):
+                    return
+            except ValueError:
+                pass
+        elif local_commit_date is None and server_commit_date is None:
+            return
+        self._logger.warning(f'Latest commit date of the clone ({local_commit_date}) differs from the server '
+                             f'({server_commit_date}). Try clone --force.')
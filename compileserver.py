@@ -0,0 +1,146 @@
+import subprocess
+import threading
+from collections import namedtuple
+from javahelpers import JavaHelpers
+from jvmprofile import JvmProfile
+from pconfig import ProctorConfig
+from ploggerfactory import ProctorLoggerFactory
+
+# One compiler diagnostic reported by the compile server
+CompileDiagnostic = namedtuple('CompileDiagnostic', ['kind', 'source', 'line', 'message'])
+
+
+class CompileServerError(Exception):
+    """Raised when the compile server cannot be started or stops responding."""
+    pass
+
+
+class CompileServer:
+    """Long-lived compile server that keeps a warm JVM across students. The server is a small Java helper
+    (java/ProctorCompileServer.java) built on javax.tools.JavaCompiler that Proctor talks to over a pipe.
+
+    Each grading worker thread gets its own server, started lazily on first use, so that concurrent workers
+    compile in parallel. The servers are shut down by Proctor when a project's grading is done. Once a server
+    crashes, none is restarted; callers fall back to running javac directly."""
+
+    _HELPER_CLASS = 'ProctorCompileServer'
+
+    _crashed = False
+    _servers = []
+    _registry_lock = threading.Lock()
+    _thread_server = threading.local()
+
+    @staticmethod
+    def is_enabled():
+        """Determines if the compile server should be used, based on the [Proctor] compile_server key.
+        :returns True if the compile server is enabled and has not crashed."""
+        return ProctorConfig.get_config_bool('Proctor', 'compile_server') and not CompileServer._crashed
+
+    @staticmethod
+    def get_instance():
+        """Returns the calling thread's running compile server, starting it if necessary.
+        :returns The calling thread's compile server.
+        :raises CompileServerError if the server cannot be started"""
+        server = getattr(CompileServer._thread_server, 'server', None)
+        if server is None or server._process is None:
+            server = CompileServer()
+            try:
+                server._start()
+            except Exception as ex:
+                CompileServer._crashed = True
+                server._stop()
+                raise CompileServerError(f'Cannot start compile server: {ex}')
+            CompileServer._thread_server.server = server
+            with CompileServer._registry_lock:
+                CompileServer._servers.append(server)
+        return server
+
+    @staticmethod
+    def shutdown_all():
+        """Shuts down every compile server started by any thread."""
+        with CompileServer._registry_lock:
+            for server in CompileServer._servers:
+                server._stop()
+            CompileServer._servers = []
+
+    def __init__(self):
+        """Initializes the CompileServer. The server process starts in _start."""
+        self._logger = ProctorLoggerFactory.getLogger()
+        self._process = None
+        self._log_file = None
+        self._lock = threading.Lock()
+
+    def compile(self, javac_options, file_names):
+        """Compiles the given files in the compile server's JVM.
+        :param javac_options: List of javac options, e.g., ['-classpath', cp, '-d', output_dir]
+        :param file_names: List of *.java files to compile
+        :returns Tuple (True if compilation succeeded, list of CompileDiagnostic)
+        :raises CompileServerError if the server crashed or rejected the request"""
+        with self._lock:
+            try:
+                request = ['COMPILE']
+                request += [f'OPT {option}' for option in javac_options]
+                request += [f'FILE {file_name}' for file_name in file_names]
+                request.append('END')
+                self._process.stdin.write('\n'.join(request) + '\n')
+                self._process.stdin.flush()
+
+                diagnostics = []
+                while True:
+                    line = self._read_line()
+                    if line.startswith('DIAG '):
+                        kind, source, lineno, message = line[5:].split('\t', 3)
+                        diagnostics.append(CompileDiagnostic(kind, JavaHelpers.unescape(source), int(lineno),
+                                                             JavaHelpers.unescape(message)))
+                    elif line.startswith('RESULT '):
+                        return (line[7:] == 'OK', diagnostics)
+                    elif line.startswith('ERROR '):
+                        raise CompileServerError(JavaHelpers.unescape(line[6:]))
+            except (OSError, ValueError) as ex:
+                self._crash(ex)
+
+    def _start(self):
+        """Compiles (if needed) and launches the compile server, waiting until it reports that it's ready."""
+        helper_cp = JavaHelpers.get_helper_classpath(CompileServer._HELPER_CLASS)
+        self._log_file = open(JavaHelpers.get_helper_log_file_name(CompileServer._HELPER_CLASS), mode='at')
+        self._process = subprocess.Popen(['java'] + JvmProfile.get_flags() +
+                                         ['-cp', helper_cp, CompileServer._HELPER_CLASS],
+                                         stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=self._log_file,
+                                         universal_newlines=True, encoding='utf-8')
+        line = self._read_line()
+        if line != 'READY':
+            raise CompileServerError(JavaHelpers.unescape(line))
+        self._logger.debug(f'Compile server started (pid={self._process.pid})')
+
+    def _stop(self):
+        """Asks the compile server to quit and waits for it to exit."""
+        if self._process is not None and self._process.poll() is None:
+            try:
+                self._process.stdin.write('QUIT\n')
+                self._process.stdin.flush()
+                self._process.wait(timeout=10)
+            except (OSError, subprocess.TimeoutExpired):
+                self._process.kill()
+            self._logger.debug('Compile server stopped')
+        self._process = None
+        if self._log_file is not None:
+            self._log_file.close()
+            self._log_file = None
+
+    def _read_line(self):
+        """Reads one response line from the compile server.
+        :returns Line read, sans the trailing newline
+        :raises CompileServerError if the server has exited"""
+        line = self._process.stdout.readline()
+        if not line:
+            self._crash(EOFError(f'compile server exited with code {self._process.poll()}'))
+        return line.rstrip('\n')
+
+    def _crash(self, ex):
+        """Marks the compile server as crashed so that callers fall back to running javac directly.
+        :param ex: Exception that describes the failure
+        :raises CompileServerError always"""
+        CompileServer._crashed = True
+        if self._process.poll() is None:
+            self._process.kill()
+        raise CompileServerError(f'Compile server crashed: {ex}')
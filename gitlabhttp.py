@@ -0,0 +1,119 @@
+import threading
+import time
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from pconfig import ProctorConfig
+from throttle import AdaptiveThrottle
+
+
+class GitLabHTTPAdapter(HTTPAdapter):
+    """requests transport adapter for the GitLab API session. It keeps a pool of keep-alive connections that's
+    large enough for concurrent lookups, retries idempotent requests that fail with a connection error or a
+    server error status, with exponential backoff, and bounds the number of requests in flight at once so that
+    concurrent lookups cannot overload the server. An AdaptiveThrottle paces requests, and requests the server
+    is too busy to answer (429 or 503) are retried after the server's Retry-After or a jittered exponential
+    backoff. GET requests are answered from an ApiCache, if one is given, and fresh responses are stored in it.
+
+    Settings come from the [GitLabServer] section of the configuration file; see from_config."""
+
+    DEFAULT_MAX_INFLIGHT_REQUESTS = 8
+    DEFAULT_RETRIES = 3
+    DEFAULT_BACKOFF_SECS = 0.5
+    DEFAULT_TIMEOUT_SECS = 30
+    DEFAULT_MAX_REQUESTS_PER_SEC = 10
+    DEFAULT_SLOW_RESPONSE_SECS = 5
+
+    _RETRY_STATUSES = (500, 502, 504)
+    _BUSY_STATUSES = (429, 503)     # retried by send, which honors Retry-After and adapts the throttle
+
+    @staticmethod
+    def from_config(api_cache=None):
+        """Creates an adapter configured by the [GitLabServer] max_inflight_requests, request_retries,
+        request_backoff_secs, request_timeout_secs, max_requests_per_sec and slow_response_secs keys.
+        :param api_cache: ApiCache for GET responses, or None to not cache
+        :returns GitLabHTTPAdapter"""
+        max_inflight = ProctorConfig.get_config_int('GitLabServer', 'max_inflight_requests',
+                                                    GitLabHTTPAdapter.DEFAULT_MAX_INFLIGHT_REQUESTS)
+        retries = ProctorConfig.get_config_int('GitLabServer', 'request_retries', GitLabHTTPAdapter.DEFAULT_RETRIES)
+        backoff_secs = float(ProctorConfig.get_config_value('GitLabServer', 'request_backoff_secs') or
+                             GitLabHTTPAdapter.DEFAULT_BACKOFF_SECS)
+        timeout_secs = float(ProctorConfig.get_config_value('GitLabServer', 'request_timeout_secs') or
+                             GitLabHTTPAdapter.DEFAULT_TIMEOUT_SECS)
+        max_rate = float(ProctorConfig.get_config_value('GitLabServer', 'max_requests_per_sec') or
+                         GitLabHTTPAdapter.DEFAULT_MAX_REQUESTS_PER_SEC)
+        slow_response_secs = float(ProctorConfig.get_config_value('GitLabServer', 'slow_response_secs') or
+                                   GitLabHTTPAdapter.DEFAULT_SLOW_RESPONSE_SECS)
+        throttle = AdaptiveThrottle(max_rate, slow_response_secs) if max_rate > 0 else None
+        return GitLabHTTPAdapter(max(1, max_inflight), max(0, retries), backoff_secs, timeout_secs, api_cache,
+                                 throttle)
+
+    def __init__(self, max_inflight, retries, backoff_secs, timeout_secs, api_cache=None, throttle=None):
+        """Initializes the GitLabHTTPAdapter.
+        :param max_inflight: Maximum number of requests sent concurrently. Also the connection pool size.
+        :param retries: Number of times a failed idempotent request is retried
+        :param backoff_secs: Backoff factor; retries wait backoff_secs, 2 * backoff_secs, 4 * backoff_secs, ...
+        :param timeout_secs: Connect and read timeout applied to requests that do not set their own
+        :param api_cache: ApiCache for GET responses, or None to not cache
+        :param throttle: AdaptiveThrottle that paces requests, or None to send them as fast as allowed"""
+        retry = Retry(total=retries, connect=retries, read=retries, status=retries, backoff_factor=backoff_secs,
+                      status_forcelist=GitLabHTTPAdapter._RETRY_STATUSES, raise_on_status=False,
+                      respect_retry_after_header=False)    # busy responses are retried by send
+        super().__init__(pool_connections=1, pool_maxsize=max_inflight, max_retries=retry)
+        self._max_inflight = max_inflight
+        self._inflight = threading.BoundedSemaphore(max_inflight)
+        self._timeout_secs = timeout_secs
+        self._api_cache = api_cache
+        self._throttle = throttle
+        self._retries = retries
+        self._backoff_secs = backoff_secs
+
+    def get_max_inflight(self):
+        """Returns the maximum number of requests sent concurrently.
+        :returns Maximum number of in-flight requests."""
+        return self._max_inflight
+
+    def send(self, request, **kwargs):
+        """Sends a request once one of the in-flight slots is free, or answers it from the API cache.
+        :param request: PreparedRequest to send
+        :param kwargs: Arguments passed on to HTTPAdapter.send
+        :returns Response"""
+        use_cache = self._api_cache is not None and request.method == 'GET' and not kwargs.get('stream')
+        entry = None
+        if use_cache:
+            entry, is_fresh = self._api_cache.lookup(request)
+            if is_fresh:
+                return self._api_cache.build_response(request, entry)
+
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self._timeout_secs
+        response = self._send_when_not_busy(request, **kwargs)
+
+        if use_cache:
+            if response.status_code == 304 and entry is not None:
+                response.close()
+                self._api_cache.revalidated(request, entry)
+                return self._api_cache.build_response(request, entry)
+            self._api_cache.store(request, response)
+        return response
+
+    def _send_when_not_busy(self, request, **kwargs):
+        """Sends a request at the throttle's pace, retrying it while the server answers that it's too busy.
+        :param request: PreparedRequest to send
+        :param kwargs: Arguments passed on to HTTPAdapter.send
+        :returns Response, which is still a 429 or 503 if the server stayed busy through all retries"""
+        attempt = 0
+        while True:
+            if self._throttle is not None:
+                self._throttle.acquire()
+            with self._inflight:
+                start = time.monotonic()
+                response = super().send(request, **kwargs)
+                elapsed_secs = time.monotonic() - start
+            if self._throttle is not None:
+                self._throttle.on_response(response.status_code, response.headers, elapsed_secs)
+            if response.status_code not in GitLabHTTPAdapter._BUSY_STATUSES or attempt >= self._retries:
+                return response
+            wait_secs = AdaptiveThrottle.get_backoff_secs(attempt, self._backoff_secs, response.headers)
+            response.close()
+            time.sleep(wait_secs)
+            attempt += 1
@@ -1,17 +1,64 @@
 import os
+import re
 import subprocess
+import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
 import gitlab.v3
 import gitlab.v3.objects
+from gitlab.exceptions import GitlabConnectionError, GitlabError
 from gitlab.v3.objects import GitlabCreateError
+from apicache import ApiCache
+from gitlabhttp import GitLabHTTPAdapter
+from localrepo import LocalRepo
+from referencemirror import ReferenceMirror
 from pathmgr import PathManager
 from pconfig import ProctorConfig
 from ploggerfactory import ProctorLoggerFactory
 
 
+class GitLabTransientError(Exception):
+    """Raised when the GitLab server cannot answer right now, e.g., because it's overloaded or unreachable, as
+    opposed to answering that what was asked for does not exist. Trying again later may succeed."""
+    pass
+
+
+# Outcome of cloning one project. outcome is one of the GitLabServer.CLONE_* values.
+CloneResult = namedtuple('CloneResult', ['outcome', 'elapsed_secs', 'message'])
+
+# Emails added to, already in, and that could not be added to a group.
+GroupUpdate = namedtuple('GroupUpdate', ['added', 'existing', 'failed'])
+
+
 class GitLabServer:
     """Abstracts the GitLab server that contains  users, groups, and projects."""
 
     _GITLAB_API_VERSION = 3 # The version of the GitLab API supported by the WIT server
+    _PROJECTS_PAGE_SIZE = 100   # largest page the API allows
+    _TRANSIENT_STATUSES = (429, 500, 502, 503, 504)
+
+    CLONE_CLONED = 'cloned'
+    CLONE_UPDATED = 'updated'
+    CLONE_FAILED = 'failed'
+    CLONE_EXISTS = 'exists'     # destination exists and force was not given
+
+    DEFAULT_CLONE_TIMEOUT_SECS = 600
+    DEFAULT_CLONE_RETRIES = 2
+    _CLONE_BACKOFF_SECS = 2
+
+    # git errors worth retrying: network trouble and server-side failures, as opposed to, e.g., bad credentials
+    _TRANSIENT_GIT_ERROR_PATTERN = re.compile(r'could not resolve host|timed out|connection (reset|refused)|'
+                                              r'early eof|rpc failed|the remote end hung up|'
+                                              r'returned error: 5\d\d|failed to connect', re.IGNORECASE)
+
+    @staticmethod
+    def is_transient_error(ex):
+        """Determines if an error raised by a GitLab API call means that the server could not answer right now.
+        :param ex: Exception raised by python-gitlab
+        :returns True if the call may succeed if tried again later."""
+        if isinstance(ex, GitlabConnectionError):
+            return True
+        return isinstance(ex, GitlabError) and getattr(ex, 'response_code', None) in GitLabServer._TRANSIENT_STATUSES
 
     @staticmethod
     def build_server_project_path(project_name, owner_email):
@@ -33,13 +80,41 @@ class GitLabServer:
         self._api_version = api_version
         self._logger = ProctorLoggerFactory.getLogger()
 
-    def login(self, user):
+    def login(self, user, refresh=False):
         """Establishes an authenticated connection to the GitLab server.
-        :param: GitLabUser logging into the GitLab server"""
+        :param: GitLabUser logging into the GitLab server
+        :param refresh: True to bypass cached API responses and fetch everything from the server again"""
         self._server = gitlab.Gitlab(url=self._url,
                                      private_token=user.get_private_token(),
                                      api_version=str(self._api_version))
 
+        # All API calls go through the session, so its adapter pools connections, retries and bounds concurrency
+        api_cache = ApiCache(user.get_private_token(), refresh) if ApiCache.is_enabled() else None
+        self._http_adapter = GitLabHTTPAdapter.from_config(api_cache)
+        self._server.session.mount('https://', self._http_adapter)
+        self._server.session.mount('http://', self._http_adapter)
+
+    def map_concurrent(self, fn, items):
+        """Calls fn once for each item, concurrently, with at most as many calls in flight as the server allows
+        requests in flight.
+        An exception raised for one item is logged and does not stop the other items.
+        :param fn: Function of one argument that talks to the server, e.g., lambda email: ...
+        :param items: Items to pass to fn
+        :returns List of fn's results, in the order of items. None for the items fn raised an exception for."""
+        items = list(items)
+        if not items:
+            return []
+        with ThreadPoolExecutor(max_workers=min(len(items), self._http_adapter.get_max_inflight())) as executor:
+            futures = [executor.submit(fn, item) for item in items]
+        results = []
+        for item, future in zip(items, futures):
+            try:
+                results.append(future.result())
+            except Exception as ex:
+                self._logger.warning(f'Server request for {item} failed: {type(ex).__name__}: {ex}')
+                results.append(None)
+        return results
+
     def whoami(self):
         """Returns the user currently logged into the GitLab server from the program's perspective.
         :returns The name of the currently logged in user."""
@@ -70,17 +145,43 @@ class GitLabServer:
 
         return (project_count, user_projects)
 
+    def get_projects_for_owners(self, emails):
+        """Fetches the projects owned by each of the given users/emails by walking all visible projects once, a
+        page at a time, rather than searching once per user. Only the URLs of projects owned by the given users
+        are kept, so memory use does not grow with the number of projects on the server.
+        :param emails: Emails for which to find projects on the GitLab server.
+        :returns Dictionary that maps each email to a tuple of project count and list of projects owned by the user,
+        like get_projects_for_owner."""
+        usernames = {email: email.replace('@wit.edu', '') for email in emails}
+        owner_projects = {username: [] for username in usernames.values()}
+        page = 1
+        while True:
+            projects = self._server.projects.list(page=page, per_page=GitLabServer._PROJECTS_PAGE_SIZE)
+            for p in projects:
+                owner = getattr(p, 'owner', None)       # projects in a group have no owner
+                if owner is not None and owner.username in owner_projects:
+                    owner_projects[owner.username].append(p.web_url)
+            self._logger.debug(f'Scanned projects page {page}')
+            if len(projects) < GitLabServer._PROJECTS_PAGE_SIZE:
+                break
+            page += 1
+        return {email: (len(owner_projects[username]), owner_projects[username])
+                for email, username in usernames.items()}
+
     def get_user_project(self, owner_email, project_name):
         """Fetches information about a user's project from the GitLabServer.
         :param owner_email: Project owner's email
         :param project_name: Project being worked on
-        :returns: Information about the given user's GitLab project."""
+        :returns: Information about the given user's GitLab project, or None if it's not found.
+        :raises GitLabTransientError if the server cannot answer right now"""
         try:
             project_path = GitLabServer.build_server_project_path(project_name, owner_email)
             self._logger.info(f'Getting project info from server <= {project_path}')
             project = self._server.projects.get(project_path)
             return project
-        except:
+        except GitlabError as ex:
+            if GitLabServer.is_transient_error(ex):
+                raise GitLabTransientError(f'Server unavailable getting {project_path}: {ex}') from ex
             return None
 
     def get_user_from_email(self, email):
@@ -113,25 +214,64 @@ class GitLabServer:
         projects = self._server.projects.list(search=project_name, all=True)
         return projects
 
-    def clone_project(self, gitlab_project, dest_path_name, force=False):
-        """git clone the given project from the GitLab server to the local computer.
-        :returns None
+    def clone_project(self, gitlab_project, dest_path_name, force=False, clone_strategy=LocalRepo.CLONE_STRATEGY_FULL,
+                      mirror_path_name=None, dissociate=False):
+        """git clone the given project from the GitLab server to the local computer. If force is True and the
+        destination is already a clone of the project, the clone is updated in place instead, which only
+        transfers new commits. Each git command is limited by the [Proctor] clone_timeout_secs key, and clones
+        that fail for reasons that look transient, e.g., a dropped connection, are retried with backoff up to
+        [Proctor] clone_retries times. Safe to call from multiple threads for different destinations.
+        :returns CloneResult
         :param gitlab_project: GitLab project to clone.
         :param dest_path_name: Destination directory on the local computer to which the cloned files will be copied.
-        :param force: True to force overwriting the destination directory if it already exists."""
+        :param force: True to force overwriting the destination directory if it already exists.
+        :param clone_strategy: One of the LocalRepo.CLONE_STRATEGY_* names, e.g., 'shallow' to skip history
+        :param mirror_path_name: ReferenceMirror of the project's starter repo from which new clones borrow
+        objects, or None
+        :param dissociate: True to copy the objects borrowed from the mirror into the clone"""
+        start = time.monotonic()
+        timeout_secs = ProctorConfig.get_config_int('Proctor', 'clone_timeout_secs',
+                                                    GitLabServer.DEFAULT_CLONE_TIMEOUT_SECS) or None
+        retries = max(0, ProctorConfig.get_config_int('Proctor', 'clone_retries', GitLabServer.DEFAULT_CLONE_RETRIES))
         try:
-            PathManager.init_dest_path(dest_path_name, force)
             http_url = gitlab_project.http_url_to_repo
+            local_repo = LocalRepo(dest_path_name, timeout_secs)
+            if force and local_repo.is_clone_of(http_url):
+                self._logger.info(f'Updating repo: {http_url}...')
+                if local_repo.update(clone_strategy):
+                    self._logger.info('Updated OK')
+                    return CloneResult(GitLabServer.CLONE_UPDATED, time.monotonic() - start, '')
+                self._logger.warning('Cannot update existing clone. Cloning again.')
+
+            PathManager.init_dest_path(dest_path_name, force)
             self._logger.info('Cloning repo: {}...{}'.format(http_url, "(FORCED)" if force else ''))
-            result = subprocess.run(['git', 'clone', http_url, dest_path_name],
-                                    stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            if result.returncode == 0:
-                self._logger.info('Cloned OK')
-            else:
-                sresult = result.stderr.decode('utf-8')
+            for attempt in range(retries + 1):
+                if attempt > 0:
+                    backoff_secs = GitLabServer._CLONE_BACKOFF_SECS * 2 ** (attempt - 1)
+                    self._logger.warning(f'Retrying clone in {backoff_secs}s (attempt {attempt + 1} of {retries + 1})')
+                    time.sleep(backoff_secs)
+                    PathManager.init_dest_path(dest_path_name, True)   # clears what the failed attempt left
+                try:
+                    result = subprocess.run(['git', 'clone'] + LocalRepo.get_clone_options(clone_strategy) +
+                                            ReferenceMirror.get_clone_options(mirror_path_name, dissociate) +
+                                            [http_url, dest_path_name], stdin=subprocess.DEVNULL,
+                                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=timeout_secs)
+                except subprocess.TimeoutExpired:
+                    sresult = f'timed out after {timeout_secs}s'
+                    is_transient = True
+                else:
+                    if result.returncode == 0:
+                        self._logger.info('Cloned OK')
+                        return CloneResult(GitLabServer.CLONE_CLONED, time.monotonic() - start, '')
+                    sresult = result.stderr.decode('utf-8', errors='replace').strip()
+                    is_transient = GitLabServer._TRANSIENT_GIT_ERROR_PATTERN.search(sresult) is not None
                 self._logger.warning(f'Clone war: {sresult}')
+                if not is_transient:
+                    break
+            return CloneResult(GitLabServer.CLONE_FAILED, time.monotonic() - start, sresult)
         except FileExistsError as fex:
             self._logger.warning(str(fex))
+            return CloneResult(GitLabServer.CLONE_EXISTS, time.monotonic() - start, str(fex))
 
     def create_group(self, group_name):
         """Creates a new group on the GitLab server.
@@ -147,26 +287,67 @@ class GitLabServer:
             self._logger.error(f'Cannot create server group {group_name}: {err.error_message}')
 
     def add_users_to_group(self, group_name, email_list):
-        """Adds the given list of users (emails) to the specified group on the GitLab server.
+        """Adds the given list of users (emails) to the groups on the GitLab server that match the given name.
+        Each email is resolved to a user once, and each group's members are listed once, so that existing members
+        are skipped without asking the server. Missing members are then added concurrently.
         :param group_name: Group to which emails are added
-        :param email_list: List of emails to add to the group"""
+        :param email_list: List of emails to add to the group
+        :returns Dictionary of group name -> GroupUpdate, the emails added to, already in and failed for the group"""
         self._logger.info(f"Adding users to group '{group_name}'")
+        emails = list(OrderedDict.fromkeys(email.strip() for email in email_list if email and email.strip()))
+        groups = self._server.groups.list(search=group_name, all=True)
+        users = self.map_concurrent(self._find_user, emails)
+        unknown = [email for email, user in zip(emails, users) if user is None]
+        known = [(email, user) for email, user in zip(emails, users) if user is not None]
+
+        updates = OrderedDict()
+        for group in groups:
+            member_ids = {member.id for member in group.members.list(all=True)}
+            existing = [email for email, user in known if user.id in member_ids]
+            missing = [(group, email, user) for email, user in known if user.id not in member_ids]
+            outcomes = self.map_concurrent(self._add_group_member, missing)
+            added = [email for (_, email, _), outcome in zip(missing, outcomes) if outcome == 'added']
+            existing += [email for (_, email, _), outcome in zip(missing, outcomes) if outcome == 'exists']
+            failed = [email for (_, email, _), outcome in zip(missing, outcomes)
+                      if outcome not in ('added', 'exists')]
+            updates[group.name] = GroupUpdate(added, existing, failed)
+            self._logger.info(f'{group.name}: {len(added)} added, {len(existing)} already members, '
+                              f'{len(failed)} failed')
+            for email in failed:
+                self._logger.warning(f'Cannot add {group.name}/{email}')
+
+        if not groups:
+            self._logger.warning(f"No group found matching '{group_name}'")
+        if unknown:
+            self._logger.warning(f'Unknown. Users not found: {unknown}')
+        return updates
+
+    def _find_user(self, email):
+        """Looks up a user by email for a bulk operation, which goes on without users that cannot be identified.
+        :param email: GitLab user's email
+        :returns GitLab user information, or None if the user is not found, the email is ambiguous or the server
+        cannot answer."""
+        try:
+            return self.get_user_from_email(email)
+        except ValueError as ex:
+            self._logger.warning(str(ex))
+            return None
+        except (GitlabError, GitLabTransientError) as ex:
+            self._logger.warning(f'Cannot look up {email}: {ex}')
+            return None
+
+    def _add_group_member(self, group_email_user):
+        """Adds a user to a group as a developer.
+        :param group_email_user: Tuple (group, email, user)
+        :returns 'added', 'exists' if the user turned out to be a member already, or 'failed'"""
+        group, email, user = group_email_user
         try:
-            groups = self._server.groups.list(search=group_name, all=True)
-            for email in email_list:
-                for group in groups:
-                    try:
-                        self._logger.info(f'Adding {group.name}/{email}')
-                        user = self.get_user_from_email(email)
-                        if not user is None:
-                            member = group.members.create({'user_id': user.id,
-                                                           'access_level': gitlab.DEVELOPER_ACCESS})
-                        else:
-                            self._logger.warning('Unknown. User not found.')
-                    except GitlabCreateError:
-                        self._logger.warning('Duplicate. Already exists.')
-                        continue
-        except Exception as e:
-            print(e, type(e))
-            raise e
+            group.members.create({'user_id': user.id, 'access_level': gitlab.DEVELOPER_ACCESS})
+            self._logger.debug(f'Added {group.name}/{email}')
+            return 'added'
+        except (GitlabError, GitLabTransientError) as ex:
+            if isinstance(ex, GitlabCreateError) and getattr(ex, 'response_code', None) == 409:
+                return 'exists'
+            self._logger.debug(f'Cannot add {group.name}/{email}: {ex}')
+            return 'failed'
 
@@ -1,32 +1,89 @@
 import os
 import re
 import csv
+import io
+import threading
 from pathlib import Path
+from pathmgr import PathManager
 from ploggerfactory import ProctorLoggerFactory
 
 class GradeBook:
-    """Creates and manages a project's gradebook."""
+    """Creates and manages a project's gradebook.
+
+    Grade records are appended to the gradebook's CSV file, and flushed to disk, as soon as they're recorded, so
+    that a crash loses at most the students being graded at the time. Records are written in roster order (see
+    set_roster): a record that's recorded ahead of its turn waits in memory until the records before it are
+    written, so memory use depends on the number of grading workers rather than on the number of students. A
+    gradebook can resume the newest gradebook file of an earlier run, in which case the students already in it
+    are not graded again. If a GradeStore is given, every record, with its test results, is also stored there."""
 
     # Column headers for the gradebook, which is saved as a CSV file.
     COLS = ['project_name', 'email', 'due_dt', 'latest_commit_dt', 'is_ontime', 'days', 'hours', 'mins',
-            'source_builds', 'student_tests_build', 'student_tests_ratio', 'instructor_tests_ratio', 'grade', 'notes']
+            'source_builds', 'student_tests_build', 'student_tests_ratio', 'instructor_tests_ratio', 'grade', 'notes',
+            'student_tests_failed', 'instructor_tests_failed']
+
+    # Notes of records of students who could not be graded, which grade --resume grades again
+    _SERVER_UNAVAILABLE_NOTE = 'Server unavailable. Grade again.'
+    _GRADING_FAILED_NOTE = 'Grading failed: '
+    _REGRADE_NOTES = (_SERVER_UNAVAILABLE_NOTE, _GRADING_FAILED_NOTE)
 
-    def __init__(self, proctor_working_dir, project_name, project_due_dt):
+    def __init__(self, proctor_working_dir, project_name, project_due_dt, resume=False, grade_store=None):
         """Initializes the GradeBook.
         :param proctor_working_dir: Proctor's working directory
         :param project_name: Name of project being graded
-        :param project_due_dt: Project's due datetime in UTC"""
+        :param project_due_dt: Project's due datetime in UTC
+        :param resume: True to append to the newest existing gradebook file, if any, rather than start a new one
+        :param grade_store: GradeStore in which to store the records as well, or None"""
         self._logger = ProctorLoggerFactory.getLogger()
         self._project_name = project_name
         self._project_due_dt = project_due_dt
-        self._file_name = self._init_file_name(proctor_working_dir, project_name)
-        self._gradesheet = [GradeBook.COLS]
+        self._graded_emails = set()     # emails with a record in the file, including those of a resumed run
+        self._file_name = None
+        if resume:
+            self._file_name = self._resume_file(proctor_working_dir, project_name)
+        if self._file_name is None:
+            self._file_name = self._init_file_name(proctor_working_dir, project_name)
+        self._file = None
+        self._writer = None
+        self._pending = {}              # email -> record waiting for the records before it in the roster
+        self._roster = []
+        self._roster_positions = {}     # email -> position in the roster
+        self._next = 0                  # roster position of the next record to write
+        self._lock = threading.Lock()   # grades may be recorded concurrently by grading workers
+        self._grade_store = grade_store
+        self._run_id = grade_store.start_run(project_name, project_due_dt, self._file_name) if grade_store else None
 
     def get_file_name(self):
         """Returns the gradebook's file name.
         :returns The name of the gradebook file."""
         return self._file_name
 
+    def find_unchanged_grade(self, email, grade_keys):
+        """Finds the grade of an earlier run of the project that graded the same commit, sources and instructor
+        suite against the same due date. Requires a grade store.
+        :param email: Project owner's email
+        :param grade_keys: Dictionary with the GradeStore.GRADE_KEYS of what's about to be graded
+        :returns Grade record that can be passed to record_grade, or None if there's none or no grade store."""
+        if self._grade_store is None:
+            return None
+        return self._grade_store.find_unchanged_grade(self._project_name, email, self._project_due_dt, grade_keys)
+
+    def get_graded_emails(self):
+        """Returns the emails that already have a grade record, e.g., from the run being resumed.
+        :returns Set of project owner emails."""
+        with self._lock:
+            return set(self._graded_emails)
+
+    def set_roster(self, emails):
+        """Sets the order in which grade records are written, regardless of the order in which they're recorded.
+        Emails that already have a record are skipped. Records for emails not in the roster are written as soon as
+        they're recorded.
+        :param emails: List of unique project owner emails in roster order. Each should get a record."""
+        with self._lock:
+            self._roster = [email for email in emails if email not in self._graded_emails]
+            self._roster_positions = {email: position for position, email in enumerate(self._roster)}
+            self._next = 0
+
     def local_project_not_found(self, email):
         """Records a grade record that indicates the project being graded could not be found locally.
         :param email: Project owner's email"""
@@ -42,32 +99,130 @@ class GradeBook:
         :param email: Project owner's email"""
         self._record_grade_not_found(email, 'Commit not found on server. Pushed?')
 
+    def server_unavailable(self, email):
+        """Records a grade record that indicates the project could not be graded because the server could not
+        answer, e.g., because it was overloaded. Unlike the not-found records, the project may well exist.
+        :param email: Project owner's email"""
+        self._record_grade_not_found(email, GradeBook._SERVER_UNAVAILABLE_NOTE)
+
+    def grading_failed(self, email, reason):
+        """Records a grade record that indicates grading stopped with an unexpected error.
+        :param email: Project owner's email
+        :param reason: Description of the error"""
+        self._record_grade_not_found(email, GradeBook._GRADING_FAILED_NOTE + reason)
+
     def _record_grade_not_found(self, email, notes=''):
         """Writes an 'error' grade record to the memory-based gradebook.
         :param email: Project owner's email
         :param notes: Free-form text comments added to the grade record"""
-        self._gradesheet.append([self._project_name, email, self._project_due_dt, 'N/A',
-                                 False, 0, 0, 0, False, False, 0.0, 0.0, 'TBD', notes])
+        self.record_grade({'project_name': self._project_name, 'email': email, 'due_dt': self._project_due_dt,
+                           'latest_commit_dt': 'N/A', 'is_ontime': False, 'days': 0, 'hours': 0, 'mins': 0,
+                           'source_builds': False, 'student_tests_build': False, 'student_tests_ratio': 0.0,
+                           'instructor_tests_ratio': 0.0, 'grade': 'TBD', 'notes': notes,
+                           'student_tests_failed': '', 'instructor_tests_failed': ''})
 
     def record_grade(self, ginfo):
-        """Writes a grade record to the memory-based gradebook.
-        :param ginfo: Dictionary containing the grade record info."""
+        """Writes a grade record to the gradebook and, if there is one, the grade store.
+        :param ginfo: Dictionary containing the grade record info. Keys that are not columns are ignored by the
+        gradebook file; the grade store also keeps student_test_results, instructor_test_results, grading_secs
+        and the GradeStore.GRADE_KEYS."""
         grade_record = []
         for col in GradeBook.COLS:
             grade_record.append(ginfo[col])
-        self._gradesheet.append(grade_record)
+        if self._grade_store is not None:
+            self._grade_store.record_grade(self._run_id, ginfo)
+        self._append_grade_record(grade_record)
+
+    def _append_grade_record(self, grade_record):
+        """Appends a grade record to the gradebook file, once the records before it in the roster are written.
+        Safe to call from multiple threads.
+        :param grade_record: List of column values, in COLS order"""
+        email = grade_record[GradeBook.COLS.index('email')]
+        with self._lock:
+            if self._roster_positions.get(email, -1) < self._next:
+                self._write_record(grade_record)    # not in the roster, or its turn is over
+                return
+            self._pending[email] = grade_record
+            while self._next < len(self._roster) and self._roster[self._next] in self._pending:
+                self._write_record(self._pending.pop(self._roster[self._next]))
+                self._next += 1
 
     def save(self):
-        """Saves the memory-based gradebook to the local machine as a CSV file."""
+        """Finishes the gradebook file: writes the records still waiting for earlier roster entries that were
+        never recorded, in roster order, and closes the file."""
+        with self._lock:
+            for email in self._roster[self._next:]:
+                if email in self._pending:
+                    self._write_record(self._pending.pop(email))
+            self._next = len(self._roster)
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+                self._writer = None
+        if self._grade_store is not None:
+            self._grade_store.finish_run(self._run_id)
+
+    def _write_record(self, grade_record):
+        """Writes a record to the gradebook file and flushes it to disk, opening the file on first use. Called
+        with the lock held.
+        :param grade_record: List of column values, in COLS order"""
         try:
-            with open(self._file_name, mode='wt', encoding='utf-8') as thefile:
-                writer = csv.writer(thefile, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
-                for grade_record in self._gradesheet:
-                    writer.writerow(grade_record)
+            if self._file is None:
+                is_new = not os.path.exists(self._file_name) or os.path.getsize(self._file_name) == 0
+                self._file = open(self._file_name, mode='at', encoding='utf-8', newline='')
+                self._writer = csv.writer(self._file, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+                if is_new:
+                    self._writer.writerow(GradeBook.COLS)
+            self._writer.writerow(grade_record)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._graded_emails.add(grade_record[GradeBook.COLS.index('email')])
         except FileNotFoundError:
             self._logger.warning("Cannot open gradebook file {}. Check that directory exists."
                                  .format(self._file_name))
 
+    def _resume_file(self, proctor_working_dir, project_name):
+        """Prepares the newest gradebook file of the project for appending. A record cut short by a crash is
+        removed, as are the records of students who could not be graded, e.g., because the server was unavailable,
+        so that they're graded again. The emails of the remaining records are remembered so that they're not.
+        :param proctor_working_dir: Proctor's working directory
+        :param project_name: Project being graded
+        :returns The newest gradebook's file name, or None if there's no gradebook to resume."""
+        versions = []
+        for path in Path(os.sep.join([proctor_working_dir, project_name])).glob('grades-*.csv'):
+            match = re.fullmatch(r'grades-(\d+)\.csv', path.name)
+            if match:
+                versions.append((int(match.group(1)), path))
+        if not versions:
+            return None
+        path = max(versions)[1]
+
+        with open(path, encoding='utf-8', newline='') as f:
+            content = f.read()
+        rows = list(csv.reader(io.StringIO(content, newline='')))
+        if not rows or rows[0] != GradeBook.COLS:
+            self._logger.warning(f'Cannot resume {path}: its columns differ from this version of Proctor. '
+                                 'Starting a new gradebook.')
+            return None
+        records = rows[1:]
+        if content and not content.endswith('\n') and records:
+            records = records[:-1]      # the last record was cut short
+        notes_col = GradeBook.COLS.index('notes')
+        records = [record for record in records if len(record) == len(GradeBook.COLS) and
+                   not record[notes_col].startswith(GradeBook._REGRADE_NOTES)]
+
+        # Rewrite the records to keep, so that appended records start on a fresh line
+        with PathManager.replacing_file(str(path)) as tmp_file_name:
+            with open(tmp_file_name, mode='wt', encoding='utf-8', newline='') as f:
+                writer = csv.writer(f, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+                writer.writerow(GradeBook.COLS)
+                writer.writerows(records)
+
+        email_col = GradeBook.COLS.index('email')
+        self._graded_emails = {record[email_col] for record in records}
+        self._logger.info(f'Resuming {path}: {len(self._graded_emails)} students already graded')
+        return str(path)
+
     def _init_file_name(self, proctor_working_dir, project_name):
         """Determines the file name under which the gradebook will be stored. The format is grades-N.csv where
         N is the 'version' of the file. This prevents accidental overwrite of an existing gradebook file.
@@ -1,20 +1,40 @@
+import threading
+import time
 from datetime import datetime as dt
+from buildcache import BuildCache
+from commitdates import CommitDateProvider
+from localrepo import LocalRepo
 from pathmgr import PathManager
 from ploggerfactory import ProctorLoggerFactory
 from pconfig import ProctorConfig
+from utrunner import TestRunLimitError
 
 class Grader:
     """Runs units tests using JUnit and determines the ratio of passed/total, e.g., 10/15"""
 
-    def __init__(self, builder, testrunner, gradebook):
+    def __init__(self, builder, testrunner, gradebook, build_cache=None, instructor_suite_jar=None,
+                 suite_hash=None, incremental=False):
         """Initializes the Grader.
         :param builder: Builder instance that compiles Java source and tests.
         :param testrunner: UnitTestRunner that executes JUnit-based tests via shell commands.
-        :param gradebook: GradeBook the records and saves the grades per application run."""
+        :param gradebook: GradeBook the records and saves the grades per application run.
+        :param build_cache: BuildCache used to skip rebuilding unchanged projects. None disables caching.
+        :param instructor_suite_jar: Jar holding the instructor test suite, built once per grading run by
+        InstructorSuite. None to run the precompiled suite in instructor_test_suite_dir.
+        :param suite_hash: Hash of the instructor test suite, recorded with each grade. None if unknown.
+        :param incremental: True to copy forward the grade of an earlier run that graded the same commit, sources
+        and instructor suite, instead of grading the project again"""
         self._logger = ProctorLoggerFactory.getLogger()
         self._builder = builder
         self._testrunner = testrunner
         self._gradebook = gradebook
+        self._build_cache = build_cache
+        self._instructor_suite_jar = instructor_suite_jar
+        self._suite_hash = suite_hash
+        self._incremental = incremental
+        self._num_unchanged = 0
+        self._instructor_test_durations = {}   # test name -> list of durations in ms, across all students
+        self._durations_lock = threading.Lock()
 
     def grade(self, email, project_name, dir_to_grade, project_due_dt, latest_commit_dt):
         """Grades a project for the specified owner (email).
@@ -22,7 +42,9 @@ class Grader:
         :param project_name: Name of the project being graded
         :param dir_to_grade: Root of directory tree containing project files
         :param project_due_dt: Project due datetime in UTC
-        :param latest_commit_dt: Project's most recent commit datetime from server in UTC"""
+        :param latest_commit_dt: Project's most recent commit datetime, from the clone or the server"""
+
+        start = time.monotonic()
 
         # Determines if the project is on time based on due datetime vs. latest commit datetime
         is_ontime, days, hours, mins = self._get_dt_diff_human_readable(project_due_dt, latest_commit_dt)
@@ -32,18 +54,24 @@ class Grader:
                       'due_dt': project_due_dt, 'latest_commit_dt': latest_commit_dt,
                       'is_ontime': is_ontime, 'days': days, 'hours': hours, 'mins': mins}
 
+        # What's being graded: an earlier grade with the same keys and due date can be copied forward
+        grade_keys = {'head_sha': LocalRepo(dir_to_grade).get_head_sha(),
+                      'source_hash': BuildCache.compute_source_hash(project_name, dir_to_grade),
+                      'suite_hash': self._suite_hash}
+        grade_info.update(grade_keys)
+        if self._incremental and self._copy_unchanged_grade(grade_info, grade_keys, start):
+            return
+
         # Running list of notes
-        notes = ''
+        notes = []
 
-        # Build source
-        self._logger.debug(f'Building source: {dir_to_grade}')
-        build_source_errors = self._builder.build_source(email, project_name, dir_to_grade)
-        grade_info.update({'source_builds': build_source_errors == 0})
+        # Names of failed tests, filled in below if the tests run
+        grade_info.update({'student_tests_failed': '', 'instructor_tests_failed': ''})
 
-        # Build student unit tests
+        # Build source and student unit tests
+        build_source_errors, build_tests_errors = self._build(email, project_name, dir_to_grade)
+        grade_info.update({'source_builds': build_source_errors == 0})
         if build_source_errors == 0:
-            self._logger.debug(f'Building student unit tests: {dir_to_grade}')
-            build_tests_errors = self._builder.build_tests(email, project_name, dir_to_grade)
             grade_info.update({'student_tests_build': build_tests_errors == 0})
         else:
             grade_info.update({'student_tests_build': 'NA'})
@@ -52,12 +80,18 @@ class Grader:
         if build_source_errors == 0 and build_tests_errors == 0:
             test_class_name = PathManager.get_student_test_class(project_name)
             if test_class_name and len(test_class_name) > 0:
-                num_tests_run, test_ratio = \
-                    self._run_project_unit_tests(email, project_name, dir_to_grade, test_class_name)
-                if num_tests_run > 0:
-                    grade_info.update({'student_tests_ratio': test_ratio})
-                else:
-                    grade_info.update({'student_tests_ratio': 'No tests run. Check configuration file for proper test suite name.'})
+                try:
+                    num_tests_run, test_ratio, test_results = \
+                        self._run_project_unit_tests(email, project_name, dir_to_grade, test_class_name)
+                    grade_info.update({'student_test_results': test_results,
+                                       'student_tests_failed': self._get_failed_test_names(test_results)})
+                    if num_tests_run > 0:
+                        grade_info.update({'student_tests_ratio': test_ratio})
+                    else:
+                        grade_info.update({'student_tests_ratio': 'No tests run. Check configuration file for proper test suite name.'})
+                except TestRunLimitError as ex:
+                    grade_info.update({'student_tests_ratio': ex.outcome})
+                    notes.append(str(ex))
             else:
                 self._logger.warning('Missing unit test class. No tests specified.')
                 grade_info.update({'student_tests_ratio': 'No tests specified. Check configuration file.'})
@@ -68,20 +102,30 @@ class Grader:
         # Run instructor (external) unit tests if there is an instructor test class defined in
         # the Proctor configuration file
         #
-        # Note: The instructor unit test are assumed to have been compiled and ready to run
-        # against the project. We do not build the instructor's tests. This could be added
-        # as a feature in the future, should it prove necessary or valuable.
+        # Note: The instructor unit tests are built once per grading run (see InstructorSuite) and every
+        # student's run references the same jar. If the suite has no sources, the tests are assumed to have
+        # been compiled and ready to run against the project.
 
         if build_source_errors == 0:
             suite_dir, suite_class = PathManager.get_instructor_test_suite(project_name)
-            if PathManager.instructor_test_suite_exists(suite_dir, suite_class):
+            if self._instructor_suite_jar is not None:
+                suite_dir = self._instructor_suite_jar
+            if self._instructor_suite_jar is not None or \
+                    PathManager.instructor_test_suite_exists(suite_dir, suite_class):
                 self._logger.info(f'Running instructor unit tests: {suite_dir}:{suite_class}')
-                num_tests_run, test_ratio = \
-                    self._run_instructor_unit_tests(email, project_name, dir_to_grade, suite_dir, suite_class)
-                if num_tests_run > 0:
-                    grade_info.update({'instructor_tests_ratio': test_ratio})
-                else:
-                    grade_info.update({'instructor_tests_ratio': 'No tests run!'})
+                try:
+                    num_tests_run, test_ratio, test_results = \
+                        self._run_instructor_unit_tests(email, project_name, dir_to_grade, suite_dir, suite_class)
+                    grade_info.update({'instructor_test_results': test_results,
+                                       'instructor_tests_failed': self._get_failed_test_names(test_results)})
+                    self._record_instructor_test_durations(test_results)
+                    if num_tests_run > 0:
+                        grade_info.update({'instructor_tests_ratio': test_ratio})
+                    else:
+                        grade_info.update({'instructor_tests_ratio': 'No tests run!'})
+                except TestRunLimitError as ex:
+                    grade_info.update({'instructor_tests_ratio': ex.outcome})
+                    notes.append(str(ex))
             else:
                 self._logger.warning('No instructor unit tests specified in the configuration file. Continuing.')
                 grade_info.update({'instructor_tests_ratio': 'No tests specified. Check configuration file.'})
@@ -91,9 +135,66 @@ class Grader:
 
         # Record the results of grading this user's project in the gradebook.
         grade_info.update({'grade': 'TBD'})
-        grade_info.update({'notes': notes})
+        grade_info.update({'notes': '; '.join(notes)})
+        grade_info.update({'grading_secs': round(time.monotonic() - start, 3)})
         self._gradebook.record_grade(grade_info)
 
+    def get_num_unchanged(self):
+        """Returns the number of students whose earlier grades were copied forward instead of graded again.
+        :returns Number of students."""
+        with self._durations_lock:
+            return self._num_unchanged
+
+    def _copy_unchanged_grade(self, grade_info, grade_keys, start):
+        """Records the earlier grade of the same commit, sources and instructor suite, if there's one. The dates
+        and lateness come from this run, in case the latest commit date comes from the server.
+        :param grade_info: This run's grade record so far, with the dates and grade keys
+        :param grade_keys: Dictionary with the head_sha, source_hash and suite_hash of what's being graded
+        :param start: time.monotonic() when grading started
+        :returns True if an earlier grade was recorded."""
+        if not grade_keys['head_sha']:
+            return False
+        previous = self._gradebook.find_unchanged_grade(grade_info['email'], grade_keys)
+        if previous is None:
+            return False
+        self._logger.info(f"Unchanged since run {previous['run_id']} (commit {grade_keys['head_sha'][:12]}). "
+                          f"Copying its grade.")
+        previous.update(grade_info)
+        previous.update({'grading_secs': round(time.monotonic() - start, 3)})
+        self._record_instructor_test_durations(previous.get('instructor_test_results') or [])
+        with self._durations_lock:
+            self._num_unchanged += 1
+        self._gradebook.record_grade(previous)
+        return True
+
+    def _build(self, email, project_name, dir_to_grade):
+        """Builds the project source and, if the source builds, the student unit tests. If the project's files
+        are unchanged since a previous build, restores that build from the build cache instead.
+        :param email: Project owner's email
+        :param project_name: Name of the project being graded
+        :param dir_to_grade: Root of directory tree containing project files
+        :returns Tuple (source build errors, test build errors). Test build errors is None if the source
+        failed to build."""
+        cache_key = None
+        if self._build_cache is not None:
+            cache_key = self._build_cache.compute_key(project_name, dir_to_grade)
+            cached_errors = self._build_cache.restore(cache_key, project_name, dir_to_grade)
+            if cached_errors is not None:
+                self._logger.info(f'Build restored from cache: {email}')
+                return cached_errors
+
+        self._logger.debug(f'Building source: {dir_to_grade}')
+        build_source_errors = self._builder.build_source(email, project_name, dir_to_grade)
+
+        build_tests_errors = None
+        if build_source_errors == 0:
+            self._logger.debug(f'Building student unit tests: {dir_to_grade}')
+            build_tests_errors = self._builder.build_tests(email, project_name, dir_to_grade)
+
+        if cache_key is not None:
+            self._build_cache.store(cache_key, project_name, dir_to_grade, build_source_errors, build_tests_errors)
+        return (build_source_errors, build_tests_errors)
+
     def _run_instructor_unit_tests(self, email, project_name, dir_to_grade, suite_dir, suite_class):
         """Runs the project's unit test. Assumes JUnit as testing framework.
           :param email: Project owner's email
@@ -101,7 +202,8 @@ class Grader:
           :param dir_to_grade: Root of directory tree where project files live
           :param suite_dir: Full path to the JUnit test suite, e.g., MyTests, sans the .class extension
           :param suite_class: The full package.class name of the test suite class, sans the .class extension
-          :returns Ratio of passed tests/all tests as a float. 1.0 means all tests passed."""
+          :returns Tuple (number of tests run, ratio of passed tests/all tests as a float, list of TestCaseResult).
+          A ratio of 1.0 means all tests passed."""
         return \
             self._testrunner.run_instructor_unit_tests(email, project_name, dir_to_grade, suite_dir, suite_class)
 
@@ -111,20 +213,43 @@ class Grader:
         :param project_name: Project being graded
         :param dir_to_grade: Root of directory tree where project files live
         :param test_class_name: Name of the JUnit test suite, e.g., TestSuite, sans the .class extention
-        :returns Ratio of passed tests/all tests as a float. 1.0 means all tests passed."""
+        :returns Tuple (number of tests run, ratio of passed tests/all tests as a float, list of TestCaseResult).
+        A ratio of 1.0 means all tests passed."""
         return \
             self._testrunner.run_project_unit_tests(email, project_name, dir_to_grade, test_class_name)
 
+    def get_slowest_instructor_tests(self, count):
+        """Returns the instructor tests that took longest, on average, across all students graded so far.
+        :param count: Maximum number of tests to return
+        :returns List of tuples (test name, average duration in ms, number of runs), slowest first."""
+        with self._durations_lock:
+            averages = [(name, sum(durations) // len(durations), len(durations))
+                        for name, durations in self._instructor_test_durations.items()]
+        return sorted(averages, key=lambda average: average[1], reverse=True)[:count]
+
+    def _record_instructor_test_durations(self, test_results):
+        """Adds the durations of one student's instructor tests to the running per-test totals.
+        :param test_results: List of TestCaseResult"""
+        with self._durations_lock:
+            for test_result in test_results:
+                if test_result.status in ('PASS', 'FAIL'):
+                    self._instructor_test_durations.setdefault(test_result.name, []).append(test_result.duration_ms)
+
+    def _get_failed_test_names(self, test_results):
+        """Lists the names of failed tests.
+        :param test_results: List of TestCaseResult
+        :returns Names of failed tests (Class#method), separated by ';'."""
+        return ';'.join(test_result.name for test_result in test_results if test_result.status == 'FAIL')
+
     def _get_dt_diff_human_readable(self, project_due_date, latest_commit_date):
         """Calculates the difference between project due date and user's latest commit date.
         :param project_due_date: Project due datetime in UTC
-        :param latest_commit_date: Project's latest commit date on the server in UTC
+        :param latest_commit_date: Project's latest commit date, from the clone or the server
         :returns Date difference in human-readable parts."""
 
         # All dates assumes UTC. Exmaple of project date returned from server: 2019-03-03T23:39:40.000-05:00
         dt_due = dt.strptime(project_due_date, "%Y-%m-%dT%H:%M:%S%z")
-        latest_commit_date = latest_commit_date[::-1].replace(':', '', 1)[::-1]  # remove trailing ':'
-        dt_latest = dt.strptime(latest_commit_date, "%Y-%m-%dT%H:%M:%S.%f%z")  # so that strptime can parse
+        dt_latest = CommitDateProvider.parse_commit_date(latest_commit_date)
 
         # Get the datetime difference and return a tuple in days, hrs, mins
         date_diff = dt_due - dt_latest
@@ -0,0 +1,254 @@
+import os
+import sqlite3
+import threading
+from datetime import datetime as dt
+from pathmgr import PathManager
+from pconfig import ProctorConfig
+from ploggerfactory import ProctorLoggerFactory
+from utrunner import TestCaseResult
+
+
+class GradeStore:
+    """SQLite database of every grading run, kept in Proctor's data directory as grades.db. It holds one row per
+    run, one row per student per run, and one row per test case per student per run, with test durations, so
+    that results can be compared across runs, projects and students without reading the grade book CSV files.
+    The CSV grade books are still written; GradeBook writes each record to both.
+
+    Grades recorded by the Grader also keep the keys of what was graded: the commit SHA, the source tree hash and
+    the instructor suite hash. An incremental grading run looks up a student's grade by these keys and copies it
+    forward instead of grading the unchanged project again.
+
+    Safe to use from multiple threads. Each record is committed on its own, so that, like the CSV grade book, a
+    crash loses at most the students being graded at the time."""
+
+    DB_FILE_NAME = 'grades.db'
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS runs (
+            run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            project_name TEXT NOT NULL,
+            due_dt TEXT,
+            started_at TEXT NOT NULL,
+            finished_at TEXT,
+            gradebook_file TEXT);
+        CREATE INDEX IF NOT EXISTS runs_project ON runs (project_name, run_id);
+        CREATE INDEX IF NOT EXISTS runs_gradebook ON runs (gradebook_file);
+
+        CREATE TABLE IF NOT EXISTS grades (
+            run_id INTEGER NOT NULL REFERENCES runs (run_id),
+            project_name TEXT NOT NULL,
+            email TEXT NOT NULL,
+            graded_at TEXT NOT NULL,
+            grading_secs REAL,
+            due_dt TEXT,
+            latest_commit_dt TEXT,
+            is_ontime TEXT,
+            days INTEGER,
+            hours INTEGER,
+            mins INTEGER,
+            source_builds TEXT,
+            student_tests_build TEXT,
+            student_tests_ratio TEXT,
+            instructor_tests_ratio TEXT,
+            grade TEXT,
+            notes TEXT,
+            student_tests_failed TEXT,
+            instructor_tests_failed TEXT,
+            PRIMARY KEY (run_id, email));
+        CREATE INDEX IF NOT EXISTS grades_email ON grades (email, project_name, run_id);
+
+        CREATE TABLE IF NOT EXISTS test_results (
+            run_id INTEGER NOT NULL,
+            email TEXT NOT NULL,
+            suite TEXT NOT NULL,
+            test_name TEXT NOT NULL,
+            status TEXT NOT NULL,
+            duration_ms INTEGER,
+            FOREIGN KEY (run_id, email) REFERENCES grades (run_id, email));
+        CREATE INDEX IF NOT EXISTS test_results_student ON test_results (run_id, email);
+        CREATE INDEX IF NOT EXISTS test_results_test ON test_results (run_id, suite, test_name);
+
+        CREATE TABLE IF NOT EXISTS grade_keys (
+            run_id INTEGER NOT NULL,
+            email TEXT NOT NULL,
+            head_sha TEXT,
+            source_hash TEXT,
+            suite_hash TEXT,
+            PRIMARY KEY (run_id, email),
+            FOREIGN KEY (run_id, email) REFERENCES grades (run_id, email));
+        CREATE INDEX IF NOT EXISTS grade_keys_sha ON grade_keys (email, head_sha);
+        """
+
+    # grades columns filled from a GradeBook record, in GradeBook.COLS naming
+    _GRADE_COLS = ['due_dt', 'latest_commit_dt', 'is_ontime', 'days', 'hours', 'mins', 'source_builds',
+                   'student_tests_build', 'student_tests_ratio', 'instructor_tests_ratio', 'grade', 'notes',
+                   'student_tests_failed', 'instructor_tests_failed']
+    GRADE_KEYS = ['head_sha', 'source_hash', 'suite_hash']
+
+    @staticmethod
+    def is_enabled():
+        """Determines if grades are stored in the database, based on the [Proctor] grade_store key.
+        :returns True unless the grade store is disabled."""
+        return ProctorConfig.get_config_bool('Proctor', 'grade_store', True)
+
+    def __init__(self, db_file_name=None):
+        """Initializes the GradeStore, creating the database if necessary.
+        :param db_file_name: Database file, or None for grades.db in Proctor's data directory"""
+        self._logger = ProctorLoggerFactory.getLogger()
+        self._db_file_name = db_file_name or os.sep.join([PathManager.get_proctor_data_dir(),
+                                                          GradeStore.DB_FILE_NAME])
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self._db_file_name, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.executescript(GradeStore._SCHEMA)
+
+    def get_file_name(self):
+        """Returns the database's file name.
+        :returns Full path name of the database file."""
+        return self._db_file_name
+
+    def start_run(self, project_name, due_dt, gradebook_file):
+        """Records the start of a grading run. If the run resumes an earlier run's grade book, the earlier run is
+        continued instead.
+        :param project_name: Name of the project being graded
+        :param due_dt: Project's due datetime
+        :param gradebook_file: Name of the grade book file the run writes
+        :returns ID of the run."""
+        with self._lock, self._db:
+            row = self._db.execute('SELECT run_id FROM runs WHERE gradebook_file = ? ORDER BY run_id DESC LIMIT 1',
+                                   (gradebook_file,)).fetchone()
+            if row is not None:
+                self._db.execute('UPDATE runs SET finished_at = NULL WHERE run_id = ?', (row['run_id'],))
+                return row['run_id']
+            cursor = self._db.execute('INSERT INTO runs (project_name, due_dt, started_at, gradebook_file) '
+                                      'VALUES (?, ?, ?, ?)', (project_name, due_dt, GradeStore._now(), gradebook_file))
+            return cursor.lastrowid
+
+    def finish_run(self, run_id):
+        """Records the end of a grading run.
+        :param run_id: ID of the run"""
+        with self._lock, self._db:
+            self._db.execute('UPDATE runs SET finished_at = ? WHERE run_id = ?', (GradeStore._now(), run_id))
+
+    def record_grade(self, run_id, ginfo):
+        """Stores a student's grade and test results, replacing any the run already has for the student.
+        :param run_id: ID of the run
+        :param ginfo: Grade record, with GradeBook.COLS keys and, optionally, student_test_results and
+        instructor_test_results lists of TestCaseResult, grading_secs and the GRADE_KEYS of what was graded"""
+        email = ginfo['email']
+        values = [GradeStore._to_db(ginfo.get(col)) for col in GradeStore._GRADE_COLS]
+        tests = [(run_id, email, suite, test.name, test.status, test.duration_ms)
+                 for suite in ('student', 'instructor')
+                 for test in ginfo.get(f'{suite}_test_results') or []]
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM test_results WHERE run_id = ? AND email = ?', (run_id, email))
+            self._db.execute('DELETE FROM grade_keys WHERE run_id = ? AND email = ?', (run_id, email))
+            self._db.execute(f"INSERT OR REPLACE INTO grades (run_id, project_name, email, graded_at, grading_secs, "
+                             f"{', '.join(GradeStore._GRADE_COLS)}) "
+                             f"VALUES ({', '.join('?' * (5 + len(GradeStore._GRADE_COLS)))})",
+                             [run_id, ginfo['project_name'], email, GradeStore._now(), ginfo.get('grading_secs')] +
+                             values)
+            self._db.executemany('INSERT INTO test_results (run_id, email, suite, test_name, status, duration_ms) '
+                                 'VALUES (?, ?, ?, ?, ?, ?)', tests)
+            if ginfo.get('head_sha'):
+                self._db.execute('INSERT INTO grade_keys (run_id, email, head_sha, source_hash, suite_hash) '
+                                 'VALUES (?, ?, ?, ?, ?)',
+                                 [run_id, email] + [ginfo.get(key) for key in GradeStore.GRADE_KEYS])
+
+    def find_unchanged_grade(self, project_name, email, due_dt, grade_keys):
+        """Finds the newest grade of a student's project that was graded with the same keys and due date.
+        :param project_name: Name of the project
+        :param email: Project owner's email
+        :param due_dt: Project's due datetime
+        :param grade_keys: Dictionary with the GRADE_KEYS of what's about to be graded
+        :returns Grade record like the one passed to record_grade, with the run_id it was found in, or None."""
+        if not grade_keys.get('head_sha'):
+            return None
+        rows = self._query('SELECT g.* FROM grades g JOIN grade_keys k ON k.run_id = g.run_id AND k.email = g.email '
+                           'WHERE k.email = ? AND k.head_sha = ? AND k.source_hash IS ? AND k.suite_hash IS ? '
+                           'AND g.project_name = ? AND g.due_dt IS ? ORDER BY g.run_id DESC LIMIT 1',
+                           (email, grade_keys['head_sha'], grade_keys.get('source_hash'),
+                            grade_keys.get('suite_hash'), project_name, due_dt))
+        if not rows:
+            return None
+        ginfo = dict(rows[0])
+        tests = self._query('SELECT suite, test_name, status, duration_ms FROM test_results '
+                            'WHERE run_id = ? AND email = ? ORDER BY rowid', (ginfo['run_id'], email))
+        for suite in ('student', 'instructor'):
+            ginfo[f'{suite}_test_results'] = [TestCaseResult(test['test_name'], test['status'], test['duration_ms'])
+                                              for test in tests if test['suite'] == suite]
+        ginfo.update(grade_keys)
+        return ginfo
+
+    def get_runs(self, project_name=None):
+        """Returns the grading runs, newest first.
+        :param project_name: Name of the project whose runs are returned, or None for all projects
+        :returns List of rows with run_id, project_name, started_at, finished_at, gradebook_file, num_students and
+        num_ontime."""
+        return self._query('SELECT r.run_id, r.project_name, r.started_at, r.finished_at, r.gradebook_file, '
+                           "COUNT(g.email) AS num_students, SUM(g.is_ontime = 'True') AS num_ontime "
+                           'FROM runs r LEFT JOIN grades g ON g.run_id = r.run_id '
+                           'WHERE ? IS NULL OR r.project_name = ? '
+                           'GROUP BY r.run_id ORDER BY r.run_id DESC', (project_name, project_name))
+
+    def get_latest_run_id(self, project_name):
+        """Returns the newest run of a project.
+        :param project_name: Name of the project
+        :returns ID of the run, or None if the project was never graded."""
+        rows = self._query('SELECT MAX(run_id) AS run_id FROM runs WHERE project_name = ?', (project_name,))
+        return rows[0]['run_id'] if rows else None
+
+    def get_run_grades(self, run_id):
+        """Returns the grades of a run, by email.
+        :param run_id: ID of the run
+        :returns List of grades rows."""
+        return self._query('SELECT * FROM grades WHERE run_id = ? ORDER BY email', (run_id,))
+
+    def get_student_history(self, email):
+        """Returns a student's grade in the newest run of each project that graded the student.
+        :param email: Project owner's email
+        :returns List of grades rows, oldest project first."""
+        return self._query('SELECT g.* FROM grades g '
+                           'JOIN (SELECT project_name, MAX(run_id) AS run_id FROM grades WHERE email = ? '
+                           '      GROUP BY project_name) latest '
+                           'ON g.run_id = latest.run_id AND g.project_name = latest.project_name '
+                           'WHERE g.email = ? ORDER BY g.run_id', (email, email))
+
+    def get_test_summary(self, run_id, suite='instructor'):
+        """Summarizes each test of a run across students.
+        :param run_id: ID of the run
+        :param suite: 'student' or 'instructor'
+        :returns List of rows with test_name, num_runs, num_failed and avg_duration_ms, most failed first."""
+        return self._query("SELECT test_name, COUNT(*) AS num_runs, SUM(status = 'FAIL') AS num_failed, "
+                           'CAST(AVG(duration_ms) AS INTEGER) AS avg_duration_ms '
+                           'FROM test_results WHERE run_id = ? AND suite = ? '
+                           'GROUP BY test_name ORDER BY num_failed DESC, avg_duration_ms DESC', (run_id, suite))
+
+    def close(self):
+        """Closes the database."""
+        with self._lock:
+            self._db.close()
+
+    def _query(self, sql, parameters):
+        """Runs a query.
+        :param sql: SELECT statement
+        :param parameters: Statement parameters
+        :returns List of rows."""
+        with self._lock:
+            return self._db.execute(sql, parameters).fetchall()
+
+    @staticmethod
+    def _to_db(value):
+        """Converts a grade record value to the form it's stored in, i.e., as written to the CSV grade book.
+        :param value: Value of a grade record column
+        :returns Value to store."""
+        if value is None or isinstance(value, (int, float, str)) and not isinstance(value, bool):
+            return value
+        return str(value)
+
+    @staticmethod
+    def _now():
+        """Returns the current local time.
+        :returns ISO 8601 date and time, to the second."""
+        return dt.now().replace(microsecond=0).isoformat()
@@ -0,0 +1,135 @@
+import hashlib
+import os
+import re
+import subprocess
+import tempfile
+import zipfile
+from pathlib import Path
+from javahelpers import JavaHelpers
+from pathmgr import PathManager
+from ploggerfactory import ProctorLoggerFactory
+
+
+class InstructorSuite:
+    """Builds a project's instructor test suite once per grading run and packages it as a jar that every
+    student's instructor test run references.
+
+    The suite's *.java files are found under the project's instructor_test_suite_dir. They're compiled against
+    one student's clone (the compiler only needs references to the classes under test) and the resulting jar is
+    kept in Proctor's data directory, keyed by the hash of the suite's sources, the classpath and the javac
+    version, so that later grading runs reuse it until the suite changes. If instructor_test_suite_dir holds no
+    *.java files, the precompiled suite in that directory is used as before."""
+
+    _MAX_BUILD_ATTEMPTS = 5     # number of student clones tried before giving up on building the suite
+
+    def __init__(self):
+        """Initializes the InstructorSuite."""
+        self._logger = ProctorLoggerFactory.getLogger()
+        self._cache_dir = PathManager.get_proctor_data_dir('instructor-suites')
+        self._suite_hash = None
+
+    def get_suite_hash(self):
+        """Returns the hash of the suite prepared by the last call to prepare: of its sources if it was built from
+        source, otherwise of the precompiled suite's class files.
+        :returns Hex digest, or None if there's no suite or it cannot be built."""
+        return self._suite_hash
+
+    def prepare(self, project_name, project_dir, emails):
+        """Builds the project's instructor test suite, or reuses a previous build of the same sources.
+        :param project_name: Name of the project being graded
+        :param project_dir: Project's directory under Proctor's working directory
+        :param emails: Owners whose clones may be compiled against, tried in order
+        :returns Full path of the suite's jar, or None if the suite has no sources or cannot be built, in which
+        case the precompiled suite in instructor_test_suite_dir, if any, is used."""
+        self._suite_hash = None
+        suite_dir, suite_class = PathManager.get_instructor_test_suite(project_name)
+        if not suite_dir or not suite_class:
+            return None
+        suite_root = Path(suite_dir)
+        java_files = sorted(suite_root.rglob('*.java')) if suite_root.is_dir() else []
+        if not java_files:
+            self._logger.debug(f'No instructor test sources in {suite_dir}. Using precompiled suite.')
+            class_files = sorted(suite_root.rglob('*.class')) if suite_root.is_dir() else []
+            if class_files:
+                self._suite_hash = self._compute_hash(suite_root, class_files)
+            return None
+
+        suite_hash = self._compute_hash(suite_root, java_files)
+        jar_file = Path(self._cache_dir) / f'{project_name}-{suite_hash[:16]}.jar'
+        if jar_file.exists():
+            self._logger.info(f'Using cached instructor test suite: {jar_file}')
+            self._suite_hash = suite_hash
+            return str(jar_file)
+
+        src_dir_name = PathManager.get_project_src_dir_name(project_name)
+        clone_src_dirs = [Path(project_dir) / email / src_dir_name for email in emails if email]
+        clone_src_dirs = [src_dir for src_dir in clone_src_dirs if src_dir.is_dir()]
+        for src_dir in clone_src_dirs[:InstructorSuite._MAX_BUILD_ATTEMPTS]:
+            if self._build_jar(java_files, suite_root, src_dir, jar_file):
+                self._logger.info(f'Built instructor test suite: {jar_file}')
+                self._remove_stale_jars(project_name, jar_file)
+                self._suite_hash = suite_hash
+                return str(jar_file)
+
+        self._logger.error(f'Cannot build instructor test suite from {suite_dir}. Using precompiled suite, if any.')
+        return None
+
+    def _compute_hash(self, suite_root, java_files):
+        """Hashes the suite's files along with everything else that affects the compiled classes.
+        :param suite_root: Root of the instructor's test sources
+        :param java_files: Sorted list of the suite's *.java files, or of its *.class files if it's precompiled
+        :returns Hex digest."""
+        digest = hashlib.sha256()
+        for java_file in java_files:
+            digest.update(java_file.relative_to(suite_root).as_posix().encode('utf-8'))
+            digest.update(b'\0')
+            digest.update(hashlib.sha256(java_file.read_bytes()).digest())
+        for part in [PathManager.get_java_classpath(), PathManager.get_junit_classpath(),
+                     JavaHelpers.get_javac_version()]:
+            digest.update(str(part).encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def _build_jar(self, java_files, suite_root, clone_src_dir, jar_file):
+        """Compiles the suite against one student's clone and packages the suite's classes as a jar.
+        :param java_files: The suite's *.java files
+        :param suite_root: Root of the instructor's test sources
+        :param clone_src_dir: Source directory of the student clone used to resolve the classes under test
+        :param jar_file: Path of the jar to create
+        :returns True if the jar was created."""
+        classpath = [cp for cp in [PathManager.get_java_classpath(), PathManager.get_junit_classpath()] if cp]
+        with tempfile.TemporaryDirectory(prefix='proctor-suite-', dir=self._cache_dir) as classes_dir:
+            # -implicit:none keeps the student's classes, which are only needed to compile against, out of the jar
+            cmd = ['javac', '-d', classes_dir, '-implicit:none',
+                   '-sourcepath', os.pathsep.join([str(suite_root), str(clone_src_dir)])]
+            if classpath:
+                cmd += ['-classpath', os.pathsep.join(classpath)]
+            result = subprocess.run(cmd + [str(f) for f in java_files], stdout=subprocess.PIPE,
+                                    stderr=subprocess.PIPE)
+            if result.returncode != 0:
+                self._logger.warning(f'Instructor test suite does not compile against {clone_src_dir}: '
+                                     f"{result.stderr.decode('utf-8', errors='replace').strip()}")
+                return False
+
+            try:
+                with PathManager.replacing_file(str(jar_file)) as tmp_jar_name:
+                    with zipfile.ZipFile(tmp_jar_name, mode='w', compression=zipfile.ZIP_DEFLATED) as jar:
+                        jar.writestr('META-INF/MANIFEST.MF', 'Manifest-Version: 1.0\r\nCreated-By: Proctor\r\n\r\n')
+                        for class_file in sorted(Path(classes_dir).rglob('*.class')):
+                            jar.write(str(class_file), class_file.relative_to(classes_dir).as_posix())
+            except OSError as ex:
+                self._logger.warning(f'Cannot write instructor test suite jar: {ex}')
+                return False
+        return True
+
+    def _remove_stale_jars(self, project_name, current_jar_file):
+        """Removes the project's jars built from earlier versions of the suite.
+        :param project_name: Name of the project being graded
+        :param current_jar_file: Path of the jar just built, which is kept"""
+        jar_name_pattern = re.compile(re.escape(project_name) + r'-[0-9a-f]{16}\.jar')
+        for jar_file in Path(self._cache_dir).glob(f'{project_name}-*.jar'):
+            if jar_name_pattern.fullmatch(jar_file.name) and jar_file != current_jar_file:
+                try:
+                    jar_file.unlink()
+                except OSError:
+                    pass    # Possibly in use by a concurrent run; removed next time
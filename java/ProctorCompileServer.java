@@ -0,0 +1,93 @@
+import java.io.BufferedReader;
+import java.io.InputStreamReader;
+import java.io.OutputStreamWriter;
+import java.io.PrintWriter;
+import java.nio.charset.StandardCharsets;
+import java.util.ArrayList;
+import java.util.List;
+import java.util.Locale;
+import javax.tools.Diagnostic;
+import javax.tools.DiagnosticCollector;
+import javax.tools.JavaCompiler;
+import javax.tools.JavaFileObject;
+import javax.tools.StandardJavaFileManager;
+import javax.tools.ToolProvider;
+
+/**
+ * Long-lived compile server used by Proctor's Builder. Keeps a warm JVM and compiler across students so that
+ * each compilation avoids JVM startup and JIT warmup.
+ *
+ * The protocol is line-based UTF-8 over stdin/stdout. A request looks like:
+ *
+ *   COMPILE
+ *   OPT -classpath
+ *   OPT .:src:junit4.jar
+ *   FILE src/edu/wit/Foo.java
+ *   END
+ *
+ * The server answers with zero or more diagnostics followed by a result line:
+ *
+ *   DIAG ERROR\tsrc/edu/wit/Foo.java\t12\tcannot find symbol
+ *   RESULT FAILED
+ *
+ * Tabs, newlines and backslashes inside diagnostic messages are escaped. A request that javac rejects outright,
+ * e.g., an invalid option, is answered with 'ERROR message'. QUIT (or end of input) stops the server.
+ */
+public class ProctorCompileServer {
+
+    public static void main(String[] args) throws Exception {
+        Locale.setDefault(Locale.ENGLISH);
+        JavaCompiler compiler = ToolProvider.getSystemJavaCompiler();
+        BufferedReader in = new BufferedReader(new InputStreamReader(System.in, StandardCharsets.UTF_8));
+        PrintWriter out = new PrintWriter(new OutputStreamWriter(System.out, StandardCharsets.UTF_8), false);
+
+        if (compiler == null) {
+            out.println("ERROR No system Java compiler. Run the compile server with a JDK, not a JRE.");
+            out.flush();
+            return;
+        }
+        out.println("READY");
+        out.flush();
+
+        List<String> options = new ArrayList<>();
+        List<String> files = new ArrayList<>();
+        String line;
+        while ((line = in.readLine()) != null) {
+            if (line.equals("QUIT")) {
+                break;
+            } else if (line.equals("COMPILE")) {
+                options.clear();
+                files.clear();
+            } else if (line.startsWith("OPT ")) {
+                options.add(line.substring(4));
+            } else if (line.startsWith("FILE ")) {
+                files.add(line.substring(5));
+            } else if (line.equals("END")) {
+                compile(compiler, options, files, out);
+                out.flush();
+            }
+        }
+    }
+
+    private static void compile(JavaCompiler compiler, List<String> options, List<String> files, PrintWriter out) {
+        DiagnosticCollector<JavaFileObject> diagnostics = new DiagnosticCollector<>();
+        // A fresh file manager per request keeps one student's -sourcepath or -classpath from leaking into the next
+        try (StandardJavaFileManager fileManager =
+                     compiler.getStandardFileManager(diagnostics, Locale.ENGLISH, StandardCharsets.UTF_8)) {
+            Iterable<? extends JavaFileObject> units = fileManager.getJavaFileObjectsFromStrings(files);
+            boolean ok = compiler.getTask(null, fileManager, diagnostics, options, null, units).call();
+            for (Diagnostic<? extends JavaFileObject> d : diagnostics.getDiagnostics()) {
+                String source = d.getSource() == null ? "" : d.getSource().getName();
+                out.println("DIAG " + d.getKind() + "\t" + escape(source) + "\t" + d.getLineNumber() + "\t"
+                        + escape(d.getMessage(Locale.ENGLISH)));
+            }
+            out.println("RESULT " + (ok ? "OK" : "FAILED"));
+        } catch (Exception ex) {
+            out.println("ERROR " + escape(String.valueOf(ex)));
+        }
+    }
+
+    private static String escape(String s) {
+        return s.replace("\\", "\\\\").replace("\t", "\\t").replace("\r", "").replace("\n", "\\n");
+    }
+}
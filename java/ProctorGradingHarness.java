@@ -0,0 +1,209 @@
+import java.io.BufferedReader;
+import java.io.ByteArrayInputStream;
+import java.io.File;
+import java.io.InputStreamReader;
+import java.io.OutputStream;
+import java.io.OutputStreamWriter;
+import java.io.PrintStream;
+import java.io.PrintWriter;
+import java.io.StringWriter;
+import java.lang.management.ManagementFactory;
+import java.lang.management.MemoryUsage;
+import java.net.URL;
+import java.net.URLClassLoader;
+import java.nio.charset.StandardCharsets;
+import java.security.Permission;
+import java.util.ArrayList;
+import java.util.List;
+import org.junit.runner.JUnitCore;
+import org.junit.runner.Result;
+
+/**
+ * Long-lived JUnit harness used by Proctor's UnitTestRunner. Runs many students' test suites in one JVM, loading
+ * each student's classes in an isolated URLClassLoader, so that each run avoids JVM startup and JUnit class
+ * loading.
+ *
+ * The protocol is line-based UTF-8 over stdin/stdout. A request looks like:
+ *
+ *   RUN id\ttimeout_ms\tsuite.Class\tclasspath
+ *
+ * where classpath uses the platform's path separator. The harness answers with one line per test, in the
+ * format written by ProctorRunListener, followed by a result line:
+ *
+ *   TEST id\tstatus\tduration_ms\tname
+ *   RESULT id\tstatus\ttests_run\tfailures\trecycle\tmessage
+ *
+ * status is OK, FAILED, TIMEOUT, RESOURCE or ERROR. recycle is 1 when the harness is about to exit because it
+ * can no longer be trusted, e.g., a test hung, called System.exit or exhausted the heap, or because it has
+ * run enough suites that leaked classloaders may be piling up. QUIT (or end of input) stops the harness.
+ */
+public class ProctorGradingHarness {
+
+    /** Number of suites run before the harness asks to be recycled. Overridden by -Dproctor.harness.maxRuns. */
+    private static final int MAX_RUNS = Integer.getInteger("proctor.harness.maxRuns", 50);
+
+    /** Fraction of the maximum heap still in use after a run (and a GC) at which the harness asks to be recycled. */
+    private static final double MAX_HEAP_FRACTION = 0.75;
+
+    private static volatile boolean exitAttempted = false;
+    private static volatile boolean shuttingDown = false;
+
+    public static void main(String[] args) throws Exception {
+        BufferedReader in = new BufferedReader(new InputStreamReader(System.in, StandardCharsets.UTF_8));
+        PrintWriter out = new PrintWriter(new OutputStreamWriter(System.out, StandardCharsets.UTF_8), false);
+
+        // Students' tests must not read our requests or write into our responses
+        System.setIn(new ByteArrayInputStream(new byte[0]));
+        PrintStream sink = new PrintStream(new OutputStream() {
+            @Override
+            public void write(int b) {
+            }
+        });
+        System.setOut(sink);
+        System.setErr(sink);
+        installExitGuard();
+
+        out.println("READY");
+        out.flush();
+
+        int runs = 0;
+        String line;
+        while ((line = in.readLine()) != null) {
+            if (line.equals("QUIT")) {
+                break;
+            }
+            if (!line.startsWith("RUN ")) {
+                continue;
+            }
+            String[] fields = line.substring(4).split("\t", 4);
+            String id = fields[0];
+            long timeoutMs = Long.parseLong(fields[1]);
+            String suiteClass = fields[2];
+            String classpath = fields[3];
+
+            StringWriter tests = new StringWriter();
+            String[] result = run(suiteClass, classpath, timeoutMs, new PrintWriter(tests));
+            runs++;
+            for (String test : tests.toString().split("\n")) {
+                if (test.startsWith("TEST\t")) {
+                    out.println("TEST " + id + test.substring(4));
+                }
+            }
+            boolean recycle = result[3] != null || exitAttempted || runs >= MAX_RUNS || heapIsFilling();
+            out.println("RESULT " + id + "\t" + result[0] + "\t" + result[1] + "\t" + result[2] + "\t"
+                    + (recycle ? "1" : "0") + "\t" + escape(result[4]));
+            out.flush();
+            if (recycle) {
+                break;
+            }
+        }
+        // Threads left behind by a hung test must not keep the JVM alive
+        shuttingDown = true;
+        Runtime.getRuntime().halt(0);
+    }
+
+    /**
+     * Runs a suite in its own classloader and thread. Per-test results are written to tests.
+     * @return status, tests run, failures, non-null if the harness must be recycled, message
+     */
+    private static String[] run(String suiteClass, String classpath, long timeoutMs, PrintWriter tests) {
+        URLClassLoader loader = null;
+        try {
+            loader = new URLClassLoader(toUrls(classpath), ProctorGradingHarness.class.getClassLoader());
+            final ClassLoader suiteLoader = loader;
+            final Result[] result = new Result[1];
+            final Throwable[] failure = new Throwable[1];
+            // The suite is loaded on the runner thread so that a static initializer that hangs is timed out too
+            Thread runner = new Thread(() -> {
+                try {
+                    Class<?> suite = Class.forName(suiteClass, true, suiteLoader);
+                    JUnitCore core = new JUnitCore();
+                    core.addListener(new ProctorRunListener(tests));
+                    result[0] = core.run(suite);
+                } catch (Throwable t) {
+                    failure[0] = t;
+                }
+            }, "proctor-suite-runner");
+            runner.setDaemon(true);
+            runner.setContextClassLoader(loader);
+            exitAttempted = false;
+            runner.start();
+            runner.join(timeoutMs);
+
+            if (runner.isAlive()) {
+                return new String[] {"TIMEOUT", "0", "0", "hung", "Timed out after " + timeoutMs + " ms"};
+            }
+            if (failure[0] instanceof OutOfMemoryError) {
+                return new String[] {"RESOURCE", "0", "0", "oom", String.valueOf(failure[0])};
+            }
+            if (failure[0] != null) {
+                return new String[] {"ERROR", "0", "0", null, String.valueOf(failure[0])};
+            }
+            Result r = result[0];
+            return new String[] {r.wasSuccessful() ? "OK" : "FAILED", String.valueOf(r.getRunCount()),
+                    String.valueOf(r.getFailureCount()), null, ""};
+        } catch (OutOfMemoryError e) {
+            return new String[] {"RESOURCE", "0", "0", "oom", String.valueOf(e)};
+        } catch (Throwable t) {
+            return new String[] {"ERROR", "0", "0", null, String.valueOf(t)};
+        } finally {
+            if (loader != null) {
+                try {
+                    loader.close();
+                } catch (Exception ignored) {
+                    // Nothing more we can do; the harness is recycled periodically anyway
+                }
+            }
+        }
+    }
+
+    private static URL[] toUrls(String classpath) throws Exception {
+        List<URL> urls = new ArrayList<>();
+        for (String entry : classpath.split(File.pathSeparator)) {
+            if (!entry.isEmpty()) {
+                urls.add(new File(entry).toURI().toURL());
+            }
+        }
+        return urls.toArray(new URL[0]);
+    }
+
+    private static boolean heapIsFilling() {
+        System.gc();
+        MemoryUsage heap = ManagementFactory.getMemoryMXBean().getHeapMemoryUsage();
+        return heap.getMax() > 0 && heap.getUsed() > MAX_HEAP_FRACTION * heap.getMax();
+    }
+
+    /**
+     * Turns System.exit calls made by tests into SecurityExceptions, which JUnit reports as test failures. Newer
+     * JVMs no longer allow installing a SecurityManager; there, System.exit ends the harness and Proctor recycles it.
+     */
+    @SuppressWarnings("removal")
+    private static void installExitGuard() {
+        try {
+            System.setSecurityManager(new SecurityManager() {
+                @Override
+                public void checkExit(int status) {
+                    if (shuttingDown) {
+                        return;
+                    }
+                    exitAttempted = true;
+                    throw new SecurityException("System.exit(" + status + ") is not allowed while grading");
+                }
+
+                @Override
+                public void checkPermission(Permission perm) {
+                }
+
+                @Override
+                public void checkPermission(Permission perm, Object context) {
+                }
+            });
+        } catch (UnsupportedOperationException | SecurityException e) {
+            // Not supported by this JVM
+        }
+    }
+
+    private static String escape(String s) {
+        return s.replace("\\", "\\\\").replace("\t", "\\t").replace("\r", "").replace("\n", "\\n");
+    }
+}
@@ -0,0 +1,100 @@
+import java.io.FileOutputStream;
+import java.io.OutputStreamWriter;
+import java.io.PrintWriter;
+import java.nio.charset.StandardCharsets;
+import java.util.HashMap;
+import java.util.Map;
+import org.junit.internal.TextListener;
+import org.junit.runner.Description;
+import org.junit.runner.JUnitCore;
+import org.junit.runner.Result;
+import org.junit.runner.notification.Failure;
+import org.junit.runner.notification.RunListener;
+
+/**
+ * JUnit RunListener that writes compact, machine-readable results for Proctor, one tab-separated line per test
+ * followed by a summary line:
+ *
+ *   TEST\tstatus\tduration_ms\tname
+ *   SUMMARY\ttests_run\tfailures\tignored\tduration_ms
+ *
+ * status is PASS, FAIL, SKIP (assumption failure) or IGNORED, and name is Class#method. Tabs, newlines and
+ * backslashes in names are escaped.
+ *
+ * Also usable as a drop-in replacement for JUnitCore's command line:
+ *
+ *   java ProctorRunListener results-file suite.Class
+ *
+ * which prints JUnit's usual console output and writes the results to results-file.
+ */
+public class ProctorRunListener extends RunListener {
+
+    private final PrintWriter out;
+    private final Map<Description, Long> startTimes = new HashMap<>();
+    private final Map<Description, String> statuses = new HashMap<>();
+
+    public ProctorRunListener(PrintWriter out) {
+        this.out = out;
+    }
+
+    public static void main(String[] args) throws Exception {
+        if (args.length != 2) {
+            System.err.println("usage: ProctorRunListener results-file suite.Class");
+            System.exit(2);
+        }
+        Result result;
+        try (PrintWriter out = new PrintWriter(new OutputStreamWriter(new FileOutputStream(args[0]),
+                StandardCharsets.UTF_8))) {
+            JUnitCore core = new JUnitCore();
+            core.addListener(new TextListener(System.out));
+            core.addListener(new ProctorRunListener(out));
+            result = core.run(Class.forName(args[1]));
+        }
+        System.exit(result.wasSuccessful() ? 0 : 1);
+    }
+
+    @Override
+    public synchronized void testStarted(Description description) {
+        startTimes.put(description, System.nanoTime());
+        statuses.put(description, "PASS");
+    }
+
+    @Override
+    public synchronized void testFailure(Failure failure) {
+        statuses.put(failure.getDescription(), "FAIL");
+    }
+
+    @Override
+    public synchronized void testAssumptionFailure(Failure failure) {
+        statuses.put(failure.getDescription(), "SKIP");
+    }
+
+    @Override
+    public synchronized void testIgnored(Description description) {
+        writeTest("IGNORED", 0, description);
+    }
+
+    @Override
+    public synchronized void testFinished(Description description) {
+        Long start = startTimes.remove(description);
+        long durationMs = start == null ? 0 : (System.nanoTime() - start) / 1000000;
+        writeTest(statuses.remove(description), durationMs, description);
+    }
+
+    @Override
+    public synchronized void testRunFinished(Result result) {
+        out.println("SUMMARY\t" + result.getRunCount() + "\t" + result.getFailureCount() + "\t"
+                + result.getIgnoreCount() + "\t" + result.getRunTime());
+        out.flush();
+    }
+
+    private void writeTest(String status, long durationMs, Description description) {
+        String name = description.getClassName() + "#" + description.getMethodName();
+        out.println("TEST\t" + status + "\t" + durationMs + "\t" + escape(name));
+        out.flush();
+    }
+
+    private static String escape(String s) {
+        return s.replace("\\", "\\\\").replace("\t", "\\t").replace("\r", "").replace("\n", "\\n");
+    }
+}
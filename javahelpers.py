@@ -0,0 +1,73 @@
+import os
+import re
+import subprocess
+import threading
+from pathlib import Path
+from pathmgr import PathManager
+from ploggerfactory import ProctorLoggerFactory
+
+
+class JavaHelpers:
+    """Compiles and locates the small Java helper programs that ship with Proctor in its java directory.
+    The helpers are compiled on first use into Proctor's data directory and recompiled whenever any helper's
+    source is newer than the compiled class."""
+
+    _JAVA_SRC_DIR = Path(__file__).resolve().parent / 'java'
+    _lock = threading.Lock()
+    _javac_version = None
+
+    @staticmethod
+    def get_javac_version():
+        """Returns the version string reported by 'javac -version', e.g., 'javac 1.8.0_212'. The result is
+        cached for the life of the application.
+        :returns javac's version string, or 'unknown' if javac cannot be run."""
+        if JavaHelpers._javac_version is None:
+            try:
+                result = subprocess.run(['javac', '-version'], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+                JavaHelpers._javac_version = result.stdout.decode('utf-8', errors='replace').strip()
+            except OSError:
+                JavaHelpers._javac_version = 'unknown'
+        return JavaHelpers._javac_version
+
+    @staticmethod
+    def get_helper_classpath(class_name, compile_classpath=None):
+        """Returns the classpath entry from which the given helper class can be loaded, compiling it if needed.
+        :param class_name: Name of the helper class, which is also the name of its .java file, e.g., ProctorCompileServer
+        :param compile_classpath: Classpath needed to compile the helper, e.g., JUnit. May be None.
+        :returns Directory that contains the compiled helper class
+        :raises RuntimeError if the helper cannot be compiled"""
+        helper_dir = PathManager.get_proctor_data_dir('java')
+        src_file = JavaHelpers._JAVA_SRC_DIR / f'{class_name}.java'
+        class_file = Path(helper_dir) / f'{class_name}.class'
+
+        # Helpers may use one another, so any change to a helper's source recompiles them
+        newest_src_mtime = max(f.stat().st_mtime for f in JavaHelpers._JAVA_SRC_DIR.glob('*.java'))
+
+        with JavaHelpers._lock:
+            if class_file.exists() and class_file.stat().st_mtime >= newest_src_mtime:
+                return helper_dir
+
+            logger = ProctorLoggerFactory.getLogger()
+            logger.debug(f'Compiling Proctor helper: {class_name}')
+            cmd = ['javac', '-d', helper_dir, '-sourcepath', str(JavaHelpers._JAVA_SRC_DIR)]
+            if compile_classpath:
+                cmd += ['-classpath', compile_classpath]
+            result = subprocess.run(cmd + [str(src_file)], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            if result.returncode != 0:
+                raise RuntimeError(f'Cannot compile Proctor helper {class_name}: '
+                                   f"{result.stderr.decode('utf-8', errors='replace')}")
+        return helper_dir
+
+    @staticmethod
+    def unescape(s):
+        """Reverses the escaping the helpers apply to tabs, newlines and backslashes in the lines they write.
+        :param s: Escaped string
+        :returns Unescaped string"""
+        return re.sub(r'\\(.)', lambda m: {'t': '\t', 'n': '\n'}.get(m.group(1), m.group(1)), s)
+
+    @staticmethod
+    def get_helper_log_file_name(class_name):
+        """Returns the name of the file to which a helper's stderr is redirected.
+        :param class_name: Name of the helper class
+        :returns Full path name of the helper's log file."""
+        return os.sep.join([PathManager.get_proctor_data_dir('java'), f'{class_name}.log'])
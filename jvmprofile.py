@@ -0,0 +1,176 @@
+import json
+import os
+import re
+import shlex
+import statistics
+import subprocess
+import threading
+import time
+from pathlib import Path
+from pathmgr import PathManager
+from pconfig import ProctorConfig
+from ploggerfactory import ProctorLoggerFactory
+
+
+class JvmProfile:
+    """JVM options applied to every java and javac process Proctor starts.
+
+    The options come from the [Proctor] jvm_flags key, e.g., '-XX:TieredStopAtLevel=1 -XX:+UseSerialGC', which
+    trade peak performance for faster startup. In addition, 'proctor jvm-warmup' creates an Application Class
+    Data Sharing (AppCDS) archive of the JUnit classes. Once it exists, java processes whose classpath starts
+    with the JUnit classpath map the archive instead of loading and verifying those classes on every start.
+    The archive is only used with the JUnit classpath and java version it was created with."""
+
+    _ARCHIVE_FILE_NAME = 'junit.jsa'
+    _CLASS_LIST_FILE_NAME = 'junit.classlist'
+    _META_FILE_NAME = 'junit.json'
+    _MIN_APPCDS_JAVA_VERSION = 11      # earlier OpenJDK releases cannot archive application classes
+    _NUM_STARTUP_SAMPLES = 5
+
+    _lock = threading.Lock()
+    _java_version = None
+    _archive_options = None
+
+    @staticmethod
+    def get_java_options():
+        """Returns the options to pass to java: the configured flags and, if a matching archive exists, the
+        options that use it. Callers must put the JUnit classpath first on the java classpath for the archive to
+        apply.
+        :returns List of options."""
+        return JvmProfile.get_flags() + JvmProfile._get_archive_options()
+
+    @staticmethod
+    def get_javac_options():
+        """Returns the options to pass to javac, i.e., the configured flags passed through to javac's own JVM.
+        :returns List of options."""
+        return [f'-J{flag}' for flag in JvmProfile.get_flags()]
+
+    @staticmethod
+    def get_flags():
+        """Returns the JVM flags configured by the [Proctor] jvm_flags key.
+        :returns List of flags, empty if none are configured."""
+        return shlex.split(ProctorConfig.get_config_value('Proctor', 'jvm_flags') or '')
+
+    @staticmethod
+    def get_java_version():
+        """Returns the version string reported by 'java -version', e.g., 'openjdk version "11.0.2" 2019-01-15'.
+        The result is cached for the life of the application.
+        :returns First line of java's version output, or 'unknown' if java cannot be run."""
+        if JvmProfile._java_version is None:
+            try:
+                result = subprocess.run(['java', '-version'], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+                lines = result.stdout.decode('utf-8', errors='replace').strip().splitlines()
+                JvmProfile._java_version = lines[0] if lines else 'unknown'
+            except OSError:
+                JvmProfile._java_version = 'unknown'
+        return JvmProfile._java_version
+
+    @staticmethod
+    def get_java_feature_version():
+        """Returns java's feature release number, e.g., 8 for '1.8.0_212' and 11 for '11.0.2'.
+        :returns Feature release number, or 0 if it cannot be determined."""
+        match = re.search(r'"(?:1\.)?(\d+)', JvmProfile.get_java_version())
+        return int(match.group(1)) if match else 0
+
+    @staticmethod
+    def warmup():
+        """Creates the JUnit AppCDS archive and reports JVM startup time with and without the profile.
+        :returns True if the archive was created."""
+        logger = ProctorLoggerFactory.getLogger()
+        junit_cp = PathManager.get_junit_classpath()
+        if not junit_cp:
+            logger.error('No JUnit classpath. Check the junit_path key in the configuration file.')
+            return False
+        java_version = JvmProfile.get_java_version()
+        logger.info(f'Java: {java_version}')
+        logger.info(f'JVM flags: {" ".join(JvmProfile.get_flags()) or "(none)"}')
+        baseline_ms = JvmProfile._measure_startup([], junit_cp)
+
+        created = False
+        if JvmProfile.get_java_feature_version() < JvmProfile._MIN_APPCDS_JAVA_VERSION:
+            logger.warning(f'Class data sharing for JUnit requires Java {JvmProfile._MIN_APPCDS_JAVA_VERSION} or '
+                           'newer. Only the JVM flags are applied.')
+        else:
+            created = JvmProfile._create_archive(junit_cp, java_version)
+
+        with JvmProfile._lock:
+            JvmProfile._archive_options = None     # pick up the new archive
+        profile_ms = JvmProfile._measure_startup(JvmProfile.get_java_options(), junit_cp)
+
+        if baseline_ms and profile_ms is not None:
+            logger.info(f'JUnit startup, median of {JvmProfile._NUM_STARTUP_SAMPLES} runs: '
+                        f'{baseline_ms:.0f} ms without profile, {profile_ms:.0f} ms with profile '
+                        f'({100 * (profile_ms - baseline_ms) / baseline_ms:+.0f}%)')
+        return created
+
+    @staticmethod
+    def _create_archive(junit_cp, java_version):
+        """Records the classes JUnit loads when it runs and dumps them to the archive.
+        :param junit_cp: JUnit classpath
+        :param java_version: java's version string, recorded so that a stale archive is not used
+        :returns True if the archive was created."""
+        logger = ProctorLoggerFactory.getLogger()
+        jvm_dir = PathManager.get_proctor_data_dir('jvm')
+        class_list = os.sep.join([jvm_dir, JvmProfile._CLASS_LIST_FILE_NAME])
+        archive = os.sep.join([jvm_dir, JvmProfile._ARCHIVE_FILE_NAME])
+        meta_file = os.sep.join([jvm_dir, JvmProfile._META_FILE_NAME])
+
+        # Remove the metadata first so that a failed dump leaves no archive that looks usable
+        if os.path.exists(meta_file):
+            os.remove(meta_file)
+
+        steps = [['java', '-Xshare:off', f'-XX:DumpLoadedClassList={class_list}',
+                  '-cp', junit_cp, 'org.junit.runner.JUnitCore'],
+                 ['java', '-Xshare:dump', f'-XX:SharedClassListFile={class_list}',
+                  f'-XX:SharedArchiveFile={archive}', '-cp', junit_cp]]
+        for cmd in steps:
+            logger.debug(' '.join(cmd))
+            result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            if result.returncode != 0:
+                logger.error(f"Cannot create class data sharing archive: "
+                             f"{result.stdout.decode('utf-8', errors='replace').strip()}")
+                return False
+
+        with open(meta_file, mode='wt', encoding='utf-8') as f:
+            json.dump({'junit_classpath': junit_cp, 'java_version': java_version}, f)
+        logger.info(f'Created class data sharing archive: {archive}')
+        return True
+
+    @staticmethod
+    def _get_archive_options():
+        """Returns the options that map the archive, if one exists for the current JUnit classpath and java.
+        :returns List of options, empty if there's no usable archive."""
+        with JvmProfile._lock:
+            if JvmProfile._archive_options is None:
+                JvmProfile._archive_options = []
+                jvm_dir = PathManager.get_proctor_data_dir('jvm')
+                archive = Path(jvm_dir) / JvmProfile._ARCHIVE_FILE_NAME
+                try:
+                    with open(Path(jvm_dir) / JvmProfile._META_FILE_NAME, encoding='utf-8') as f:
+                        meta = json.load(f)
+                    if archive.exists() and meta['junit_classpath'] == PathManager.get_junit_classpath() and \
+                            meta['java_version'] == JvmProfile.get_java_version():
+                        # -Xshare:auto falls back to loading classes normally if the archive cannot be mapped. The
+                        # JVM's warnings about that go to stderr so that they cannot mix with test or helper output.
+                        JvmProfile._archive_options = ['-Xshare:auto', f'-XX:SharedArchiveFile={archive}',
+                                                       '-Xlog:disable', '-Xlog:all=warning:stderr']
+                except (OSError, ValueError, KeyError):
+                    pass
+            return JvmProfile._archive_options
+
+    @staticmethod
+    def _measure_startup(java_options, junit_cp):
+        """Measures how long java takes to start JUnit and run an empty request.
+        :param java_options: Options to pass to java
+        :param junit_cp: JUnit classpath
+        :returns Median elapsed time in milliseconds, or None if java cannot be run."""
+        samples = []
+        for _ in range(JvmProfile._NUM_STARTUP_SAMPLES):
+            start = time.perf_counter()
+            try:
+                subprocess.run(['java'] + java_options + ['-cp', junit_cp, 'org.junit.runner.JUnitCore'],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            except OSError:
+                return None
+            samples.append((time.perf_counter() - start) * 1000)
+        return statistics.median(samples)
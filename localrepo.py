@@ -0,0 +1,213 @@
+import shutil
+import subprocess
+from pathlib import Path
+from ploggerfactory import ProctorLoggerFactory
+
+
+class LocalRepo:
+    """A git clone on the local machine. Used to bring an existing clone up to date with its remote instead of
+    deleting it and cloning it again.
+
+    Clones can be made with one of several strategies. Grading only needs the latest tree, so the cheaper
+    strategies skip history (shallow, which implies a single branch), other branches (single_branch) or file
+    contents that are not checked out (blobless). A blobless clone fetches missing file contents on demand, and
+    ensure_history deepens a shallow clone when a caller needs older commits."""
+
+    CLONE_STRATEGY_FULL = 'full'
+    CLONE_STRATEGY_SHALLOW = 'shallow'
+    CLONE_STRATEGY_SINGLE_BRANCH = 'single_branch'
+    CLONE_STRATEGY_BLOBLESS = 'blobless'
+
+    _CLONE_OPTIONS = {CLONE_STRATEGY_FULL: [],
+                      CLONE_STRATEGY_SHALLOW: ['--depth', '1'],
+                      CLONE_STRATEGY_SINGLE_BRANCH: ['--single-branch'],
+                      CLONE_STRATEGY_BLOBLESS: ['--filter=blob:none']}
+
+    @staticmethod
+    def get_clone_options(clone_strategy):
+        """Returns the git clone options that implement the given strategy.
+        :param clone_strategy: One of the CLONE_STRATEGY_* names
+        :returns List of git clone options
+        :raises ValueError if the strategy is unknown"""
+        if clone_strategy not in LocalRepo._CLONE_OPTIONS:
+            raise ValueError(f"Unknown clone strategy '{clone_strategy}'. "
+                             f"Use one of: {', '.join(LocalRepo._CLONE_OPTIONS)}.")
+        return list(LocalRepo._CLONE_OPTIONS[clone_strategy])
+
+    def __init__(self, path_name, timeout_secs=None):
+        """Initializes the LocalRepo.
+        :param path_name: Root directory of the clone
+        :param timeout_secs: Time limit of each git command, e.g., a fetch. None for no limit."""
+        self._logger = ProctorLoggerFactory.getLogger()
+        self._path = Path(path_name)
+        self._timeout_secs = timeout_secs
+
+    def is_clone_of(self, remote_url):
+        """Determines if the directory is the root of a healthy clone whose origin is the given remote.
+        :param remote_url: URL of the remote repository
+        :returns True if the directory is a clone of remote_url."""
+        if not (self._path / '.git').exists():
+            return False
+        try:
+            result = self._git('rev-parse', '--show-toplevel')
+            if result.returncode != 0 or Path(result.stdout.strip()).resolve() != self._path.resolve():
+                return False
+            result = self._git('config', '--get', 'remote.origin.url')
+        except subprocess.TimeoutExpired:
+            return False
+        return result.returncode == 0 and \
+            LocalRepo._normalize_url(result.stdout.strip()) == LocalRepo._normalize_url(remote_url)
+
+    def is_shallow(self):
+        """Determines if the clone has truncated history.
+        :returns True if the clone is shallow."""
+        return (self._path / '.git' / 'shallow').exists()
+
+    def ensure_history(self):
+        """Fetches the full history of a shallow clone, so that older commits can be checked out. Does nothing
+        if the clone already has its full history.
+        :returns True if the clone has its full history."""
+        if not self.is_shallow():
+            return True
+        self._logger.debug(f'Fetching full history: {self._path}')
+        return self._run_step(('fetch', '--unshallow', '--quiet', 'origin'))
+
+    def get_head_sha(self):
+        """Returns the SHA of the commit checked out in the clone or worktree.
+        :returns SHA, or None if there's no commit or the directory is not a clone."""
+        if not (self._path / '.git').exists():     # a worktree's .git is a file, which is fine
+            return None
+        try:
+            result = self._git('rev-parse', '--verify', '--quiet', 'HEAD')
+        except subprocess.TimeoutExpired:
+            return None
+        if result.returncode != 0:
+            return None
+        return result.stdout.strip() or None
+
+    def get_commit_dates(self, rev='HEAD'):
+        """Reads the committer and author dates of a commit, in one git command.
+        :param rev: Commit to read, e.g., a SHA. Defaults to the commit checked out in the clone.
+        :returns Tuple (commit date, author date) of strict ISO 8601 strings, e.g., '2019-03-03T23:39:40-05:00',
+        or None if the clone has no commits or cannot be read."""
+        if not (self._path / '.git').exists():     # git would otherwise read an enclosing repo, if any
+            return None
+        try:
+            result = self._git('log', '-1', '--format=%cI %aI', rev, '--')
+        except subprocess.TimeoutExpired:
+            return None
+        dates = result.stdout.split()
+        if result.returncode != 0 or len(dates) != 2:
+            self._logger.debug(f'Cannot read commit {rev} of {self._path}: {result.stderr.strip()}')
+            return None
+        return (dates[0], dates[1])
+
+    def get_last_commit_before(self, due_dt):
+        """Finds the last commit on the checked-out branch that was committed at or before the given time. A
+        shallow clone gets its full history first.
+        :param due_dt: Date and time, e.g., '2019-04-19T04:00:00-0400'
+        :returns SHA of the commit, or None if there's no such commit."""
+        if not (self._path / '.git').exists() or not self.ensure_history():
+            return None
+        try:
+            result = self._git('rev-list', '-1', f'--before={due_dt}', 'HEAD', '--')
+        except subprocess.TimeoutExpired:
+            return None
+        if result.returncode != 0:
+            self._logger.debug(f'Cannot list commits of {self._path}: {result.stderr.strip()}')
+            return None
+        return result.stdout.strip() or None
+
+    def add_worktree(self, worktree_path_name, rev):
+        """Checks out a commit into a detached worktree that shares the clone's objects, replacing any earlier
+        worktree at the same place. The clone's own working tree is not touched.
+        :param worktree_path_name: Directory of the worktree
+        :param rev: Commit to check out, e.g., a SHA
+        :returns True if the worktree was created."""
+        worktree_path = Path(worktree_path_name).resolve()     # git would resolve a relative path against the clone
+        if worktree_path.exists():
+            shutil.rmtree(worktree_path)
+        worktree_path.parent.mkdir(parents=True, exist_ok=True)
+        steps = [('worktree', 'prune'),
+                 ('worktree', 'add', '--quiet', '--detach', '--force', str(worktree_path), rev)]
+        for step in steps:
+            if not self._run_step(step):
+                return False
+        return True
+
+    def remove_worktree(self, worktree_path_name):
+        """Removes a worktree added by add_worktree, along with its registration in the clone. The directory is
+        deleted even if git cannot remove it, e.g., because the clone is gone.
+        :param worktree_path_name: Directory of the worktree"""
+        worktree_path = Path(worktree_path_name).resolve()
+        if self._run_step(('worktree', 'remove', '--force', str(worktree_path))):
+            return
+        shutil.rmtree(worktree_path, ignore_errors=True)
+        if (self._path / '.git').exists():
+            self._run_step(('worktree', 'prune'))
+
+    def update(self, clone_strategy=CLONE_STRATEGY_FULL):
+        """Fetches the remote and makes the working tree an exact copy of the remote's default branch:
+        local commits and changes are discarded and untracked and ignored files, e.g., build output, removed.
+        :param clone_strategy: Strategy the clone should follow. A shallow clone stays shallow; with any other
+        strategy, a shallow clone gets its full history.
+        :returns True if the clone was updated, False if any step failed, e.g., because the clone is corrupt."""
+        if clone_strategy == LocalRepo.CLONE_STRATEGY_SHALLOW:
+            fetch_depth = ('--depth', '1')
+        else:
+            fetch_depth = ('--unshallow',) if self.is_shallow() else ()
+        steps = [('fetch', '--prune', '--quiet') + fetch_depth + ('origin',),
+                 ('remote', 'set-head', 'origin', '--auto')]
+        for step in steps:
+            if not self._run_step(step):
+                return False
+
+        try:
+            result = self._git('rev-parse', '--abbrev-ref', 'origin/HEAD')
+        except subprocess.TimeoutExpired:
+            return False
+        if result.returncode != 0:
+            self._logger.debug(f'Cannot determine default branch of {self._path}: {result.stderr.strip()}')
+            return False
+        remote_branch = result.stdout.strip()               # e.g., origin/master
+        branch = remote_branch[len('origin/'):]
+
+        steps = [('checkout', '--quiet', '--force', '-B', branch, remote_branch),
+                 ('clean', '-ffdxq')]
+        for step in steps:
+            if not self._run_step(step):
+                return False
+        return True
+
+    def _run_step(self, args):
+        """Runs one git command of an update, logging its failure.
+        :param args: git arguments
+        :returns True if the command succeeded."""
+        try:
+            result = self._git(*args)
+        except subprocess.TimeoutExpired:
+            self._logger.debug(f"git {' '.join(args)} timed out after {self._timeout_secs}s in {self._path}")
+            return False
+        if result.returncode != 0:
+            self._logger.debug(f"git {' '.join(args)} failed in {self._path}: {result.stderr.strip()}")
+        return result.returncode == 0
+
+    def _git(self, *args):
+        """Runs git in the clone's directory.
+        :param args: git arguments
+        :returns CompletedProcess with decoded stdout and stderr.
+        :raises subprocess.TimeoutExpired if the command exceeds the time limit"""
+        return subprocess.run(['git', '-C', str(self._path)] + list(args), stdin=subprocess.DEVNULL,
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True,
+                              timeout=self._timeout_secs)
+
+    @staticmethod
+    def _normalize_url(url):
+        """Normalizes a remote URL so that equivalent spellings compare equal, e.g., with or without a trailing
+        '.git' or '/'.
+        :param url: Remote URL
+        :returns Normalized URL."""
+        url = url.strip().rstrip('/')
+        if url.endswith('.git'):
+            url = url[:-len('.git')]
+        return url.lower()
@@ -0,0 +1,77 @@
+import gzip
+import threading
+from collections import deque
+
+
+class OutputCapture:
+    """Captures the output of a child process as it's produced, keeping only a bounded head and tail of it in
+    memory. Each line is handed to an optional callback as it arrives, so that callers can parse the output
+    incrementally instead of buffering it. The full output can optionally be spilled to a gzip-compressed file."""
+
+    DEFAULT_HEAD_LINES = 100
+    DEFAULT_TAIL_LINES = 100
+    MAX_LINE_BYTES = 4096   # longer lines are split, so that output without newlines cannot grow unbounded
+
+    def __init__(self, stream, on_line=None, spill_file_name=None,
+                 head_lines=DEFAULT_HEAD_LINES, tail_lines=DEFAULT_TAIL_LINES):
+        """Initializes the OutputCapture.
+        :param stream: Binary stream to read, e.g., a Popen object's stdout
+        :param on_line: Function called with each decoded line, sans line ending. May be None.
+        :param spill_file_name: Name of a .gz file to which all output is written. None to not spill.
+        :param head_lines: Number of lines kept from the start of the output
+        :param tail_lines: Number of lines kept from the end of the output"""
+        self._stream = stream
+        self._on_line = on_line
+        self._spill_file_name = spill_file_name
+        self._head = []
+        self._head_lines = head_lines
+        self._tail = deque(maxlen=tail_lines)
+        self._num_lines = 0
+        self._thread = threading.Thread(target=self._capture, daemon=True)
+
+    def start(self):
+        """Starts capturing output on a background thread.
+        :returns This OutputCapture"""
+        self._thread.start()
+        return self
+
+    def join(self, timeout=None):
+        """Waits for the stream to reach end of file, i.e., for the child process to close its output.
+        :param timeout: Maximum number of seconds to wait, or None to wait indefinitely"""
+        self._thread.join(timeout)
+
+    def get_num_lines(self):
+        """Returns the number of lines captured so far.
+        :returns Number of lines read from the stream."""
+        return self._num_lines
+
+    def get_text(self):
+        """Returns the captured head and tail of the output. If lines were dropped between them, a marker
+        line says how many.
+        :returns Captured output as a string."""
+        lines = list(self._head)
+        num_omitted = self._num_lines - len(self._head) - len(self._tail)
+        if num_omitted > 0:
+            lines.append(f'... {num_omitted} lines omitted ...')
+        lines.extend(self._tail)
+        return '\n'.join(lines)
+
+    def _capture(self):
+        """Reads the stream until end of file, keeping the head and tail and spilling if asked."""
+        spill_file = gzip.open(self._spill_file_name, mode='wb') if self._spill_file_name else None
+        try:
+            for raw_line in iter(lambda: self._stream.readline(OutputCapture.MAX_LINE_BYTES), b''):
+                if spill_file is not None:
+                    spill_file.write(raw_line)
+                line = raw_line.decode('utf-8', errors='replace').rstrip('\r\n')
+                self._num_lines += 1
+                if len(self._head) < self._head_lines:
+                    self._head.append(line)
+                else:
+                    self._tail.append(line)
+                if self._on_line is not None:
+                    self._on_line(line)
+        finally:
+            if spill_file is not None:
+                spill_file.close()
+            self._stream.close()
@@ -1,5 +1,7 @@
 import os
 import shutil
+import tempfile
+from contextlib import contextmanager
 from pathlib import Path
 from pconfig import ProctorConfig
 
@@ -28,6 +30,25 @@ class PathManager:
             return
         raise FileExistsError(f"Destination path {dest_path_name} already exists. Use --force.")
 
+    @staticmethod
+    @contextmanager
+    def replacing_file(file_name):
+        """Context manager that yields the name of a temporary file in the same directory as file_name, and moves
+        it over file_name when the block completes, so that readers never see a partially written file. The
+        temporary file is removed if the block raises.
+        :param file_name: Name of the file to write
+        :returns Name of the temporary file to write instead."""
+        path = Path(file_name)
+        tmp_fd, tmp_file_name = tempfile.mkstemp(prefix=f'.{path.name}-', dir=str(path.parent))
+        os.close(tmp_fd)
+        try:
+            yield tmp_file_name
+            os.replace(tmp_file_name, str(path))
+        except BaseException:
+            if os.path.exists(tmp_file_name):
+                os.remove(tmp_file_name)
+            raise
+
     @staticmethod
     def build_dest_path_name(working_dir, email, project_name):
         """Builds a file system path name from component parts.
@@ -38,6 +59,16 @@ class PathManager:
         dest_path_name = os.sep.join([working_dir, project_name, email])
         return dest_path_name
 
+    @staticmethod
+    def get_proctor_data_dir(*subdirs):
+        """Returns (and creates, if necessary) a directory under Proctor's private data directory, '.proctor',
+        in the working directory. Used for caches, compiled helpers and other files that Proctor manages itself.
+        :param subdirs: Names of the subdirectories, from outermost to innermost
+        :returns Full path name of the directory."""
+        data_dir = Path(os.sep.join([ProctorConfig.get_proctor_working_dir(), '.proctor'] + list(subdirs)))
+        data_dir.mkdir(parents=True, exist_ok=True)
+        return str(data_dir)
+
     @staticmethod
     def get_project_src_dir_name(project_name):
         """Returns the name of the src_dir to use.
@@ -45,6 +76,43 @@ class PathManager:
         :returns Name of the src_dir to use to find project's files"""
         return PathManager._get_project_config_value(project_name, 'src_dir')
 
+    @staticmethod
+    def get_build_mode(project_name):
+        """Returns the build mode to use when compiling the project, either 'batch' or 'per_file'.
+        :param project_name: Name of the project being worked on.
+        :returns Name of the build mode to use. Defaults to 'batch' if not configured."""
+        build_mode = PathManager._get_project_config_value(project_name, 'build_mode')
+        if build_mode is None or len(build_mode) == 0:
+            build_mode = 'batch'
+        return build_mode.lower()
+
+    @staticmethod
+    def get_clone_strategy(project_name):
+        """Returns the strategy to use when cloning the project: 'full', 'shallow', 'single_branch' or 'blobless'.
+        :param project_name: Name of the project being worked on.
+        :returns Name of the clone strategy to use. Defaults to 'full' if not configured."""
+        clone_strategy = PathManager._get_project_config_value(project_name, 'clone_strategy')
+        if clone_strategy is None or len(clone_strategy) == 0:
+            clone_strategy = 'full'
+        return clone_strategy.lower()
+
+    @staticmethod
+    def get_starter_repo(project_name):
+        """Returns the URL of the starter repo from which the project's student repos are forked.
+        :param project_name: Name of the project being worked on.
+        :returns URL of the starter repo, or None if not configured."""
+        starter_repo = PathManager._get_project_config_value(project_name, 'starter_repo')
+        return starter_repo if starter_repo else None
+
+    @staticmethod
+    def get_clone_dissociate(project_name):
+        """Determines if clones copy the objects they borrow from the starter repo mirror, rather than keep
+        depending on the mirror.
+        :param project_name: Name of the project being worked on.
+        :returns True to dissociate clones from the mirror. Defaults to False if not configured."""
+        dissociate = PathManager._get_project_config_value(project_name, 'clone_dissociate')
+        return dissociate is not None and dissociate.lower() in ('true', 'yes', 'on', '1')
+
     @staticmethod
     def get_project_src_package(project_name):
         """Returns the name of the src_package to use.
@@ -94,6 +162,16 @@ class PathManager:
         suite_class = PathManager._get_project_config_value(project_name, 'instructor_test_suite')
         return (suite_dir, suite_class)
 
+    @staticmethod
+    def get_test_run_limits(project_name):
+        """Returns the limits applied to each JUnit run of the project: wall-clock timeout, CPU time and memory.
+        A limit that's missing, empty or 0 in the configuration file is not applied.
+        :param project_name: Name of the project being worked on.
+        :returns A tuple (timeout in seconds, CPU time in seconds, memory in MB). Each element may be None."""
+        return (PathManager._get_project_config_int(project_name, 'test_timeout_secs'),
+                PathManager._get_project_config_int(project_name, 'test_cpu_secs'),
+                PathManager._get_project_config_int(project_name, 'test_memory_mb'))
+
     @staticmethod
     def instructor_test_suite_exists(suite_dir, suite_class):
         """Determines if the given test suite exits on the file system.
@@ -154,6 +232,19 @@ class PathManager:
 
         return cfg_value  # Might be None and that's OK. Caller handles.
 
+    @staticmethod
+    def _get_project_config_int(project_name, cfg_key):
+        """Returns the value of the given project configuration key as a positive integer, or None.
+        :param project_name: Project being worked on, which represents a [section] name in the configuration file.
+        :param cfg_key: Key for which the value is retrieved.
+        :returns Positive integer value of the key, or None if not found, not an integer or not positive."""
+        cfg_value = PathManager._get_project_config_value(project_name, cfg_key)
+        try:
+            cfg_value = int(cfg_value)
+        except (TypeError, ValueError):
+            return None
+        return cfg_value if cfg_value > 0 else None
+
     @staticmethod
     def path_name_to_packge_name(path_name):
         """Helper function that converts an OS path name to a Java package name.
@@ -77,6 +77,35 @@ class ProctorConfig:
             value = None
         return value
 
+    @staticmethod
+    def get_config_int(section, key, default=0):
+        """Returns the value of the given configuration [section] key as an integer.
+        :param section: Section of the configuration file from which to read the key's value.
+        :param key: Key in the section from which to retrieve the value.
+        :param default: Value returned if the key is missing, empty or not an integer.
+        :returns Integer value of the given configuration section's key."""
+        value = ProctorConfig.get_config_value(section, key)
+        try:
+            return int(value.strip())
+        except (AttributeError, ValueError):
+            return default
+
+    @staticmethod
+    def get_config_bool(section, key, default=False):
+        """Returns the value of the given configuration [section] key as a boolean. Accepts the usual
+        configuration file spellings, e.g., true/false, yes/no, on/off, 1/0.
+        :param section: Section of the configuration file from which to read the key's value.
+        :param key: Key in the section from which to retrieve the value.
+        :param default: Value returned if the key is missing, empty or not a recognizable boolean.
+        :returns Boolean value of the given configuration section's key."""
+        value = ProctorConfig.get_config_value(section, key)
+        if value is None or len(value.strip()) == 0:
+            return default
+        value = value.strip().lower()
+        if value in ProctorConfig.CONFIG.BOOLEAN_STATES:
+            return ProctorConfig.CONFIG.BOOLEAN_STATES[value]
+        return default
+
     @staticmethod
     def get_section_items(section):
         return dict(ProctorConfig.CONFIG.items(section))
@@ -3,6 +3,7 @@ import termcolor
 import sys
 import os
 import re
+import threading
 from datetime import datetime as dt
 
 
@@ -31,6 +32,7 @@ class ProctorLogger:
         :param proctor_working_dir: Directory that serves as the root for cloned projects, gradebook files, etc.
         :param logfile_name: Name of the file to which log output is written."""
         self._logger_name = logger_name
+        self._context = threading.local()   # per-thread message prefix, e.g., the student being graded
 
         # Converts the log level string read from the config file into
         # the associated log level integer required by the standard logging module
@@ -83,6 +85,17 @@ class ProctorLogger:
         logfile_name = os.sep.join([proctor_working_dir, logfile_name])
         return logfile_name
 
+    # Per-thread context
+    def set_context(self, context):
+        """Sets a tag that prefixes every message subsequently logged by the calling thread. Used when work is
+        done concurrently so that each log line stays attributable, e.g., to the student being graded.
+        :param context: Tag to prefix messages with, or None to clear it"""
+        self._context.value = context
+
+    def clear_context(self):
+        """Clears the calling thread's message prefix."""
+        self.set_context(None)
+
     # Logging wrappers
     def debug(self, msg, *args, **kwargs):
         return self._log(msg, logging.DEBUG, *args, **kwargs)
@@ -106,6 +119,9 @@ class ProctorLogger:
         :param *args: Additional positional parameters, required by standard logger
         :param **kwargs: Additional named parameters, required by standard logger"""
         the_msg = ProctorLogger._format_msg(msg)
+        context = getattr(self._context, 'value', None)
+        if context:
+            the_msg = f'[{context}] {the_msg}'
         home_dir = os.path.expanduser('~')
         if home_dir in the_msg:
             the_msg = the_msg.replace(home_dir, '~')
@@ -4,23 +4,40 @@ import argparse
 import sys
 import os
 import termcolor
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime as dt
 from pathlib import Path
 from pconfig import ProctorConfig
-from gitlabserver import GitLabServer
+from gitlabserver import GitLabServer, GitLabTransientError, CloneResult
 from gitlabuser import GitLabUser
 from pathmgr import PathManager
 from grader import Grader
+from instructorsuite import InstructorSuite
 from gradebook import GradeBook
+from gradestore import GradeStore
 from builder import Builder
+from buildcache import BuildCache
+from compileserver import CompileServer
+from jvmprofile import JvmProfile
 from utrunner import UnitTestRunner
+from testharness import TestHarness
 from ploggerfactory import ProctorLoggerFactory
 from postman import Postman
+from projectindex import ProjectIndex
+from localrepo import LocalRepo
+from commitdates import CommitDateProvider
+from referencemirror import ReferenceMirror
 
 
 class Proctor:
     """Proctor enables WIT instructors to clone, build, test and grade Java-based projects."""
 
+    _NUM_SLOWEST_TESTS_TO_LOG = 5
+    _NUM_SLOWEST_CLONES_TO_LOG = 5
+    _DEFAULT_CLONE_WORKERS = 4
+
     def __init__(self):
         """Initializes the Proctor"""
         self._init_logger()     # Put as first line in init so that all other
@@ -28,7 +45,8 @@ class Proctor:
         self._init_working_dir()
         self._init_args()
         self._init_server()
-        self._server.login(self._user)
+        self._server.login(self._user, refresh=bool(self._argsdict.get('refresh')))
+        self._project_indexes = {}
 
     def _init_logger(self):
         """Initializes the Proctor logger."""
@@ -54,11 +72,22 @@ class Proctor:
         parser_srefresh.add_argument('--owner', help='email of the person to refresh')
         parser_srefresh.add_argument('--emails', help='path to text file containing all people to refresh')
         parser_srefresh.add_argument('--grade', help='if present, re-grades projects after cloning', action='store_true')
+        parser_srefresh.add_argument('--jobs', type=int, help='number of students to grade concurrently')
+        parser_srefresh.add_argument('--keep-output', help="save each test run's full output, gzip-compressed",
+                                     action='store_true')
+        parser_srefresh.add_argument('--no-build-cache', help='rebuild every project instead of reusing cached builds',
+                                     action='store_true')
+        parser_srefresh.add_argument('--refresh', help='fetch everything from the server instead of the API cache',
+                                     action='store_true')
 
         # config
         parser_config = subparsers.add_parser('config', help='display basic configuration information')
         parser_config.add_argument("--verbose", help="display entire configruation file", action="store_true")
 
+        # jvm-warmup
+        parser_jvm_warmup = subparsers.add_parser('jvm-warmup', help='create the JUnit class data sharing archive '
+                                                                     'and measure JVM startup')
+
         # glping (GitLab ping)
         parser_glping = subparsers.add_parser('glping', help='hail the GitLab server to verify everything is working')
 
@@ -67,18 +96,42 @@ class Proctor:
         parser_clone.add_argument("--project", help="name of the assignment, lab or project", required=True)
         parser_clone.add_argument("--emails", help="path to text file containing student emails", required=True)
         parser_clone.add_argument("--force", help="force overwrite of existing directory", action="store_true")
+        parser_clone.add_argument("--jobs", type=int, help="number of projects to clone concurrently")
+        parser_clone.add_argument("--refresh", help="fetch everything from the server instead of the API cache",
+                                  action="store_true")
 
         # grade command
         parser_grade = subparsers.add_parser('grade', help='grade projects')
         parser_grade.add_argument("--project", help="name of the assignment, lab or project", required=True)
         parser_grade.add_argument("--emails", help="path to text file containing student emails", required=True)
         parser_grade.add_argument("--chide", help="automatically email students when project not found", action="store_true")
+        parser_grade.add_argument("--jobs", type=int, help="number of students to grade concurrently")
+        parser_grade.add_argument("--resume", help="continue the newest grade book, skipping students already in it",
+                                  action="store_true")
+        parser_grade.add_argument("--incremental", help="copy forward the grades of students whose commit, sources "
+                                  "and instructor tests are unchanged since an earlier run", action="store_true")
+        parser_grade.add_argument("--at-due-date", help="grade each student's last commit at or before the due date",
+                                  action="store_true")
+        parser_grade.add_argument("--keep-output", help="save each test run's full output, gzip-compressed",
+                                  action="store_true")
+        parser_grade.add_argument("--no-build-cache", help="rebuild every project instead of reusing cached builds",
+                                  action="store_true")
+        parser_grade.add_argument("--refresh", help="fetch everything from the server instead of the API cache",
+                                  action="store_true")
+
+        # report command
+        parser_report = subparsers.add_parser('report', help='report grades stored across grading runs')
+        parser_report.add_argument("--project", help="name of the project to report on")
+        parser_report.add_argument("--owner", help="email of the student whose grades across projects to report")
+        parser_report.add_argument("--run", type=int, help="ID of the grading run to report on, instead of the newest")
 
         # project
         parser_project = subparsers.add_parser('projects', help='list projects for a given owner/email')
         parser_project.add_argument("--owner", help="person for which to find the projects")
         parser_project.add_argument("--emails", help="path to text file containing students emails")
         parser_project.add_argument("--share", help="shares each student's list with the student", action="store_true")
+        parser_project.add_argument("--refresh", help="fetch everything from the server instead of the API cache",
+                                    action="store_true")
 
         # group command
         parser_group = subparsers.add_parser('group', help='command used to manage groups on server')
@@ -110,11 +163,15 @@ class Proctor:
             self._display_config_info()
         elif cmd == 'glping':
             self._glping()
+        elif cmd == 'jvm-warmup':
+            self._jvm_warmup()
         elif cmd == 'clone':
             project_name = self._argsdict['project']
             self._clone_project_cmd(project_name)
         elif cmd == 'grade':
             self._grade_project()
+        elif cmd == 'report':
+            self._report()
         elif cmd == 'projects':
             self._list_projects()
         elif cmd == 'group':
@@ -132,7 +189,7 @@ class Proctor:
         email_file = self._argsdict['emails']
         emails = self._get_emails_from_file(email_file)
         force = self._argsdict['force']
-        self._clone_project(project_name, emails, force)
+        self._clone_project(project_name, emails, force, self._argsdict['jobs'])
 
     def _refresh_student_projects(self):
 
@@ -171,67 +228,207 @@ class Proctor:
         project_dir = os.sep.join([self._working_dir_name, project_name])
         project_due_dt = ProctorConfig.get_config_value(project_name, 'due_dt')
 
-        gradebook = GradeBook(self._working_dir_name, project_name, project_due_dt)
-        builder = Builder()
-        testrunner = UnitTestRunner()
-        grader = Grader(builder, testrunner, gradebook)
+        parameters = self._parse_parameters_from_argv('no_build_cache', 'keep_output', 'at_due_date', 'resume',
+                                                      'incremental')
+        incremental = bool(parameters['incremental'])
+        if incremental and not GradeStore.is_enabled():
+            self._logger.error('Cannot grade incrementally without the grade store. Set grade_store = true.')
+            return
+        at_due_date = bool(parameters['at_due_date'])
+        if at_due_date and not project_due_dt:
+            self._logger.error(f'Cannot grade at the due date. No due_dt key in the [{project_name}] section.')
+            return
+        try:
+            commit_date_source = CommitDateProvider.get_source()
+        except ValueError as ex:
+            self._logger.error(str(ex))
+            return
 
         owner_emails = emails if not emails is None else \
             self._get_emails_from_file(self._argsdict['emails'])
+        # Skip blank lines and repeated emails
+        owner_emails = list(OrderedDict.fromkeys(email.strip() for email in owner_emails if email.strip()))
+
+        # Validated. The grade book starts a run in the grade store, if any, which must then be finished.
+        grade_store = GradeStore() if GradeStore.is_enabled() else None
+        gradebook = GradeBook(self._working_dir_name, project_name, project_due_dt, bool(parameters['resume']),
+                              grade_store)
+        builder = Builder()
+        keep_output = parameters['keep_output'] or ProctorConfig.get_config_bool('Proctor', 'keep_test_output')
+        testrunner = UnitTestRunner(keep_output)
+        no_build_cache = parameters['no_build_cache']
+        build_cache = None if no_build_cache else BuildCache()
+
+        # Skip students already graded by the run being resumed
+        graded_emails = gradebook.get_graded_emails()
+        if graded_emails:
+            owner_emails = [email for email in owner_emails if email not in graded_emails]
+            self._logger.info(f'Skipping {len(graded_emails)} students already in {gradebook.get_file_name()}')
+        gradebook.set_roster(owner_emails)
+
+        # Look up all students' server projects and latest commit dates up front, concurrently, rather than one
+        # student at a time. Commit dates are read from the clones unless the server is asked for them.
+        project_index = self._get_project_index(project_name).prefetch_owners(owner_emails, with_commits=False)
+        commit_dates = CommitDateProvider(project_dir, project_index, commit_date_source)
+        if not at_due_date:
+            commit_dates.prefetch(owner_emails)
+
+        # Build the instructor's test suite once, rather than once per student
+        instructor_suite = InstructorSuite()
+        instructor_suite_jar = instructor_suite.prepare(project_name, project_dir, owner_emails)
+        grader = Grader(builder, testrunner, gradebook, build_cache, instructor_suite_jar,
+                        instructor_suite.get_suite_hash(), incremental)
         users_missing_project = []
 
-        self._logger.info(f'Grading {project_name}')
+        max_workers = self._get_max_workers()
+        self._logger.info(f'Grading {project_name}' + (f' as of {project_due_dt}' if at_due_date else '') +
+                          (f' ({max_workers} workers)' if max_workers > 1 else ''))
 
         num_to_grade = len(owner_emails)
-        current = 0
 
-        # Grade project for each student listed in owner_emails
-        for email in owner_emails:
+        # Grade project for each student listed in owner_emails. Students are graded concurrently when more than
+        # one worker is configured. The gradebook writes each record as soon as the records before it in roster
+        # order are written, so that a crash loses little work; grade --resume picks up where it stopped.
+        self._logger.info(f'Writing grades to: {gradebook.get_file_name()}')
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = []
+                for current, email in enumerate(owner_emails, start=1):
+                    futures.append(executor.submit(self._grade_owner_project, email, project_name, project_dir,
+                                                   project_due_dt, grader, gradebook, project_index, commit_dates,
+                                                   at_due_date, current, num_to_grade, max_workers > 1))
+                for email, future in zip(owner_emails, futures):
+                    try:
+                        if not future.result():
+                            users_missing_project.append(email)
+                    except Exception as ex:
+                        self._logger.error(f'Cannot grade {email}: {type(ex).__name__}: {ex}')
+                        gradebook.grading_failed(email, f'{type(ex).__name__}: {ex}')
+        finally:
+            # The workers' compile servers and test harnesses; the next project's workers start their own
+            CompileServer.shutdown_all()
+            TestHarness.shutdown_all()
+            gradebook.save()
+            if grade_store is not None:
+                grade_store.close()
+
+        slowest_tests = grader.get_slowest_instructor_tests(Proctor._NUM_SLOWEST_TESTS_TO_LOG)
+        if slowest_tests:
+            self._logger.info('---')
+            self._logger.info('Slowest instructor tests (average across students):')
+            for test_name, avg_duration_ms, num_runs in slowest_tests:
+                self._logger.info(f'  {avg_duration_ms} ms  {test_name}  ({num_runs} runs)')
 
-            email = email.strip(' ')
-            current += 1
+        if incremental:
+            self._logger.info(f'Copied forward {grader.get_num_unchanged()} unchanged of {num_to_grade} students')
+        self._logger.info('---')
+        self._logger.info(f'Saved grades to: {gradebook.get_file_name()}')
+
+        if users_missing_project:
+            self._logger.info('Local project missing for: {}'.format(users_missing_project))
+            if 'chide' in self._argsdict and self._argsdict['chide']:
+                self._logger.info('Chiding people with missing projects...')
+                Postman.send_missing_project_email(users_missing_project, project_name, self._logger)
 
+    def _grade_owner_project(self, email, project_name, project_dir, project_due_dt, grader, gradebook,
+                             project_index, commit_dates, at_due_date, current, num_to_grade, tag_log):
+        """Grades the given project for a single owner. May be called concurrently from grading workers.
+        :param email: Project owner's email
+        :param project_name: Name of the project to grade
+        :param project_dir: Project's directory under Proctor's working directory
+        :param project_due_dt: Project's due datetime in UTC
+        :param grader: Grader that builds, tests and records the owner's grade
+        :param gradebook: GradeBook in which to record problems that prevent grading
+        :param project_index: ProjectIndex of the project's server projects
+        :param commit_dates: CommitDateProvider of the owners' latest commit dates
+        :param at_due_date: True to grade the owner's last commit at or before the due date instead of the clone
+        :param current: Owner's position in the list of owners being graded
+        :param num_to_grade: Number of owners being graded
+        :param tag_log: True to prefix each log message with the owner's email
+        :returns False if the owner's project was not found locally, True otherwise"""
+        if tag_log:
+            self._logger.set_context(email)
+        try:
             self._logger.info('---')
             self._logger.info(f'Owner {email} ({current} of {num_to_grade})')
             if len(email) == 0:
                 self._logger.debug(f"Invalid owner email '{email}'. Check email file for blank lines.")
-                continue
+                return True
 
             dir_to_grade = Path(project_dir) / email    # interesting Path syntax
             if not dir_to_grade.exists():
-                users_missing_project.append(email)
                 self._logger.warning('Local project not found: {}. Try clone.'.format(str(dir_to_grade)))
                 gradebook.local_project_not_found(email)
-                continue
-
-            project = self._server.get_user_project(email, project_name)
+                return False
+
+            try:
+                project = project_index.get_user_project(email)
+                if project and not at_due_date:
+                    latest_commit_date = commit_dates.get_latest_commit_date(email)
+            except GitLabTransientError as ex:
+                gradebook.server_unavailable(email)
+                self._logger.warning(f'Server unavailable. Grade again later. {ex}')
+                return True
             if project:
-                commits = project.commits.list()
-                if commits:
-                    latest_commit_date = commits[0].created_at  # GitLab returns most recent first (index 0)
-                    grader.grade(email, project_name, dir_to_grade, project_due_dt, latest_commit_date)
-                else:
-                    gradebook.commit_not_found(email)
-                    self._logger.warning('No commit. Server project found, no commit.')
+                clone_dir = dir_to_grade
+                if at_due_date:
+                    dir_to_grade, latest_commit_date = self._checkout_at_due_date(email, project_name, dir_to_grade,
+                                                                                  project_due_dt)
+                try:
+                    if latest_commit_date:
+                        grader.grade(email, project_name, dir_to_grade, project_due_dt, latest_commit_date)
+                    else:
+                        gradebook.commit_not_found(email)
+                        self._logger.warning('No commit. Server project found, no commit.')
+                finally:
+                    if dir_to_grade != clone_dir:
+                        LocalRepo(clone_dir).remove_worktree(str(dir_to_grade))
             else:
                 gradebook.server_project_not_found(email)
                 self._logger.warning('Not found. Project not found on server. Check email address.')
-
-        self._logger.info('---')
-        self._logger.info(f'Saving grades to: {gradebook.get_file_name()}')
-        gradebook.save()
-
-        if users_missing_project:
-            self._logger.info('Local project missing for: {}'.format(users_missing_project))
-            if 'chide' in self._argsdict and self._argsdict['chide']:
-                self._logger.info('Chiding people with missing projects...')
-                Postman.send_missing_project_email(users_missing_project, project_name, self._logger)
-
-    def _clone_project(self, project_name, emails, force):
-        """Clones the given project for each email in the specified email file.
+            return True
+        finally:
+            self._logger.clear_context()
+
+    def _checkout_at_due_date(self, email, project_name, clone_dir, project_due_dt):
+        """Checks out the owner's last commit at or before the due date into a worktree of the owner's clone,
+        under Proctor's data directory, to be removed once the owner is graded. The clone itself, i.e., the latest version, is left as is, and no network
+        access is needed unless the clone is shallow.
+        :param email: Project owner's email
+        :param project_name: Name of the project being graded
+        :param clone_dir: Path of the owner's clone
+        :param project_due_dt: Project's due datetime
+        :returns Tuple (directory to grade, commit date), or (clone_dir, None) if there's no commit before the due
+        date or it cannot be checked out."""
+        local_repo = LocalRepo(clone_dir)
+        sha = local_repo.get_last_commit_before(project_due_dt)
+        if sha is None:
+            self._logger.warning('No commit at or before the due date.')
+            return (clone_dir, None)
+        worktree_path = (Path(PathManager.get_proctor_data_dir('worktrees', project_name)) / email).resolve()
+        if not local_repo.add_worktree(str(worktree_path), sha):
+            self._logger.warning(f'Cannot check out commit {sha[:12]} at the due date.')
+            return (clone_dir, None)
+        commit_dates = local_repo.get_commit_dates(sha)
+        self._logger.info(f'Grading commit {sha[:12]} from {commit_dates[0] if commit_dates else "unknown date"}')
+        return (worktree_path, commit_dates[0] if commit_dates else None)
+
+    def _get_max_workers(self):
+        """Determines how many students to grade concurrently: --jobs if given on the command line, otherwise
+        the [Proctor] max_workers key. Defaults to 1, i.e., one student at a time.
+        :returns Number of grading workers"""
+        jobs = self._parse_parameters_from_argv('jobs')['jobs']
+        if jobs is None:
+            jobs = ProctorConfig.get_config_int('Proctor', 'max_workers', 1)
+        return max(1, jobs)
+
+    def _clone_project(self, project_name, emails, force, max_workers=None):
+        """Clones the given project for each email in the specified email file. Projects are cloned concurrently,
+        and a summary of the outcomes is logged when all are done.
         :arg project_name: Name of the project to clone, e.g., pa1-review-student-master
         :arg emails: List of emails for which to clone projects
-        :arg force: If true, causes clone to overwrite existing target directories"""
+        :arg force: If true, causes clone to overwrite existing target directories
+        :arg max_workers: Number of projects to clone concurrently. None to use the [Proctor] clone_workers key."""
         if emails is None:
             self._logger.error("Cannot clone projects without valid emails. Exiting.")
             sys.exit(-1)
@@ -239,15 +436,181 @@ class Proctor:
         # Filter out blank lines
         owner_emails = [email for email in emails if len(email.strip(' ')) > 0]
 
+        clone_strategy = PathManager.get_clone_strategy(project_name)
+        try:
+            LocalRepo.get_clone_options(clone_strategy)
+        except ValueError as ex:
+            self._logger.error(str(ex))
+            return
+
+        if max_workers is None:
+            max_workers = ProctorConfig.get_config_int('Proctor', 'clone_workers', Proctor._DEFAULT_CLONE_WORKERS)
+        max_workers = max(1, max_workers)
+
         # Clone 'em
-        self._logger.info('Cloning project: {}'.format(project_name))
-        for email in owner_emails:
-            gitlab_project = self._server.get_user_project(email, project_name)
-            if gitlab_project:
-                dest_path_name = PathManager.build_dest_path_name(self._working_dir_name, email, project_name)
-                self._server.clone_project(gitlab_project, dest_path_name, force)
-            else:
+        self._logger.info('Cloning project: {}'.format(project_name) +
+                          (f' ({clone_strategy} clones)' if clone_strategy != LocalRepo.CLONE_STRATEGY_FULL else '') +
+                          (f' ({max_workers} workers)' if max_workers > 1 else ''))
+        start = time.monotonic()
+        project_index = self._get_project_index(project_name).prefetch_owners(owner_emails, with_commits=False)
+
+        # Student repos are forks of the starter repo, so clones borrow the starter's objects from a local mirror
+        mirror_path_name = None
+        starter_repo = PathManager.get_starter_repo(project_name)
+        if starter_repo:
+            timeout_secs = ProctorConfig.get_config_int('Proctor', 'clone_timeout_secs',
+                                                        GitLabServer.DEFAULT_CLONE_TIMEOUT_SECS) or None
+            mirror_path_name = ReferenceMirror(project_name, starter_repo, timeout_secs).prepare()
+        dissociate = PathManager.get_clone_dissociate(project_name)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(self._clone_owner_project, email, project_name, force, clone_strategy,
+                                       project_index, mirror_path_name, dissociate, max_workers > 1)
+                       for email in owner_emails]
+            results = [future.result() for future in futures]
+        self._log_clone_summary(list(zip(owner_emails, results)), time.monotonic() - start)
+
+    def _clone_owner_project(self, email, project_name, force, clone_strategy, project_index, mirror_path_name,
+                             dissociate, tag_log):
+        """Clones the given project for a single owner. May be called concurrently from cloning workers.
+        :param email: Project owner's email
+        :param project_name: Name of the project to clone
+        :param force: If true, overwrites or updates the existing target directory
+        :param clone_strategy: One of the LocalRepo.CLONE_STRATEGY_* names
+        :param project_index: ProjectIndex of the project's server projects
+        :param mirror_path_name: Starter repo mirror from which clones borrow objects, or None
+        :param dissociate: True to copy the objects borrowed from the mirror into the clone
+        :param tag_log: True to prefix each log message with the owner's email
+        :returns CloneResult, or None if the owner's project was not found on the server. Errors are reported as
+        CLONE_FAILED results."""
+        if tag_log:
+            self._logger.set_context(email)
+        try:
+            try:
+                gitlab_project = project_index.get_user_project(email)
+            except GitLabTransientError as ex:
+                self._logger.warning(f'Server unavailable. Clone again later. {ex}')
+                return CloneResult(GitLabServer.CLONE_FAILED, 0.0, str(ex))
+            if not gitlab_project:
                 self._logger.warning(f"Project not found. Confirm server connectivity and login, project name '{project_name}' and email '{email}'.")
+                return None
+            dest_path_name = PathManager.build_dest_path_name(self._working_dir_name, email, project_name)
+            return self._server.clone_project(gitlab_project, dest_path_name, force, clone_strategy,
+                                              mirror_path_name, dissociate)
+        except Exception as ex:
+            # One owner's failure, e.g., an unremovable directory, must not stop the other owners' clones
+            self._logger.error(f'Cannot clone: {type(ex).__name__}: {ex}')
+            return CloneResult(GitLabServer.CLONE_FAILED, 0.0, f'{type(ex).__name__}: {ex}')
+        finally:
+            self._logger.clear_context()
+
+    def _log_clone_summary(self, owner_results, elapsed_secs):
+        """Logs how many projects were cloned, updated, skipped, failed and not found, the slowest clones and the
+        owners whose projects need attention.
+        :param owner_results: List of (email, CloneResult or None) tuples
+        :param elapsed_secs: Wall-clock time taken by the whole clone"""
+        outcomes = [GitLabServer.CLONE_CLONED, GitLabServer.CLONE_UPDATED, GitLabServer.CLONE_EXISTS,
+                    GitLabServer.CLONE_FAILED]
+        counts = {outcome: 0 for outcome in outcomes}
+        not_found = []
+        failed = []
+        for email, result in owner_results:
+            if result is None:
+                not_found.append(email)
+                continue
+            counts[result.outcome] += 1
+            if result.outcome == GitLabServer.CLONE_FAILED:
+                failed.append(email)
+
+        self._logger.info('---')
+        self._logger.info('Clone summary: ' + ', '.join(f'{counts[outcome]} {outcome}' for outcome in outcomes) +
+                          f', {len(not_found)} not found in {elapsed_secs:.1f}s')
+        timed = sorted(((result.elapsed_secs, email) for email, result in owner_results
+                        if result is not None and result.outcome != GitLabServer.CLONE_EXISTS), reverse=True)
+        if timed:
+            self._logger.info('Slowest clones:')
+            for clone_secs, email in timed[:Proctor._NUM_SLOWEST_CLONES_TO_LOG]:
+                self._logger.info(f'  {clone_secs:.1f}s  {email}')
+        if failed:
+            self._logger.warning(f'Clone failed for: {failed}')
+        if not_found:
+            self._logger.warning(f'Server project not found for: {not_found}')
+
+    def _get_project_index(self, project_name):
+        """Returns the index of the server projects with the given name, prefetching it on first use. The index is
+        kept for the rest of the run, so that, e.g., srefresh --grade clones and grades from the same index.
+        :param project_name: Name of the project
+        :returns ProjectIndex"""
+        if project_name not in self._project_indexes:
+            self._project_indexes[project_name] = ProjectIndex(self._server, project_name).prefetch()
+        return self._project_indexes[project_name]
+
+    def _report(self):
+        """Reports grades from the grade store: a student's grades across projects (--owner), one grading run
+        of a project (--project, --run), or else the list of grading runs."""
+        parameters = self._parse_parameters_from_argv('project', 'owner', 'run')
+        grade_store = GradeStore()
+        try:
+            if parameters['owner']:
+                self._report_student(grade_store, parameters['owner'])
+            elif parameters['project'] or parameters['run']:
+                self._report_run(grade_store, parameters['project'], parameters['run'])
+            else:
+                self._report_runs(grade_store)
+        finally:
+            grade_store.close()
+
+    def _report_runs(self, grade_store):
+        """Lists the grading runs, newest first.
+        :param grade_store: GradeStore to query"""
+        runs = grade_store.get_runs()
+        if not runs:
+            self._logger.info(f'No grading runs in {grade_store.get_file_name()}')
+            return
+        self._logger.info(f"{'run':>5}  {'project':30}  {'started':19}  {'students':>8}  {'on time':>7}  grade book")
+        for run in runs:
+            self._logger.info(f"{run['run_id']:>5}  {run['project_name']:30}  {run['started_at']:19}  "
+                              f"{run['num_students']:>8}  {run['num_ontime'] or 0:>7}  {run['gradebook_file']}"
+                              f"{'' if run['finished_at'] else ' (unfinished)'}")
+
+    def _report_run(self, grade_store, project_name, run_id):
+        """Lists each student's results in a grading run and the run's most failed instructor tests.
+        :param grade_store: GradeStore to query
+        :param project_name: Project whose newest run is reported, if run_id is None
+        :param run_id: ID of the run to report, or None"""
+        if run_id is None:
+            run_id = grade_store.get_latest_run_id(project_name)
+            if run_id is None:
+                self._logger.warning(f'No grading runs for {project_name}')
+                return
+        grades = grade_store.get_run_grades(run_id)
+        self._logger.info(f'Run {run_id}: {len(grades)} students')
+        for grade in grades:
+            self._logger.info(f"  {grade['email']:30}  on time: {grade['is_ontime']:5}  "
+                              f"student tests: {grade['student_tests_ratio']}  "
+                              f"instructor tests: {grade['instructor_tests_ratio']}"
+                              f"{'  ' + grade['notes'] if grade['notes'] else ''}")
+        tests = grade_store.get_test_summary(run_id)
+        if tests:
+            self._logger.info('Instructor tests (most failed first):')
+            for test in tests:
+                self._logger.info(f"  {test['num_failed']:>4} of {test['num_runs']:<4} failed  "
+                                  f"{test['avg_duration_ms'] if test['avg_duration_ms'] is not None else '-':>6} ms avg  "
+                                  f"{test['test_name']}")
+
+    def _report_student(self, grade_store, email):
+        """Lists a student's grade in the newest run of each project.
+        :param grade_store: GradeStore to query
+        :param email: Student's email"""
+        grades = grade_store.get_student_history(email)
+        if not grades:
+            self._logger.warning(f'No grades for {email}')
+            return
+        self._logger.info(f'{email}:')
+        for grade in grades:
+            self._logger.info(f"  {grade['project_name']:30}  run {grade['run_id']:<4}  "
+                              f"on time: {grade['is_ontime']:5}  student tests: {grade['student_tests_ratio']}  "
+                              f"instructor tests: {grade['instructor_tests_ratio']}")
 
     def _display_config_info(self):
         """Displays basic logging information."""
@@ -257,6 +620,12 @@ class Proctor:
         if self._args.verbose:
             self._display_config_file()
 
+    def _jvm_warmup(self):
+        """Creates the class data sharing archive applied to JUnit runs and reports JVM startup time with and
+        without the JVM profile."""
+        self._logger.info('Warming up the JVM profile...')
+        JvmProfile.warmup()
+
     def _display_config_file(self):
         """Displays the contents of the configuration file. Note that the contents of the configuration
         file are not logger and simply displayed on the console."""
@@ -296,11 +665,15 @@ class Proctor:
             parameters[arg] = self._argsdict[arg] if arg in self._argsdict else None
         return parameters
 
-    def _list_projects_for(self, owner):
+    def _list_projects_for(self, owner, owner_projects=None):
         """Gets the given owner's projects from the server
         :param Email of the project owner
+        :param owner_projects: Tuple (project count, list of projects) already fetched with get_projects_for_owner,
+        or None to fetch it
         :return List of projects owned by the given owner (email)"""
-        num_projects, projects = self._server.get_projects_for_owner(owner)
+        if owner_projects is None:
+            owner_projects = self._server.get_projects_for_owner(owner)
+        num_projects, projects = owner_projects
         self._logger.info(f'{owner} has {num_projects} projects')
         count = 1
         for p in projects:
@@ -320,12 +693,15 @@ class Proctor:
         projects = dict()
         count = 1
 
+        # Fetch everyone's projects in one pass over the server's projects, then list them in file order
+        valid_emails = [email.strip() for email in owner_emails if email.strip()]
+        owners_projects = self._server.get_projects_for_owners(valid_emails)
         for email in owner_emails:
             self._logger.info('---')
             self._logger.info(f'Owner: {email} ({count} of {num_emails})')
             email = email.strip()
             if email:
-                projects[email] = self._list_projects_for(email)
+                projects[email] = self._list_projects_for(email, owners_projects[email])
             else:
                 self._logger.info(f"Invalid email '{email}' in file. Skipped.")
             count += 1
@@ -406,13 +782,14 @@ class Proctor:
         return owner_emails
 
     def done(self):
-        # Possibly print something here
-        pass
+        """Releases resources held for the duration of the run, e.g., the compile server and test harnesses."""
+        CompileServer.shutdown_all()
+        TestHarness.shutdown_all()
 
 if __name__ == "__main__":
 
     if len(sys.argv) <= 1:
-        termcolor.cprint("usage: proctor.py [-h] {config, glping, clone, grade, group, srefresh}", color='red')
+        termcolor.cprint("usage: proctor.py [-h] {config, glping, clone, grade, group, srefresh, jvm-warmup, report}", color='red')
         sys.exit(-1)
 
     ProctorConfig.init(None)
@@ -0,0 +1,122 @@
+import threading
+from gitlab.exceptions import GitlabError
+from gitlabserver import GitLabServer, GitLabTransientError
+from ploggerfactory import ProctorLoggerFactory
+
+
+class ProjectIndex:
+    """In-memory index of the server projects with a given name, keyed by server project path, e.g.,
+    'jsmith/pa1-review-student-master'. The index is filled by a prefetch that lists every visible project
+    with that name in a few paginated calls, rather than one call per student. Lookups that miss the index,
+    e.g., because a project was created after the prefetch, fall back to fetching the single project.
+
+    Each project's latest commit date is fetched on first use and then kept in the index, so that cloning and
+    grading the same project in one run ask the server once. Lookups the server is too busy to answer raise
+    GitLabTransientError and are not kept, so that a busy server is never mistaken for a missing project."""
+
+    def __init__(self, server, project_name):
+        """Initializes the ProjectIndex. Call prefetch to fill it.
+        :param server: GitLabServer to query
+        :param project_name: Name of the project being worked on"""
+        self._logger = ProctorLoggerFactory.getLogger()
+        self._server = server
+        self._project_name = project_name
+        self._projects = {}             # server project path -> project
+        self._latest_commit_dates = {}  # server project path -> latest commit date, or None if no commits
+        self._lock = threading.Lock()   # looked up concurrently by grading workers
+
+    def prefetch(self):
+        """Lists all visible projects with the index's project name and indexes them by server project path.
+        :returns This ProjectIndex"""
+        try:
+            projects = self._server.get_projects_named(self._project_name)
+        except GitlabError as ex:
+            if not GitLabServer.is_transient_error(ex):
+                raise
+            self._logger.warning(f'Cannot prefetch server projects, server unavailable: {ex}. '
+                                 'Looking up projects one at a time.')
+            projects = []
+        with self._lock:
+            for project in projects:
+                if project.path == self._project_name:
+                    self._projects[project.path_with_namespace.lower()] = project
+            num_indexed = len(self._projects)
+        self._logger.info(f'Prefetched {num_indexed} server projects named {self._project_name}')
+        return self
+
+    def get_user_project(self, owner_email):
+        """Returns the owner's project from the index, fetching it from the server on a miss.
+        :param owner_email: Project owner's email
+        :returns The owner's GitLab project, or None if it's not found on the server.
+        :raises GitLabTransientError if the server cannot answer right now"""
+        key = ProjectIndex._get_key(self._project_name, owner_email)
+        with self._lock:
+            project = self._projects.get(key)
+        if project is None:
+            project = self._server.get_user_project(owner_email, self._project_name)
+            if project is not None:
+                with self._lock:
+                    self._projects[key] = project
+        return project
+
+    def prefetch_owners(self, owner_emails, with_commits=True):
+        """Makes sure the given owners' projects and, optionally, latest commit dates are in the index, fetching
+        any that are missing concurrently. Owners whose lookups the server cannot answer right now are left out,
+        to be looked up again when they're used.
+        :param owner_emails: Project owners' emails
+        :param with_commits: True to also fetch each project's latest commit date
+        :returns This ProjectIndex"""
+        owner_emails = [email for email in owner_emails if email]
+        lookup = self.get_latest_commit_date if with_commits else self.get_user_project
+
+        def prefetch_owner(email):
+            try:
+                lookup(email)
+            except GitLabTransientError as ex:
+                self._logger.debug(str(ex))
+
+        self._server.map_concurrent(prefetch_owner, owner_emails)
+        return self
+
+    def get_last_activity_at(self, owner_email):
+        """Returns the date of the owner's last activity on the project, as reported by the server.
+        :param owner_email: Project owner's email
+        :returns Last activity date string, or None if the project is not found."""
+        project = self.get_user_project(owner_email)
+        return getattr(project, 'last_activity_at', None) if project is not None else None
+
+    def get_latest_commit_date(self, owner_email):
+        """Returns the date of the latest commit to the owner's project, fetching only that commit from the
+        server the first time it's asked for.
+        :param owner_email: Project owner's email
+        :returns Latest commit date string, e.g., '2019-03-03T23:39:40.000-05:00', or None if the project is not
+        found, has no commits or its commits cannot be read.
+        :raises GitLabTransientError if the server cannot answer right now"""
+        key = ProjectIndex._get_key(self._project_name, owner_email)
+        with self._lock:
+            if key in self._latest_commit_dates:
+                return self._latest_commit_dates[key]
+
+        project = self.get_user_project(owner_email)
+        latest_commit_date = None
+        if project is not None:
+            try:
+                commits = project.commits.list(per_page=1)
+            except GitlabError as ex:
+                if GitLabServer.is_transient_error(ex):
+                    raise GitLabTransientError(f'Server unavailable getting commits of {key}: {ex}') from ex
+                self._logger.debug(f'Cannot get commits of {key}: {ex}')    # e.g., 404 for an empty repository
+                commits = []
+            if commits:
+                latest_commit_date = commits[0].created_at    # GitLab returns most recent first (index 0)
+        with self._lock:
+            self._latest_commit_dates[key] = latest_commit_date
+        return latest_commit_date
+
+    @staticmethod
+    def _get_key(project_name, owner_email):
+        """Builds the index key of an owner's project.
+        :param project_name: Name of the project
+        :param owner_email: Project owner's email
+        :returns Server project path, lower case, with '/' separators."""
+        return GitLabServer.build_server_project_path(project_name, owner_email).replace('\\', '/').lower()
@@ -0,0 +1,83 @@
+import hashlib
+import os
+import shutil
+import subprocess
+from pathlib import Path
+from pathmgr import PathManager
+from ploggerfactory import ProctorLoggerFactory
+
+
+class ReferenceMirror:
+    """Bare mirror of a project's starter repository, kept under Proctor's data directory. Every student repo
+    of a project is forked from the same starter repo, so student clones borrow the starter's objects from the
+    mirror, through git alternates, and fetch only the commits the student made.
+
+    A clone that borrows objects breaks if the objects it borrows are removed, so the mirror is never garbage
+    collected or deleted by Proctor: fetches only add objects, and a mirror is named after its starter repo's URL
+    so that changing the URL creates a new mirror instead of replacing the old one. Clones made with dissociate
+    copy the borrowed objects and no longer depend on the mirror."""
+
+    def __init__(self, project_name, starter_repo_url, timeout_secs=None):
+        """Initializes the ReferenceMirror.
+        :param project_name: Name of the project whose student repos are forked from the starter repo
+        :param starter_repo_url: URL of the starter repo
+        :param timeout_secs: Time limit of each git command. None for no limit."""
+        self._logger = ProctorLoggerFactory.getLogger()
+        self._project_name = project_name
+        self._starter_repo_url = starter_repo_url
+        self._timeout_secs = timeout_secs
+        url_hash = hashlib.sha1(starter_repo_url.encode('utf-8')).hexdigest()[:12]
+        self._path = Path(PathManager.get_proctor_data_dir('mirrors')) / f'{project_name}-{url_hash}.git'
+
+    def get_path_name(self):
+        """Returns the mirror's directory.
+        :returns Full path name of the bare mirror."""
+        return str(self._path)
+
+    def prepare(self):
+        """Creates the mirror, or fetches the starter repo's new commits into an existing mirror.
+        :returns Full path name of the mirror, or None if there's no usable mirror."""
+        if self._path.exists():
+            self._logger.info(f'Updating starter repo mirror: {self._starter_repo_url}...')
+            if not self._git('-C', str(self._path), 'fetch', '--quiet', 'origin'):
+                self._logger.warning('Cannot update starter repo mirror. Using it as is.')
+            return str(self._path)
+
+        self._logger.info(f'Mirroring starter repo: {self._starter_repo_url}...')
+        tmp_path = self._path.with_name(self._path.name + '.tmp')
+        if tmp_path.exists():
+            shutil.rmtree(tmp_path)
+        steps = [('clone', '--mirror', '--quiet', self._starter_repo_url, str(tmp_path)),
+                 ('-C', str(tmp_path), 'config', 'gc.auto', '0'),
+                 ('-C', str(tmp_path), 'config', 'gc.pruneExpire', 'never')]
+        for step in steps:
+            if not self._git(*step):
+                self._logger.warning('Cannot mirror starter repo. Cloning without it.')
+                shutil.rmtree(tmp_path, ignore_errors=True)
+                return None
+        os.replace(tmp_path, self._path)    # clones only ever see a complete mirror
+        return str(self._path)
+
+    @staticmethod
+    def get_clone_options(mirror_path_name, dissociate=False):
+        """Returns the git clone options that borrow objects from a mirror.
+        :param mirror_path_name: Full path name of the mirror, or None for no mirror
+        :param dissociate: True to copy the borrowed objects into the clone, so that it does not depend on the mirror
+        :returns List of git clone options, empty if there's no mirror."""
+        if not mirror_path_name:
+            return []
+        return ['--reference-if-able', mirror_path_name] + (['--dissociate'] if dissociate else [])
+
+    def _git(self, *args):
+        """Runs a git command, logging its failure.
+        :param args: git arguments
+        :returns True if the command succeeded."""
+        try:
+            result = subprocess.run(['git'] + list(args), stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                    stderr=subprocess.PIPE, timeout=self._timeout_secs)
+        except subprocess.TimeoutExpired:
+            self._logger.debug(f"git {' '.join(args)} timed out after {self._timeout_secs}s")
+            return False
+        if result.returncode != 0:
+            self._logger.debug(f"git {' '.join(args)} failed: {result.stderr.decode('utf-8', errors='replace').strip()}")
+        return result.returncode == 0
@@ -0,0 +1,189 @@
+import os
+import queue
+import subprocess
+import threading
+from collections import namedtuple
+from javahelpers import JavaHelpers
+from jvmprofile import JvmProfile
+from pathmgr import PathManager
+from pconfig import ProctorConfig
+from ploggerfactory import ProctorLoggerFactory
+
+# Outcome of running one suite in the harness. status is OK, FAILED, TIMEOUT, RESOURCE or ERROR. tests is a list
+# of (name, status, duration in ms) tuples, one per test, in the format written by ProctorRunListener.
+HarnessResult = namedtuple('HarnessResult', ['status', 'tests_run', 'failures', 'message', 'tests'])
+
+
+class TestHarnessError(Exception):
+    """Raised when the test harness cannot be started or dies while running a suite."""
+    pass
+
+
+class TestHarness:
+    """Long-lived JUnit harness that runs many students' test suites in one JVM. The harness is a small Java
+    helper (java/ProctorGradingHarness.java) that loads each student's classes in an isolated URLClassLoader and
+    enforces each run's timeout itself. Proctor talks to it over a pipe.
+
+    Each grading worker thread gets its own harness, started lazily on first use. A harness asks to be recycled
+    when a test hangs, calls System.exit or exhausts the heap, and after a configurable number of runs to bound
+    classloader leaks; it's then restarted on the next run. All harnesses are shut down when a project's grading
+    is done, so that idle harness JVMs don't pile up when several projects are graded in one run."""
+
+    _HELPER_CLASS = 'ProctorGradingHarness'
+    _DEFAULT_MAX_RUNS = 50
+    _RESPONSE_GRACE_SECS = 30   # extra time to wait for a response beyond the run's own timeout
+
+    _harnesses = []
+    _registry_lock = threading.Lock()
+    _thread_harness = threading.local()
+
+    @staticmethod
+    def is_enabled():
+        """Determines if test suites should run in the harness, based on the [Proctor] test_harness key.
+        :returns True if the harness is enabled."""
+        return ProctorConfig.get_config_bool('Proctor', 'test_harness')
+
+    @staticmethod
+    def get_instance():
+        """Returns the calling thread's harness, creating it if necessary. The harness process itself is started
+        on the first run.
+        :returns The calling thread's TestHarness."""
+        harness = getattr(TestHarness._thread_harness, 'harness', None)
+        if harness is None:
+            harness = TestHarness()
+            TestHarness._thread_harness.harness = harness
+            with TestHarness._registry_lock:
+                TestHarness._harnesses.append(harness)
+        return harness
+
+    @staticmethod
+    def shutdown_all():
+        """Shuts down every harness started by any thread."""
+        with TestHarness._registry_lock:
+            for harness in TestHarness._harnesses:
+                harness._stop()
+            TestHarness._harnesses = []
+
+    def __init__(self):
+        """Initializes the TestHarness."""
+        self._logger = ProctorLoggerFactory.getLogger()
+        self._process = None
+        self._responses = None
+        self._log_file = None
+        self._next_id = 0
+
+    def run(self, suite_class, classpath_entries, timeout_secs, memory_mb=None):
+        """Runs a test suite in the harness.
+        :param suite_class: Fully qualified name of the JUnit suite class to run
+        :param classpath_entries: List of directories and jars holding the student's classes and the tests.
+        JUnit itself is provided by the harness.
+        :param timeout_secs: Wall-clock timeout for the run, enforced by the harness. None for no timeout.
+        :param memory_mb: Maximum heap size of the harness JVM, used when the harness is (re)started. May be None.
+        :returns HarnessResult
+        :raises TestHarnessError if the harness cannot be started or dies during the run"""
+        if self._process is None or self._process.poll() is not None:
+            self._start(memory_mb)
+
+        self._next_id += 1
+        run_id = str(self._next_id)
+        timeout_ms = int(timeout_secs * 1000) if timeout_secs else 0
+        classpath = os.pathsep.join(classpath_entries)
+        try:
+            self._process.stdin.write(f'RUN {run_id}\t{timeout_ms}\t{suite_class}\t{classpath}\n')
+            self._process.stdin.flush()
+        except OSError as ex:
+            self._crash(ex)
+
+        response_timeout = timeout_secs + TestHarness._RESPONSE_GRACE_SECS if timeout_secs else None
+        tests = []
+        line = self._read_line(response_timeout)
+        while line.startswith(f'TEST {run_id}\t'):
+            _, status, duration_ms, name = line.split('\t', 3)
+            tests.append((JavaHelpers.unescape(name), status, int(duration_ms)))
+            line = self._read_line(response_timeout)
+        if not line.startswith(f'RESULT {run_id}\t'):
+            self._crash(ValueError(f'unexpected response: {line}'))
+        _, status, tests_run, failures, recycle, message = line.split('\t', 5)
+
+        if recycle == '1':
+            self._logger.debug('Recycling test harness')
+            self._stop()
+        return HarnessResult(status, int(tests_run), int(failures), JavaHelpers.unescape(message), tests)
+
+    def _start(self, memory_mb):
+        """Compiles (if needed) and launches the harness, waiting until it reports that it's ready.
+        :param memory_mb: Maximum heap size of the harness JVM. May be None."""
+        self._stop()
+        junit_cp = PathManager.get_junit_classpath()
+        try:
+            helper_cp = JavaHelpers.get_helper_classpath(TestHarness._HELPER_CLASS, compile_classpath=junit_cp)
+        except RuntimeError as ex:
+            raise TestHarnessError(str(ex))
+
+        max_runs = ProctorConfig.get_config_int('Proctor', 'harness_max_runs', TestHarness._DEFAULT_MAX_RUNS)
+        java_options = JvmProfile.get_java_options() + [f'-Dproctor.harness.maxRuns={max_runs}']
+        if memory_mb:
+            java_options.append(f'-Xmx{memory_mb}m')
+
+        self._log_file = open(JavaHelpers.get_helper_log_file_name(TestHarness._HELPER_CLASS), mode='at')
+        self._process = subprocess.Popen(['java'] + java_options +
+                                         ['-cp', os.pathsep.join([junit_cp, helper_cp]), TestHarness._HELPER_CLASS],
+                                         stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=self._log_file,
+                                         universal_newlines=True, encoding='utf-8')
+
+        # Responses are read on a separate thread so that waiting for one can time out
+        self._responses = queue.Queue()
+        threading.Thread(target=self._read_responses, args=(self._process.stdout, self._responses),
+                         daemon=True).start()
+
+        line = self._read_line(TestHarness._RESPONSE_GRACE_SECS)
+        if line != 'READY':
+            self._crash(ValueError(f'unexpected response: {line}'))
+        self._logger.debug(f'Test harness started (pid={self._process.pid})')
+
+    def _stop(self):
+        """Asks the harness to quit and waits for it to exit."""
+        if self._process is not None and self._process.poll() is None:
+            try:
+                self._process.stdin.write('QUIT\n')
+                self._process.stdin.flush()
+                self._process.wait(timeout=10)
+            except (OSError, subprocess.TimeoutExpired):
+                self._process.kill()
+                self._process.wait()
+        self._process = None
+        if self._log_file is not None:
+            self._log_file.close()
+            self._log_file = None
+
+    @staticmethod
+    def _read_responses(stream, responses):
+        """Moves lines from the harness's stdout to the response queue until end of file, which is marked
+        by None.
+        :param stream: Harness's stdout
+        :param responses: Queue to which lines are added"""
+        for line in stream:
+            responses.put(line.rstrip('\n'))
+        responses.put(None)
+
+    def _read_line(self, timeout_secs):
+        """Reads one response line from the harness.
+        :param timeout_secs: Maximum number of seconds to wait, or None to wait indefinitely
+        :returns Line read, sans the trailing newline
+        :raises TestHarnessError if the harness has exited or does not respond in time"""
+        try:
+            line = self._responses.get(timeout=timeout_secs)
+        except queue.Empty:
+            self._crash(TimeoutError('no response'))
+        if line is None:
+            self._crash(EOFError(f'harness exited with code {self._process.wait()}'))
+        return line
+
+    def _crash(self, ex):
+        """Kills the harness so that it's restarted on the next run.
+        :param ex: Exception that describes the failure
+        :raises TestHarnessError always"""
+        if self._process is not None and self._process.poll() is None:
+            self._process.kill()
+            self._process.wait()
+        raise TestHarnessError(f'Test harness failed: {ex}')
@@ -0,0 +1,119 @@
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+
+class AdaptiveThrottle:
+    """Client-side token bucket that paces requests to the GitLab server and adapts its rate to how the server
+    copes. The rate grows slowly while responses are quick and successful, and is cut when the server answers
+    429 Too Many Requests or 503 Service Unavailable, when responses get slow, or when the server's RateLimit-*
+    headers show the remaining budget running low. A Retry-After header pauses all requests until it expires."""
+
+    _MIN_RATE = 0.5             # requests per second
+    _INCREASE_STEP = 0.5        # requests per second added after each quick success
+    _DECREASE_FACTOR = 0.5      # rate multiplier after a 429 or 503
+    _SLOW_DECREASE_FACTOR = 0.8  # rate multiplier after a slow response
+    _LOW_REMAINING_FRACTION = 0.1
+
+    def __init__(self, max_rate, slow_response_secs):
+        """Initializes the AdaptiveThrottle at its maximum rate.
+        :param max_rate: Maximum number of requests per second. Also the bucket size, i.e., the largest burst.
+        :param slow_response_secs: Responses that take longer than this slow the rate down"""
+        self._max_rate = max(max_rate, AdaptiveThrottle._MIN_RATE)
+        self._slow_response_secs = slow_response_secs
+        self._rate = self._max_rate
+        self._tokens = self._max_rate
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def get_rate(self):
+        """Returns the current rate.
+        :returns Requests per second."""
+        with self._lock:
+            return self._rate
+
+    def acquire(self):
+        """Blocks until a request may be sent."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                bucket_size = max(1.0, self._rate)
+                self._tokens = min(bucket_size, self._tokens + (now - self._updated_at) * self._rate)
+                self._updated_at = now
+                wait_secs = self._paused_until - now
+                if wait_secs <= 0:
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait_secs = (1 - self._tokens) / self._rate
+            time.sleep(wait_secs)
+
+    def on_response(self, status_code, headers, elapsed_secs):
+        """Adapts the rate to a response from the server.
+        :param status_code: Response's HTTP status code
+        :param headers: Response's headers
+        :param elapsed_secs: Time the server took to respond"""
+        with self._lock:
+            if status_code in (429, 503):
+                self._set_rate(self._rate * AdaptiveThrottle._DECREASE_FACTOR)
+                retry_after_secs = AdaptiveThrottle.get_retry_after_secs(headers)
+                if retry_after_secs:
+                    self._paused_until = max(self._paused_until, time.monotonic() + retry_after_secs)
+            elif elapsed_secs > self._slow_response_secs:
+                self._set_rate(self._rate * AdaptiveThrottle._SLOW_DECREASE_FACTOR)
+            elif status_code < 500:
+                self._set_rate(self._rate + AdaptiveThrottle._INCREASE_STEP)
+            self._apply_rate_limit_headers(headers)
+
+    @staticmethod
+    def get_backoff_secs(attempt, backoff_secs, headers):
+        """Returns how long to wait before retrying a request the server was too busy to answer: the server's
+        Retry-After, if given, or else a random time up to backoff_secs * 2 ** attempt (full jitter), so that
+        concurrent requests don't retry in lockstep.
+        :param attempt: Number of retries so far
+        :param backoff_secs: Backoff factor
+        :param headers: Headers of the busy response
+        :returns Seconds to wait."""
+        retry_after_secs = AdaptiveThrottle.get_retry_after_secs(headers)
+        if retry_after_secs is not None:
+            return retry_after_secs
+        return random.uniform(0, backoff_secs * 2 ** attempt)
+
+    @staticmethod
+    def get_retry_after_secs(headers):
+        """Reads the Retry-After header, which is either a number of seconds or an HTTP date.
+        :param headers: Response headers
+        :returns Seconds to wait, or None if the header is absent or cannot be read."""
+        retry_after = headers.get('Retry-After')
+        if retry_after is None:
+            return None
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+    def _apply_rate_limit_headers(self, headers):
+        """Slows down to spread the remaining request budget until the budget resets, when the server's
+        RateLimit-Remaining header shows it running low. Called with the lock held.
+        :param headers: Response headers"""
+        try:
+            limit = int(headers.get('RateLimit-Limit'))
+            remaining = int(headers.get('RateLimit-Remaining'))
+            reset_at = int(headers.get('RateLimit-Reset'))      # Unix time
+        except (TypeError, ValueError):
+            return
+        if remaining > limit * AdaptiveThrottle._LOW_REMAINING_FRACTION:
+            return
+        secs_to_reset = max(1.0, reset_at - time.time())
+        self._set_rate(min(self._rate, remaining / secs_to_reset))
+
+    def _set_rate(self, rate):
+        """Sets the rate within its bounds. Called with the lock held.
+        :param rate: Requests per second"""
+        self._rate = min(self._max_rate, max(AdaptiveThrottle._MIN_RATE, rate))
@@ -1,34 +1,82 @@
 import subprocess
 import os
 import re
+import signal
+import tempfile
+from collections import namedtuple
+from pathlib import Path
+from javahelpers import JavaHelpers
+from jvmprofile import JvmProfile
+from outputcapture import OutputCapture
 from pathmgr import PathManager
+from pconfig import ProctorConfig
+from testharness import TestHarness, TestHarnessError
 from ploggerfactory import ProctorLoggerFactory
 
+try:
+    import resource     # POSIX only. CPU limits are not applied where it's unavailable, e.g., Windows.
+except ImportError:
+    resource = None
+
+
+# Result of a single test, e.g., ('edu.wit.cs.comp1050.tests.Tests#testAdd', 'PASS', 12). status is PASS, FAIL,
+# SKIP (assumption failure) or IGNORED.
+TestCaseResult = namedtuple('TestCaseResult', ['name', 'status', 'duration_ms'])
+
+
+class TestRunLimitError(Exception):
+    """Raised when a JUnit run is stopped because it exceeded one of its limits."""
+
+    # Short description of the outcome, recorded in the gradebook in place of a test ratio
+    outcome = 'Limit exceeded'
+
+
+class TestRunTimeoutError(TestRunLimitError):
+    """Raised when a JUnit run exceeds its wall-clock timeout and is killed."""
+    outcome = 'Timed out'
+
+
+class TestRunResourceLimitError(TestRunLimitError):
+    """Raised when a JUnit run is killed for exceeding its CPU time or memory limit."""
+    outcome = 'Resource limit'
+
+
 class UnitTestRunner:
     """Runs JUnit-based tests and parses results"""
-    def __init__(self):
-        """Initializes UnitTestRunner"""
+    _CPU_LIMIT_GRACE_SECS = 5   # time between the soft (SIGXCPU) and hard (SIGKILL) CPU limits
+    _OUTPUT_DRAIN_SECS = 10     # time allowed to read remaining output after the JVM exits
+
+    _RUN_LISTENER_CLASS = 'ProctorRunListener'
+
+    # JUnit 4.x console summary lines
+    _JUNIT_OK_PATTERN = r'OK \((\d+) tests?\)'
+    _JUNIT_FAILURES_PATTERN = r'Tests run: (\d+),  Failures: (\d+)'
+
+    def __init__(self, keep_output=False):
+        """Initializes UnitTestRunner
+        :param keep_output: True to write each run's full output to a compressed file under the project's
+        test-output directory"""
         self._logger = ProctorLoggerFactory.getLogger()
+        self._keep_output = keep_output
 
     def run_instructor_unit_tests(self, email, project_name, dir_to_grade, suite_dir, suite_class):
         """Runs the project's unit test. Assumes JUnit as testing framework.
           :param email: Project owner's email
           :param project_name: Project being graded
           :param dir_to_grade: Root of directory tree where project files live
-          :param suite_dir: Full path to  the JUnit test suite, e.g., Grading, sans the .class extention;
+          :param suite_dir: Directory or jar that holds the compiled JUnit test suite
           :param suite_class: Name of test suite class, sans the .class extension
-          :returns Ratio of passed test/all tests as a floating point number. 1.0 means all tests passed."""
+          :returns Tuple (number of tests executed, ratio of passed tests/all tests as a floating point number,
+          list of TestCaseResult). A ratio of 1.0 means all tests passed.
+          :raises TestRunLimitError if the run exceeds its time, CPU or memory limits"""
 
         # Determine proper paths for java runtime so that we can find test classes
         src_dir = PathManager.get_project_src_dir_name(project_name)
         path_dir = os.sep.join([str(dir_to_grade), src_dir])
-        full_classpath = PathManager.get_full_classpath(java_cp=f'.{os.pathsep}{path_dir}{os.pathsep}{suite_dir}',
-                                                        junit_cp=None)
+        classpath_entries = ['.', path_dir, suite_dir]
 
-        # Run the tests using JUnit's command-line runner
-        results = subprocess.run(
-            ['java', '-cp', full_classpath, 'org.junit.runner.JUnitCore', suite_class],
-            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        # Run the tests, either in the shared test harness or with JUnit's command-line runner
+        results = self._run_tests(email, project_name, classpath_entries, suite_class)
 
         # Process the result of running the tests.
         return \
@@ -40,60 +88,263 @@ class UnitTestRunner:
         :param project_name: Project being graded
         :param dir_to_grade: Root of directory tree where project files live
         :param test_class_name: Name of the JUnit test suite, e.g., TestSuite, sans the .class extension
-        :returns Ratio of passed test/all tests as a floating point number. 1.0 means all tests passed."""
+        :returns Tuple (number of tests executed, ratio of passed tests/all tests as a floating point number,
+        list of TestCaseResult). A ratio of 1.0 means all tests passed.
+        :raises TestRunLimitError if the run exceeds its time, CPU or memory limits"""
 
         self._logger.info(f'Running unit tests: {email}{os.sep}{project_name}{os.sep}{test_class_name}')
 
         # Determine proper paths and classes
         src_dir = PathManager.get_project_src_dir_name(project_name)
         path_dir = os.sep.join([str(dir_to_grade), src_dir])
-        full_classpath = PathManager.get_full_classpath(java_cp=f'.{os.pathsep}{path_dir}',
-                                                        junit_cp=None)
+        classpath_entries = ['.', path_dir]
         test_suite_class = PathManager.get_student_test_suite(project_name)
 
-        # Run the tests using JUnit's command-line runner
-        results = subprocess.run(
-            ['java', '-cp', full_classpath, 'org.junit.runner.JUnitCore', test_suite_class],
-            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        # Run the tests, either in the shared test harness or with JUnit's command-line runner
+        results = self._run_tests(email, project_name, classpath_entries, test_suite_class)
 
         # Process the result of running the tests.
         return \
             self._process_test_results(test_suite_class, results)
 
-    def _process_test_results(self, test_suite_class, results):
-        """Parses the output of the JUnit tests to determine the ratio of passed tests to executed tests.
-        :param Byte-stream results captured from stdout and stderr from running JUnit tests
-        :returns Tuple (number of tests executed, ratio of tests-passed / tests-executed)"""
+    def _run_tests(self, email, project_name, classpath_entries, test_suite_class):
+        """Runs the given test suite in the shared test harness if it's enabled, or in a JVM of its own otherwise.
+        If the harness fails, the suite is rerun in a JVM of its own.
+        :param email: Project owner's email
+        :param project_name: Project being graded
+        :param classpath_entries: List of classpath entries for the project and the tests, excluding JUnit
+        :param test_suite_class: Fully qualified name of the test suite class
+        :returns Tuple (return code, summary dictionary, OutputCapture or None), as returned by _run_junit
+        :raises TestRunLimitError if the run exceeds its time, CPU or memory limits"""
+        if TestHarness.is_enabled():
+            try:
+                return self._run_in_harness(project_name, classpath_entries, test_suite_class)
+            except TestHarnessError as ex:
+                self._logger.warning(f'{ex}. Running {test_suite_class} in its own JVM.')
+
+        # JUnit goes first so that the JVM profile's class data sharing archive, which is created for the JUnit
+        # classpath, applies
+        java_cp = PathManager.get_java_classpath()
+        full_classpath = os.pathsep.join([PathManager.get_junit_classpath()] + ([java_cp] if java_cp else []) +
+                                         classpath_entries)
+        return self._run_junit(email, project_name, full_classpath, test_suite_class)
+
+    def _run_in_harness(self, project_name, classpath_entries, test_suite_class):
+        """Runs the given test suite in the calling thread's test harness. The harness enforces the wall-clock
+        timeout. CPU limits cannot be applied to a single run in a shared JVM; the memory limit caps the heap of
+        the harness as a whole.
+        :param project_name: Project being graded
+        :param classpath_entries: List of classpath entries for the project and the tests, excluding JUnit
+        :param test_suite_class: Fully qualified name of the test suite class
+        :returns Tuple (return code, summary dictionary, None), in the form returned by _run_junit
+        :raises TestRunLimitError if the run times out or exhausts the harness's memory
+        :raises TestHarnessError if the harness fails"""
+        timeout_secs, _, memory_mb = PathManager.get_test_run_limits(project_name)
+        java_classpath = PathManager.get_java_classpath()
+        if java_classpath:
+            classpath_entries = classpath_entries + java_classpath.split(os.pathsep)
+
+        result = TestHarness.get_instance().run(test_suite_class, classpath_entries, timeout_secs, memory_mb)
+
+        if result.status == 'TIMEOUT':
+            self._logger.warning(f'Test run timed out after {timeout_secs}s: {test_suite_class}')
+            raise TestRunTimeoutError(f'{test_suite_class} timed out after {timeout_secs}s')
+        if result.status == 'RESOURCE':
+            self._logger.warning(f'Test run exceeded its resource limits: {test_suite_class}')
+            raise TestRunResourceLimitError(f'{test_suite_class} exceeded its memory limit')
+
+        summary = {'tests_ok': None, 'tests_run': None, 'failures': None, 'out_of_memory': False,
+                   'tests': [TestCaseResult(name, status, duration_ms)
+                             for name, status, duration_ms in result.tests]}
+        if result.status == 'OK':
+            summary['tests_ok'] = result.tests_run
+            return (0, summary, None)
+        if result.status == 'FAILED':
+            summary['tests_run'] = result.tests_run
+            summary['failures'] = result.failures
+        else:
+            self._logger.debug(f'Test harness error: {result.message}')
+        return (1, summary, None)
+
+    def _run_junit(self, email, project_name, full_classpath, test_suite_class):
+        """Runs the given test suite with JUnit's command-line runner, enforcing the project's test run limits.
+        The run's stdin is closed so that tests waiting on console input fail instead of hanging. Output is
+        streamed through a bounded OutputCapture and JUnit's summary lines are parsed as they arrive, so that
+        a test that prints in a loop cannot flood Proctor's memory.
+        :param email: Project owner's email
+        :param project_name: Project being graded
+        :param full_classpath: Classpath that includes the project, the tests and JUnit
+        :param test_suite_class: Fully qualified name of the test suite class
+        :returns Tuple (return code, summary dictionary filled in by _scan_output_line, OutputCapture)
+        :raises TestRunTimeoutError if the run exceeds its wall-clock timeout
+        :raises TestRunResourceLimitError if the run is killed for exceeding its CPU time or memory limit"""
+        timeout_secs, cpu_secs, memory_mb = PathManager.get_test_run_limits(project_name)
+
+        # The JVM reserves far more address space than it uses, so an address-space rlimit makes it fail to
+        # start. Memory is therefore limited through the maximum heap size instead.
+        java_options = JvmProfile.get_java_options() + ([f'-Xmx{memory_mb}m'] if memory_mb else [])
+
+        # Prefer the bundled ProctorRunListener, which writes per-test results to a file, over parsing JUnit's
+        # console output
+        results_file_name = None
+        listener_cp = self._get_run_listener_classpath()
+        if listener_cp:
+            results_fd, results_file_name = tempfile.mkstemp(prefix='proctor-junit-', suffix='.results')
+            os.close(results_fd)
+            cmd = ['java'] + java_options + ['-cp', os.pathsep.join([full_classpath, listener_cp]),
+                                             UnitTestRunner._RUN_LISTENER_CLASS, results_file_name, test_suite_class]
+        else:
+            cmd = ['java'] + java_options + ['-cp', full_classpath, 'org.junit.runner.JUnitCore', test_suite_class]
+
+        summary = {'tests_ok': None, 'tests_run': None, 'failures': None, 'out_of_memory': False, 'tests': []}
+        try:
+            process = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                       stderr=subprocess.STDOUT)
+            capture = OutputCapture(process.stdout, on_line=lambda line: self._scan_output_line(summary, line),
+                                    spill_file_name=self._get_spill_file_name(email, project_name, test_suite_class))
+            capture.start()
+            if cpu_secs:
+                self._limit_cpu_time(process.pid, cpu_secs)
+            try:
+                process.wait(timeout=timeout_secs)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+                capture.join(UnitTestRunner._OUTPUT_DRAIN_SECS)
+                self._logger.warning(f'Test run timed out after {timeout_secs}s: {test_suite_class}')
+                raise TestRunTimeoutError(f'{test_suite_class} timed out after {timeout_secs}s')
+            # A process started by a test may inherit and hold the output pipe open after the JVM exits
+            capture.join(UnitTestRunner._OUTPUT_DRAIN_SECS)
+
+            if results_file_name:
+                self._read_results_file(results_file_name, summary)
+        finally:
+            if results_file_name:
+                os.remove(results_file_name)
+
+        if self._exceeded_resource_limit(process.returncode, summary):
+            self._logger.warning(f'Test run exceeded its resource limits: {test_suite_class}')
+            raise TestRunResourceLimitError(f'{test_suite_class} exceeded its CPU time or memory limit')
+        return (process.returncode, summary, capture)
+
+    def _get_run_listener_classpath(self):
+        """Returns the classpath entry of the bundled ProctorRunListener, compiling it if needed.
+        :returns Classpath entry, or None if the listener cannot be compiled, in which case callers fall back to
+        JUnit's console runner"""
+        try:
+            return JavaHelpers.get_helper_classpath(UnitTestRunner._RUN_LISTENER_CLASS,
+                                                    compile_classpath=PathManager.get_junit_classpath())
+        except (RuntimeError, OSError) as ex:
+            self._logger.debug(f'Using JUnit console output instead of ProctorRunListener: {ex}')
+            return None
+
+    def _read_results_file(self, results_file_name, summary):
+        """Reads the per-test and summary lines written by ProctorRunListener into the summary dictionary.
+        The file's counts take precedence over anything parsed from JUnit's console output.
+        :param results_file_name: Name of the file written by ProctorRunListener
+        :param summary: Summary dictionary updated in place"""
+        with open(results_file_name, encoding='utf-8', errors='replace') as results_file:
+            for line in results_file:
+                fields = line.rstrip('\n').split('\t')
+                if fields[0] == 'TEST' and len(fields) == 4:
+                    summary['tests'].append(TestCaseResult(JavaHelpers.unescape(fields[3]), fields[1],
+                                                           int(fields[2])))
+                elif fields[0] == 'SUMMARY' and len(fields) == 5:
+                    summary['tests_run'] = int(fields[1])
+                    summary['failures'] = int(fields[2])
+                    summary['tests_ok'] = summary['tests_run'] if summary['failures'] == 0 else None
+
+    def _get_spill_file_name(self, email, project_name, test_suite_class):
+        """Returns the name of the compressed file to which a run's full output is written, if output is kept.
+        :param email: Project owner's email
+        :param project_name: Project being graded
+        :param test_suite_class: Fully qualified name of the test suite class
+        :returns Name of the .log.gz file, or None if test output is not kept."""
+        if not self._keep_output:
+            return None
+        output_dir = Path(os.sep.join([ProctorConfig.get_proctor_working_dir(), project_name, 'test-output', email]))
+        output_dir.mkdir(parents=True, exist_ok=True)
+        return str(output_dir / f'{test_suite_class}.log.gz')
+
+    def _limit_cpu_time(self, pid, cpu_secs):
+        """Caps the CPU time of the given process. The kernel sends SIGXCPU at the limit and SIGKILL shortly after.
+        :param pid: ID of the process to limit
+        :param cpu_secs: Maximum CPU time, in seconds"""
+        if resource is None or not hasattr(resource, 'prlimit'):
+            self._logger.debug('CPU time limits are not supported on this platform')
+            return
+        try:
+            resource.prlimit(pid, resource.RLIMIT_CPU, (cpu_secs, cpu_secs + UnitTestRunner._CPU_LIMIT_GRACE_SECS))
+        except (OSError, ValueError) as ex:
+            # The process may have already exited
+            self._logger.debug(f'Cannot limit CPU time of process {pid}: {ex}')
+
+    def _exceeded_resource_limit(self, returncode, summary):
+        """Determines if a completed JUnit run was stopped by a resource limit rather than finishing normally.
+        :param returncode: Return code of the JUnit run
+        :param summary: Summary dictionary filled in by _scan_output_line
+        :returns True if the run was killed at its CPU limit or the JVM died with an OutOfMemoryError"""
+        killed_by_signals = {-getattr(signal, name) for name in ['SIGXCPU', 'SIGKILL'] if hasattr(signal, name)}
+        if returncode in killed_by_signals:
+            return True
+        # An OutOfMemoryError inside a test is reported by JUnit as a failure. Only when the JVM itself gives up
+        # is there no JUnit summary at all.
+        junit_finished = summary['tests_ok'] is not None or summary['tests_run'] is not None
+        return not junit_finished and summary['out_of_memory']
+
+    def _scan_output_line(self, summary, line):
+        """Parses one line of JUnit console output as it arrives, recording JUnit's summary line.
+        This parsing code is specific to the how JUnit (4.x) renders output to the console.
+        May need to update it if and when we upgrade JUnit versions.
+        :param summary: Summary dictionary updated in place
+        :param line: Line of output"""
+        m = re.match(UnitTestRunner._JUNIT_OK_PATTERN, line)
+        if m:
+            summary['tests_ok'] = int(m.group(1))
+            return
+        m = re.match(UnitTestRunner._JUNIT_FAILURES_PATTERN, line)
+        if m:
+            summary['tests_run'] = int(m.group(1))
+            summary['failures'] = int(m.group(2))
+            return
+        if 'java.lang.OutOfMemoryError' in line:
+            summary['out_of_memory'] = True
 
-        # Turn the byte stream into a string so that we can parse it easily
-        sresults = results.stdout.decode('utf-8')
+    def _process_test_results(self, test_suite_class, run_results):
+        """Determines the ratio of passed tests to executed tests from a JUnit run's parsed summary.
+        :param test_suite_class: Fully qualified name of the test suite class that was run
+        :param run_results: Tuple (return code, summary dictionary, OutputCapture or None) returned by _run_tests
+        :returns Tuple (number of tests executed, ratio of tests-passed / tests-executed, list of TestCaseResult).
+        The list of per-test results is empty if they are not available."""
+        returncode, summary, capture = run_results
 
         # Test stats
         num_tests_executed = 0
         test_ratio = 0.0
 
-        # This parsing code is specific to the how JUnit (4.x) renders output to the console.
-        # May need to update it if and when we upgrade JUnit versions.
         try:
-            if results.returncode == 0:
-                # all tests passed!
-                pattern = "OK \((\d+) tests\)"
-                m = re.search(pattern, sresults)
-                num_tests_executed = tests_passed = int(m.group(1))
+            if returncode == 0:
+                # all tests passed! Unless JUnit never printed its summary, e.g., because the code under test
+                # called System.exit(0)
+                if summary['tests_ok'] is None:
+                    raise ValueError('JUnit exited without a summary')
+                num_tests_executed = tests_passed = summary['tests_ok']
                 test_ratio = 1.0
             else:
                 # some failures
-                pattern = "Tests run: (\d+),  Failures: (\d+)"
-                m = re.search(pattern, sresults)
-                num_tests_executed = int(m.group(1))
-                tests_failed = int(m.group(2))
+                num_tests_executed = summary['tests_run']
+                tests_failed = summary['failures']
                 tests_passed = num_tests_executed - tests_failed
                 test_ratio = tests_passed / num_tests_executed
 
             self._logger.info(f'Test results: {tests_passed} / {num_tests_executed} = {test_ratio}')
         except Exception as ex:
             # Something went wrong...
+            num_tests_executed = 0
+            test_ratio = 0.0
             self._logger.warning('Error while running unit tests!')
             self._logger.warning(f"Check test suite class '{test_suite_class}' exists and is compatible with the project under test.")
+            if capture is not None:
+                self._logger.debug(f'Test output ({capture.get_num_lines()} lines):\n{capture.get_text()}')
 
-        return (num_tests_executed, test_ratio)
+        return (num_tests_executed, test_ratio, summary['tests'])